@@ -1,327 +1,373 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, g, request, jsonify, send_from_directory
 from flask_cors import CORS
-import sqlite3
 import json
+import multiprocessing
 import os
-from datetime import datetime, timedelta
-import uuid
+import sys
+import threading
+from datetime import datetime
+import time
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from db import init_app, get_db, get_pool, connection, open_connection
+from scoring import TYPOLOGIES, score_transactions
+from compliance import check_compliance
+from narratives import generate_sar_narrative
+from thresholds import threshold_cache, record_label, reconcile as reconcile_thresholds, start_reconciler
+from blobs import store_enriched
+from submissions import SUBMIT_BATCH_MAX, gate_error, load_cases, prepare_submission
+from features import load_features
+from case_views import dump_enriched, write_case_view, update_case_view, set_view_alert_status, case_view_version, render_case_view
+from unit_of_work import UnitOfWork, GroupCommitter, GROUP_COMMIT
+from changefeed import TOPICS, ChangeBus, Subscription, record_change, latest_change_id, read_changes, format_event
+from jobs import JOB_WORKERS, ACTIVE, JobFailed, WorkerPool, enqueue, finish_job, get_job, job_json, queue_depth, retry as retry_job
+from pagination import encode_cursor, decode_cursor, parse_limit, parse_fields, iter_pages, ndjson, csv_rows, next_link
+from enrichment import get_enricher
+from archive import archive_dir, case_archive, history_key, timestamp_us, write_archive
+from responses import init_app as init_responses, not_modified, tag
+from metrics import SERVER_TIMING, collector, render as render_metrics, request_seconds, server_timing, span, start_request, finish_request
+# Re-exported for test_fixes.py and demo_realtime_sar.py, which import them from app
+from scoring import calculate_risk_score  # noqa: F401
+from enrichment import get_mock_customer_data, get_mock_txn_history  # noqa: F401
 
 app = Flask(__name__, static_folder='static')
 CORS(app)
-
-# Typology enumeration
-TYPOLOGIES = {
-    'RAPID_MOVEMENT': 'Rapid deposit-trade-withdrawal sequence',
-    'STRUCTURING': 'Transaction structuring to evade reporting',
-    'NETWORK_LINK': 'Network-based coordination',
-    'VELOCITY_SPIKE': 'Unusual transaction velocity',
-    'MICRO_FRAGMENTATION': 'Micro-transaction fragmentation (NEW)',
-    'LAYERING': 'Minimal profit on high volume (layering)',
-    'UNKNOWN_PATTERN': 'Unusual transaction pattern'
-}
-
-def get_db():
-    conn = sqlite3.connect('signalsar.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+init_app(app)
 
 def get_adaptive_threshold(alert_type):
-    conn = get_db()
-    result = conn.execute('SELECT threshold_adjustment FROM adaptive_thresholds WHERE alert_type = ?', (alert_type,)).fetchone()
-    conn.close()
-    return result['threshold_adjustment'] if result else 0
+    return threshold_cache.get(get_db(), alert_type)
 
 def update_adaptive_thresholds():
-    conn = get_db()
-    
-    # Get feedback from last 30 days
-    alert_types = conn.execute('SELECT DISTINCT alert_type FROM alerts').fetchall()
-    
-    for row in alert_types:
-        alert_type = row['alert_type']
-        
-        # Get recent feedback for this alert type
-        feedback = conn.execute('''
-            SELECT af.label 
-            FROM analyst_feedback af
-            JOIN alerts a ON af.alert_id = a.id
-            WHERE a.alert_type = ?
-            ORDER BY af.created_at DESC
-            LIMIT 10
-        ''', (alert_type,)).fetchall()
-        
-        if len(feedback) >= 3:
-            fp_count = sum(1 for f in feedback if f['label'] == 'false_positive')
-            tp_count = sum(1 for f in feedback if f['label'] == 'true_positive')
-            
-            # Adjust threshold: more FPs = increase threshold (reduce alerts), more TPs = decrease threshold (catch more)
-            adjustment = 0
-            if fp_count > tp_count * 2:
-                adjustment = 5  # Increase threshold
-            elif tp_count > fp_count * 2:
-                adjustment = -5  # Decrease threshold
-            
-            conn.execute('''
-                INSERT INTO adaptive_thresholds (alert_type, threshold_adjustment, updated_at)
-                VALUES (?, ?, ?)
-                ON CONFLICT(alert_type) DO UPDATE SET
-                    threshold_adjustment = ?,
-                    updated_at = ?
-            ''', (alert_type, adjustment, datetime.now().isoformat(), adjustment, datetime.now().isoformat()))
-    
-    conn.commit()
-    conn.close()
+    # Full recompute; feedback updates thresholds incrementally via record_label
+    reconcile_thresholds(get_db())
+
+group_committer = GroupCommitter(lambda: open_connection(app.config['DATABASE'])) if GROUP_COMMIT else None
+change_bus = ChangeBus(lambda: open_connection(app.config['DATABASE']))
+# Threshold moves committed by any process (other server workers, worker.py) drop this process's cached value
+change_bus.listen('threshold', lambda change: threshold_cache.invalidate(json.loads(change.data).get('alert_type')))
+
+def commit_unit(work):
+    """Run `work(conn, uow)` as one transaction: domain writes plus the audit rows it stages.
+    Under group commit it runs on the committer thread, batched with other requests."""
+    if group_committer is not None:
+        result = group_committer.run(work)
+    else:
+        with UnitOfWork(get_db()) as uow:
+            result = work(uow.conn, uow)
+    change_bus.notify()
+    return result
+
+def set_alert_status(conn, alert_id, status, case_id=None):
+    """Change an alert's status in the table, in its case views and on the change feed."""
+    alert = conn.execute('UPDATE alerts SET status = ? WHERE id = ? RETURNING *', (status, alert_id)).fetchone()
+    set_view_alert_status(conn, alert_id, status)
+    record_change(conn, 'alert', {'op': 'status', 'alert': dict(alert), 'case_id': case_id}, alert_id=alert_id)
 
 def log_audit(case_id, analyst, action, details, before_value=None, after_value=None):
-    conn = get_db()
-    conn.execute('INSERT INTO audit_log (case_id, analyst, action, details, before_value, after_value, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?)',
-                 (case_id, analyst, action, json.dumps(details), before_value, after_value, datetime.now().isoformat()))
-    conn.commit()
-    conn.close()
+    # Standalone audit entry; mutations stage theirs on the unit of work instead
+    return commit_unit(lambda conn, uow: uow.audit(case_id, analyst, action, details, before_value, after_value))
 
 def link_reason_evidence(case_id, reason_code, metric, evidence_ids):
     conn = get_db()
     conn.execute('INSERT INTO reason_evidence (case_id, reason_code, metric, evidence_ids, created_at) VALUES (?, ?, ?, ?, ?)',
                  (case_id, reason_code, metric, json.dumps(evidence_ids), datetime.now().isoformat()))
     conn.commit()
-    conn.close()
-
-def calculate_risk_score(customer_id, txn_history):
-    # Rule score: rapid deposit->trade->withdrawal pattern
-    rule_score = 0
-    reasons = []
-    evidence_map = {}
-    typology = 'UNKNOWN_PATTERN'
-    is_new_typology = customer_id == 'CUST-4455'
-    
-    if is_new_typology:
-        # NEW TYPOLOGY: Moderate rule score but high anomaly+network
-        rule_score = 25
-        typology = 'MICRO_FRAGMENTATION'
-        reasons.append('Micro-transaction fragmentation pattern (NEW)')
-        evidence_map['MICRO_FRAGMENTATION'] = {
-            'metric': '47 micro-txns <$500 in 3 days vs. historical avg of 2/week',
-            'evidence_ids': [t['id'] for t in txn_history[:5]]
-        }
-        
-        # High behavior score - unusual pattern
-        behavior_score = 35
-        reasons.append('Anomalous: 47 micro-txns <$500 in 3 days vs. historical avg of 2/week')
-        
-        # High network score
-        network_score = 29
-        reasons.append('Network: 8 linked accounts sharing device fingerprint + timing correlation')
-        evidence_map['NETWORK_LINK'] = {
-            'metric': '8 linked accounts, <5min timing correlation',
-            'evidence_ids': ['DEV-A8F2', 'IP-10.5.5.1']
-        }
-        
-        final_score = min(100, rule_score + behavior_score + network_score)
-        return final_score, reasons, evidence_map, typology
-    
-    # Check for rapid movement pattern
-    rapid_movement_txns = []
-    if len(txn_history) >= 3:
-        for i in range(len(txn_history) - 2):
-            if (txn_history[i]['type'] == 'deposit' and 
-                txn_history[i+1]['type'] == 'trade' and 
-                txn_history[i+2]['type'] == 'withdrawal'):
-                rule_score += 35
-                typology = 'RAPID_MOVEMENT'
-                reasons.append('Rapid deposit-trade-withdrawal sequence')
-                rapid_movement_txns = [txn_history[i]['id'], txn_history[i+1]['id'], txn_history[i+2]['id']]
-                evidence_map['RAPID_MOVEMENT'] = {
-                    'metric': 'deposit→withdrawal median time = 14 min (baseline 2.1 hrs)',
-                    'evidence_ids': rapid_movement_txns
-                }
-                break
-    
-    # Tiny profit laundering
-    total_in = sum(t['amount'] for t in txn_history if t['type'] == 'deposit')
-    total_out = sum(t['amount'] for t in txn_history if t['type'] == 'withdrawal')
-    if total_in > 50000 and abs(total_out - total_in) < total_in * 0.05:
-        rule_score += 25
-        if typology == 'UNKNOWN_PATTERN':
-            typology = 'LAYERING'
-        reasons.append('Minimal profit on high volume (layering)')
-        evidence_map['LAYERING'] = {
-            'metric': f'${total_in:,.0f} in, ${total_out:,.0f} out (profit margin <5%)',
-            'evidence_ids': [t['id'] for t in txn_history if t['type'] in ['deposit', 'withdrawal']][:5]
-        }
+
+# Investigation pipeline
+def draft_case(alert, features=None):
+    """Enrich, score and draft a SAR for one alert row (a plain dict). Pure, so it can run in a worker process.
+    `features` are the customer's stored aggregates (features.load_features), when it has them."""
+    started = time.perf_counter()
     
-    # Behavior score: velocity spike
-    behavior_score = 0
-    recent_count = sum(1 for t in txn_history if (datetime.now() - datetime.fromisoformat(t['timestamp'])).days <= 7)
-    if recent_count > 15:
-        behavior_score = 30
-        if typology == 'UNKNOWN_PATTERN':
-            typology = 'VELOCITY_SPIKE'
-        reasons.append(f'Velocity spike: {recent_count} txns in 7 days')
-        evidence_map['VELOCITY_SPIKE'] = {
-            'metric': f'{recent_count} txns in 7 days (baseline: 2/week)',
-            'evidence_ids': [t['id'] for t in txn_history if (datetime.now() - datetime.fromisoformat(t['timestamp'])).days <= 7][:5]
-        }
+    # Data enrichment (KYC profile and transaction history fetched concurrently)
+    with span('enrichment'):
+        customer_data, txn_history = get_enricher(app.config['DATABASE']).enrich(alert['customer_id'])
     
-    # Network score: shared identifiers
-    network_score = 0
-    shared_ips = list(set([t.get('ip') for t in txn_history if t.get('ip')]))
-    shared_links = len(shared_ips) < 3 and len(txn_history) > 10
-    if shared_links:
-        network_score = 20
-        if typology == 'UNKNOWN_PATTERN':
-            typology = 'NETWORK_LINK'
-        reasons.append('Multiple accounts sharing IP/device')
-        evidence_map['NETWORK_LINK'] = {
-            'metric': f'{len(shared_ips)} unique IPs across {len(txn_history)} txns',
-            'evidence_ids': shared_ips + [txn_history[0]['id']]
-        }
+    # Risk scoring
+    with span('scoring'):
+        risk_score, reasons, evidence_map, typology, rule_us = score_transactions(alert['customer_id'], txn_history, features=features)
+    scored_typology = typology
     
-    # Ensure at least one reason is always present
-    if not reasons:
-        reasons.append('Unusual transaction pattern detected by monitoring system')
-        evidence_map['UNKNOWN_PATTERN'] = {
-            'metric': 'Pattern flagged by automated monitoring',
-            'evidence_ids': [t['id'] for t in txn_history[:3]]
-        }
+    # Map NEW TYPOLOGY to valid enum
+    if alert['alert_type'] == 'NEW TYPOLOGY':
+        typology = 'MICRO_FRAGMENTATION'
     
-    final_score = min(100, rule_score + behavior_score + network_score)
-    return final_score, reasons, evidence_map, typology
-
-def generate_sar_narrative(customer_data, txn_history, risk_analysis):
-    is_new_typology = customer_data['customer_id'] == 'CUST-4455'
-    evidence_map = risk_analysis.get('evidence_map', {})
+    # Use alert's pre-calculated risk score if dynamic calculation is low/zero
+    if risk_score == 0 or risk_score < 50:
+        risk_score = alert['risk_score']
+        if not reasons:
+            reasons = [f'{alert["alert_type"]} pattern detected by monitoring system']
+            typology = alert['alert_type'].upper().replace(' ', '_')
+            if typology not in TYPOLOGIES:
+                typology = 'UNKNOWN_PATTERN'
     
-    # Helper to format evidence references
-    def format_evidence(reason_code):
-        if reason_code in evidence_map:
-            ids = evidence_map[reason_code]['evidence_ids'][:3]
-            return f" [Evidence: {', '.join(str(id) for id in ids)}]"
-        return ""
+    risk_analysis = {
+        'score': risk_score,
+        'reasons': reasons,
+        'evidence_map': evidence_map,
+        'velocity_multiplier': 3.2
+    }
     
-    if is_new_typology:
-        narrative = f"""SUSPICIOUS ACTIVITY REPORT - NARRATIVE
-
-Subject: {customer_data['name']} (ID: {customer_data['customer_id']})
-Account: {customer_data['account_number']}
-Period: {txn_history[0]['timestamp'][:10]} to {txn_history[-1]['timestamp'][:10]}
-
-⚠️ NEW TYPOLOGY DETECTED - UNKNOWN PATTERN
-
-SUMMARY OF SUSPICIOUS ACTIVITY:
-The subject engaged in a previously unobserved transaction pattern that does not match existing rule-based detection scenarios. Machine learning anomaly detection flagged this activity as high-risk based on behavioral deviation and network correlation analysis.
-
-PATTERN DISCOVERY EXPLANATION:
-This case represents a NEW TYPOLOGY not previously documented in our transaction monitoring rules. While traditional structuring and rapid-movement patterns score moderately, the combination of micro-transaction fragmentation, timing anomalies, and network linkages suggests a novel evasion technique.
-
-DETAILED DESCRIPTION:
-Over a 3-day period, the subject conducted 47 micro-transactions averaging $487 each, totaling ${sum(t['amount'] for t in txn_history):,.2f}.{format_evidence('MICRO_FRAGMENTATION')} This represents a 23x increase in transaction frequency compared to the account's 90-day baseline of 2 transactions per week.
-
-Key anomalies identified:
-{chr(10).join('- ' + r + (format_evidence(k) if k in evidence_map else '') for r, k in zip(risk_analysis['reasons'], ['MICRO_FRAGMENTATION', 'NETWORK_LINK']))}
-
-BEHAVIORAL BASELINE COMPARISON:
-- Historical pattern: 2 transactions/week, avg $8,500 per transaction
-- Current pattern: 47 transactions in 3 days, avg $487 per transaction
-- Deviation score: 94th percentile across all monitored accounts
-
-NETWORK ANALYSIS:
-Cross-account correlation analysis identified 8 accounts sharing identical device fingerprints and exhibiting synchronized transaction timing within 5-minute windows.{format_evidence('NETWORK_LINK')} This suggests coordinated activity potentially designed to evade aggregate reporting thresholds.
-
-CUSTOMER DUE DILIGENCE:
-Customer onboarded on {customer_data['onboarded_date']}. Stated occupation: {customer_data['occupation']}. Expected account activity: Low-to-moderate retail trading. Current activity represents a fundamental departure from stated profile and historical behavior.
-
-CONCLUSION:
-This activity is being reported as suspicious due to the novel pattern structure, significant behavioral deviation, and network correlation indicators. The pattern does not match existing typologies and may represent an emerging money laundering technique requiring regulatory attention and potential rule enhancement.
-"""
-        return narrative
+    # Generate SAR draft (template follows the scored pattern, not the alert label)
+    with span('narrative'):
+        sar_draft = generate_sar_narrative(customer_data, txn_history, risk_analysis, scored_typology)
     
-    narrative = f"""SUSPICIOUS ACTIVITY REPORT - NARRATIVE
-
-Subject: {customer_data['name']} (ID: {customer_data['customer_id']})
-Account: {customer_data['account_number']}
-Period: {txn_history[0]['timestamp'][:10]} to {txn_history[-1]['timestamp'][:10]}
-
-SUMMARY OF SUSPICIOUS ACTIVITY:
-The subject engaged in a pattern of transactions consistent with potential money laundering activity. Automated monitoring systems flagged unusual transaction velocity and structuring patterns that deviate significantly from the account's historical baseline.
-
-DETAILED DESCRIPTION:
-Over a 90-day period, the subject conducted {len(txn_history)} transactions totaling ${sum(t['amount'] for t in txn_history):,.2f}. Analysis reveals:
-
-{chr(10).join('- ' + r + format_evidence(list(evidence_map.keys())[i] if i < len(evidence_map) else '') for i, r in enumerate(risk_analysis['reasons']))}
-
-The transaction pattern shows deposits followed immediately by trading activity and rapid withdrawals, with minimal economic rationale. The subject's account activity increased {risk_analysis['velocity_multiplier']}x compared to the prior 90-day period.
-
-CUSTOMER DUE DILIGENCE:
-Customer onboarded on {customer_data['onboarded_date']}. Stated occupation: {customer_data['occupation']}. Expected account activity: Low-to-moderate retail trading. Actual activity significantly exceeds stated profile.
-
-CONCLUSION:
-Based on the above factors, this activity is being reported as suspicious and potentially indicative of money laundering or structuring to evade reporting requirements.
-"""
-    return narrative
-
-def check_compliance(sar_draft, enriched_data, risk_analysis):
-    required_fields = {
-        'customer_id': enriched_data.get('customer_data', {}).get('customer_id'),
-        'account_number': enriched_data.get('customer_data', {}).get('account_number'),
-        'customer_name': enriched_data.get('customer_data', {}).get('name'),
-        'transaction_count': len(enriched_data.get('txn_history', [])),
-        'total_amount': sum(t['amount'] for t in enriched_data.get('txn_history', [])),
-        'time_period': f"{enriched_data.get('txn_history', [{}])[0].get('timestamp', '')[:10]} to {enriched_data.get('txn_history', [{}])[-1].get('timestamp', '')[:10]}" if enriched_data.get('txn_history') else None,
-        'suspicious_pattern_reasons': risk_analysis.get('reasons', []),
-        'narrative_text': sar_draft
+    enriched_data = {
+        'customer_data': customer_data,
+        'txn_history': txn_history,
+        'risk_analysis': risk_analysis
     }
     
-    missing_fields = [k for k, v in required_fields.items() if not v or (isinstance(v, list) and len(v) == 0)]
-    present_count = len(required_fields) - len(missing_fields)
-    compliance_score = int((present_count / len(required_fields)) * 100)
+    # Compliance check with required fields
+    with span('compliance'):
+        compliance_score, missing_fields, sar_required_fields = check_compliance(sar_draft, enriched_data, risk_analysis)
+    
+    return {
+        'alert_id': alert['id'],
+        'alert': alert,
+        'typology': typology,
+        'enriched_data': enriched_data,
+        'risk_analysis': risk_analysis,
+        'sar_draft': sar_draft,
+        'compliance_score': compliance_score,
+        'draft_ms': round((time.perf_counter() - started) * 1000, 3),
+        'rule_us': rule_us
+    }
+
+def save_cases(conn, uow, drafts, analyst='analyst@signalsar.com'):
+    """Write cases, reason evidence, audit rows, alert status and case views for drafts inside `uow`."""
+    now = datetime.now().isoformat()
+    case_ids = []
     
-    return compliance_score, missing_fields, required_fields
+    c = conn.cursor()
+    for draft in drafts:
+        # KYC snapshot and transactions go to the blob store; the case keeps their hashes
+        enriched_ref, spans = store_enriched(conn, draft['enriched_data'])
+        draft['enriched_ref'] = enriched_ref
+        inline = None
+        if enriched_ref is None:
+            inline, spans = dump_enriched(draft['enriched_data'])
+        c.execute('INSERT INTO cases (alert_id, enriched_data, enriched_ref, risk_analysis, sar_draft, compliance_score, status, typology, typology_confirmed, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                  (draft['alert_id'], inline, enriched_ref, json.dumps(draft['risk_analysis']), draft['sar_draft'], draft['compliance_score'], 'draft', draft['typology'], 0, now, now))
+        case_id = c.lastrowid
+        case_ids.append(case_id)
+        
+        # Link evidence to reasons
+        reason_evidence = []
+        for reason_code, evidence_data in draft['risk_analysis']['evidence_map'].items():
+            row = {'case_id': case_id, 'reason_code': reason_code, 'metric': evidence_data['metric'],
+                   'evidence_ids': json.dumps(evidence_data['evidence_ids']), 'created_at': now}
+            c.execute('INSERT INTO reason_evidence (case_id, reason_code, metric, evidence_ids, created_at) VALUES (?, ?, ?, ?, ?)', tuple(row.values()))
+            reason_evidence.append(dict(id=c.lastrowid, **row))
+        
+        audit = uow.audit(case_id, analyst, 'case_created', {'alert_id': draft['alert_id']}, timestamp=now)
+        
+        set_alert_status(conn, draft['alert_id'], 'investigating', case_id)
+        
+        case = {'id': case_id, 'alert_id': draft['alert_id'], 'sar_draft': draft['sar_draft'], 'compliance_score': draft['compliance_score'],
+                'status': 'draft', 'typology': draft['typology'], 'typology_confirmed': 0, 'created_at': now, 'updated_at': now}
+        write_case_view(conn, case, dict(draft['alert'], status='investigating'), draft['enriched_data'], spans, reason_evidence, [audit])
+    return case_ids
+
+def txn_archive_dir():
+    return archive_dir(app.config['DATABASE'])
+
+def archive_histories(drafts):
+    """Write the columnar archive of each saved draft's history. Call after the cases commit:
+    the files are derived data, so a failure only means they are built on first read."""
+    for draft in drafts:
+        if draft.get('enriched_ref') is None:
+            continue
+        try:
+            with span('archive'):
+                write_archive(txn_archive_dir(), history_key(draft['enriched_ref']), draft['enriched_data']['txn_history'])
+        except OSError:
+            app.logger.exception('Could not archive transactions of alert %s', draft['alert_id'])
+
+# Batch investigation: drafting fans out over a process pool, writes go out in chunked transactions
+BATCH_WORKERS = int(os.environ.get('SIGNALSAR_BATCH_WORKERS', os.cpu_count() or 1))
+BATCH_CHUNK_SIZE = int(os.environ.get('SIGNALSAR_BATCH_CHUNK_SIZE', 200))
+BATCH_INLINE_THRESHOLD = 8  # below this, process pool start-up costs more than it saves
+_batch_executor = None
+
+def _draft_case_safe(alert, features=None):
+    try:
+        return draft_case(alert, features)
+    except Exception as e:
+        return {'alert_id': alert['id'], 'error': f'{type(e).__name__}: {e}'}
+
+def get_batch_executor():
+    global _batch_executor
+    if _batch_executor is None:
+        # Forking a threaded worker can copy locks held by other threads; forkserver children start clean
+        _batch_executor = ProcessPoolExecutor(max_workers=BATCH_WORKERS, mp_context=multiprocessing.get_context('forkserver'))
+    return _batch_executor
+
+def select_alerts(conn, alert_ids=None, status=None, alert_type=None, limit=None):
+    query = 'SELECT id, customer_id, alert_type, risk_score FROM alerts WHERE 1 = 1'
+    params = []
+    if alert_ids is not None:
+        query += ' AND id IN (SELECT value FROM json_each(?))'
+        params.append(json.dumps([int(i) for i in alert_ids]))
+    if status:
+        query += ' AND status = ?'
+        params.append(status)
+    if alert_type:
+        query += ' AND alert_type = ?'
+        params.append(alert_type)
+    if alert_ids is None:
+        query += ' ORDER BY risk_score DESC, id'
+    if limit:
+        query += ' LIMIT ?'
+        params.append(int(limit))
+    alerts = [dict(a) for a in conn.execute(query, params)]
+    if alert_ids is not None:
+        # Keep the caller's order; sorting a short id list is cheaper in Python than in a temp B-tree
+        position = {int(i): n for n, i in enumerate(alert_ids)}
+        alerts.sort(key=lambda a: position[a['id']])
+    return alerts
+
+def investigate_batch(alert_ids=None, status=None, alert_type=None, limit=None,
+                      analyst='analyst@signalsar.com', parallel=True, chunk_size=BATCH_CHUNK_SIZE):
+    """Investigate many alerts at once. Call inside an app context (a request or `with app.app_context()`)."""
+    started = time.perf_counter()
+    conn = get_db()
+    alerts = select_alerts(conn, alert_ids, status, alert_type, limit)
+    results = {}
+    select_ms = (time.perf_counter() - started) * 1000
+    
+    stored = load_features(conn, {a['customer_id'] for a in alerts})
+    customer_features = [stored.get(a['customer_id']) for a in alerts]
+    
+    if parallel and len(alerts) >= BATCH_INLINE_THRESHOLD:
+        drafts = get_batch_executor().map(_draft_case_safe, alerts, customer_features, chunksize=16)
+    else:
+        drafts = map(_draft_case_safe, alerts, customer_features)
+    
+    write_ms = 0.0
+    chunk = []
+    
+    def flush():
+        nonlocal write_ms
+        write_started = time.perf_counter()
+        with UnitOfWork(conn) as uow, span('save'):
+            case_ids = save_cases(conn, uow, chunk, analyst)
+        change_bus.notify()
+        archive_histories(chunk)
+        elapsed = (time.perf_counter() - write_started) * 1000
+        write_ms += elapsed
+        for draft, case_id in zip(chunk, case_ids):
+            results[draft['alert_id']] = {
+                'alert_id': draft['alert_id'],
+                'case_id': case_id,
+                'compliance_score': draft['compliance_score'],
+                'typology': draft['typology'],
+                'timings': {'draft_ms': draft['draft_ms'], 'rule_us': draft['rule_us'], 'write_ms': round(elapsed / len(chunk), 3)}
+            }
+        chunk.clear()
+    
+    for draft in drafts:
+        if 'error' in draft:
+            results[draft['alert_id']] = draft
+            continue
+        chunk.append(draft)
+        if len(chunk) >= max(1, int(chunk_size)):
+            flush()
+    if chunk:
+        flush()
+    
+    for alert_id in alert_ids or []:
+        results.setdefault(int(alert_id), {'alert_id': int(alert_id), 'error': 'Alert not found'})
+    
+    investigated = sum(1 for r in results.values() if 'case_id' in r)
+    return {
+        'results': list(results.values()),
+        'investigated': investigated,
+        'failed': len(results) - investigated,
+        'timings': {
+            'select_ms': round(select_ms, 3),
+            'write_ms': round(write_ms, 3),
+            'total_ms': round((time.perf_counter() - started) * 1000, 3)
+        }
+    }
+
+# Investigation jobs: the investigate route only queues; workers draft and save
+JOB_WAIT_MAX = 30
 
-# Mock data generators
-def get_mock_customer_data(customer_id):
+def run_investigation_job(conn, job, progress):
+    alert = conn.execute('SELECT * FROM alerts WHERE id = ?', (int(job['subject']),)).fetchone()
+    if not alert:
+        raise JobFailed('Alert not found')
+    
+    # Enrichment errors and timeouts propagate and are retried with backoff
+    progress('drafting', 0.1)
+    draft = draft_case(dict(alert), load_features(conn, [alert['customer_id']]).get(alert['customer_id']))
+    
+    progress('saving', 0.9)
+    analyst = json.loads(job['payload']).get('analyst', 'analyst@signalsar.com')
+    with UnitOfWork(conn) as uow, span('save'):
+        case_id = save_cases(conn, uow, [draft], analyst)[0]
+        finish_job(conn, job, {'case_id': case_id, 'compliance_score': draft['compliance_score'],
+                               'typology': draft['typology'], 'draft_ms': draft['draft_ms'],
+                               'rule_us': draft['rule_us']})
+    change_bus.notify()
+    archive_histories([draft])
+
+job_pool = WorkerPool(lambda: open_connection(app.config['DATABASE']), {'investigate': run_investigation_job})
+
+def wake_job_workers():
+    # SIGNALSAR_JOB_WORKERS=0 leaves the queue to standalone workers (python worker.py)
+    if JOB_WORKERS:
+        job_pool.start()
+        job_pool.notify()
+
+def job_response(job):
+    body = job_json(job)
+    body['status_url'] = f'/api/jobs/{job["id"]}'
+    response = jsonify(body)
+    response.status_code = 202 if job['status'] in ACTIVE else 200
+    response.headers['Location'] = body['status_url']
+    return response
+
+# Request timing and metrics
+@app.before_request
+def start_timing():
+    g.timing = (time.perf_counter(), start_request())
+
+@app.after_request
+def finish_timing(response):
+    started, token = g.pop('timing', (None, None))
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    timing = finish_request(token)
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    request_seconds.observe(elapsed, request.method, route, str(response.status_code))
+    if SERVER_TIMING:
+        response.headers['Server-Timing'] = server_timing(timing, elapsed)
+    return response
+
+# After-request hooks run in reverse order: compression runs first and is timed with the request
+init_responses(app)
+
+@collector('signalsar_job_queue_depth', 'Investigation jobs waiting or running (all processes)', labels=('status',))
+def _job_depth():
+    with connection(app.config['DATABASE']) as conn:
+        depth = queue_depth(conn)
+    return {(status,): depth.get(status, 0) for status in ACTIVE}
+
+@collector('signalsar_queue_depth', 'In-process queues: group commit units, change feed subscribers, live job workers',
+           labels=('queue',))
+def _queue_depths():
     return {
-        'customer_id': customer_id,
-        'name': f'John Doe {customer_id[-4:]}',
-        'account_number': f'ACC-{customer_id[-4:]}-9821',
-        'email': f'customer{customer_id[-4:]}@example.com',
-        'phone': '+1-555-0100',
-        'address': '123 Main St, New York, NY 10001',
-        'occupation': 'Software Engineer',
-        'onboarded_date': '2024-03-15',
-        'risk_rating': 'Medium'
+        ('group_commit',): group_committer.pending if group_committer is not None else 0,
+        ('change_feed_subscribers',): change_bus.subscriber_count,
+        ('job_workers',): job_pool.live_workers,
     }
 
-def get_mock_txn_history(customer_id):
-    import random
-    txns = []
-    base_time = datetime.now()
-    
-    # NEW TYPOLOGY: micro-transaction pattern
-    if customer_id == 'CUST-4455':
-        for i in range(47):
-            txn_type = random.choice(['deposit', 'withdrawal'])
-            txns.append({
-                'id': f'TXN-{i+2000}',
-                'type': txn_type,
-                'amount': random.randint(350, 500),
-                'timestamp': (base_time - timedelta(days=random.randint(0, 3))).isoformat(),
-                'ip': random.choice(['10.5.5.1', '10.5.5.1', '10.5.5.2']),
-                'description': f'Micro {txn_type}'
-            })
-        return sorted(txns, key=lambda x: x['timestamp'])
-    
-    for i in range(25):
-        txn_type = random.choice(['deposit', 'trade', 'withdrawal', 'deposit', 'trade'])
-        txns.append({
-            'id': f'TXN-{i+1000}',
-            'type': txn_type,
-            'amount': random.randint(5000, 25000),
-            'timestamp': (base_time - timedelta(days=random.randint(0, 90))).isoformat(),
-            'ip': random.choice(['192.168.1.1', '192.168.1.2', '10.0.0.5']),
-            'description': f'{txn_type.title()} transaction'
-        })
-    
-    return sorted(txns, key=lambda x: x['timestamp'])
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    return Response(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 # API Routes
 @app.route('/')
@@ -332,168 +378,323 @@ def index():
 def static_files(path):
     return send_from_directory('static', path)
 
+ALERT_FIELDS = ('id', 'customer_id', 'alert_type', 'risk_score', 'status', 'created_at', 'assigned_to')
+ALERT_PAGE_SIZE = 100
+ALERT_PAGE_MAX = 1000
+ALERT_STREAM_PAGE = 1000
+
+def query_alerts(conn, status='open', alert_type=None, assigned_to=None, created_from=None, created_to=None,
+                 fields=ALERT_FIELDS, after=None, limit=ALERT_PAGE_SIZE):
+    """One page of the alert queue in (risk_score DESC, id) order. Returns (rows, next_key or None)."""
+    columns = list(fields) + [c for c in ('risk_score', 'id') if c not in fields]
+    query = f'SELECT {", ".join(columns)} FROM alerts WHERE status = ?'
+    params = [status]
+    if alert_type:
+        query += ' AND alert_type = ?'
+        params.append(alert_type)
+    if assigned_to:
+        query += ' AND assigned_to = ?'
+        params.append(assigned_to)
+    if created_from:
+        query += ' AND created_at >= ?'
+        params.append(created_from)
+    if created_to:
+        query += ' AND created_at < ?'
+        params.append(created_to)
+    if after:
+        # Range-seek on risk_score, then skip the tied rows already returned
+        query += ' AND risk_score <= ? AND (risk_score < ? OR id > ?)'
+        params += [after[0], after[0], after[1]]
+    query += ' ORDER BY risk_score DESC, id LIMIT ?'
+    params.append(limit + 1)
+
+    rows = conn.execute(query, params).fetchall()
+    next_key = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_key = (rows[-1]['risk_score'], rows[-1]['id'])
+    return [{f: row[f] for f in fields} for row in rows], next_key
+
 @app.route('/api/alerts', methods=['GET'])
 def get_alerts():
+    args = request.args
+    try:
+        fields = parse_fields(args.get('fields'), ALERT_FIELDS)
+        after = decode_cursor(args['cursor'], ((int, float), int)) if args.get('cursor') else None
+        limit = parse_limit(args.get('limit'), None, sys.maxsize)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    filters = {
+        'status': args.get('status', 'open'),
+        'alert_type': args.get('alert_type'),
+        'assigned_to': args.get('assigned_to'),
+        'created_from': args.get('created_from'),
+        'created_to': args.get('created_to'),
+        'fields': fields
+    }
+
+    if args.get('format') == 'ndjson':
+        # Stream the whole result from the cursor onward, one page in memory at a time
+        pool = get_pool()
+        page_size = min(limit or ALERT_STREAM_PAGE, ALERT_STREAM_PAGE)
+        def generate():
+            with pool.connection() as conn:
+                rows = iter_pages(lambda key, size: query_alerts(conn, after=key or after, limit=size, **filters), page_size)
+                yield from ndjson(islice(rows, limit))
+        return Response(generate(), mimetype='application/x-ndjson')
+
     conn = get_db()
-    status = request.args.get('status', 'open')
-    alerts = conn.execute('SELECT * FROM alerts WHERE status = ? ORDER BY risk_score DESC', (status,)).fetchall()
-    conn.close()
-    return jsonify([dict(a) for a in alerts])
+    change_id = latest_change_id(conn)
+    # Every alert write records a change, so the newest change id versions the queue
+    etag = f'alerts-c{change_id}'
+    cached = not_modified(etag, {'X-Change-Id': change_id})
+    if cached:
+        return cached
+    alerts, next_key = query_alerts(conn, after=after, limit=min(limit or ALERT_PAGE_SIZE, ALERT_PAGE_MAX), **filters)
+    response = tag(jsonify(alerts), etag)
+    response.headers['X-Change-Id'] = change_id
+    if next_key:
+        cursor = encode_cursor(*next_key)
+        response.headers['X-Next-Cursor'] = cursor
+        response.headers['Link'] = next_link(request.base_url, args, cursor)
+    return response
 
 @app.route('/api/alerts', methods=['POST'])
 def create_alert():
     data = request.json
     conn = get_db()
-    c = conn.cursor()
-    c.execute('INSERT INTO alerts (customer_id, alert_type, risk_score, status, created_at, assigned_to) VALUES (?, ?, ?, ?, ?, ?)',
-              (data['customer_id'], data['alert_type'], data.get('risk_score', 50), 'open', datetime.now().isoformat(), None))
+    alert = conn.execute('INSERT INTO alerts (customer_id, alert_type, risk_score, status, created_at, assigned_to) VALUES (?, ?, ?, ?, ?, ?) RETURNING *',
+                         (data['customer_id'], data['alert_type'], data.get('risk_score', 50), 'open', datetime.now().isoformat(), None)).fetchone()
+    alert_id = alert['id']
+    record_change(conn, 'alert', {'op': 'created', 'alert': dict(alert)}, alert_id=alert_id)
     conn.commit()
-    alert_id = c.lastrowid
-    conn.close()
+    change_bus.notify()
     return jsonify({'id': alert_id, 'status': 'created'}), 201
 
 @app.route('/api/alerts/<int:alert_id>/investigate', methods=['POST'])
 def investigate_alert(alert_id):
     conn = get_db()
-    alert = conn.execute('SELECT * FROM alerts WHERE id = ?', (alert_id,)).fetchone()
-    
-    if not alert:
+    if not conn.execute('SELECT 1 FROM alerts WHERE id = ?', (alert_id,)).fetchone():
         return jsonify({'error': 'Alert not found'}), 404
-    
-    # Data enrichment
-    customer_data = get_mock_customer_data(alert['customer_id'])
-    txn_history = get_mock_txn_history(alert['customer_id'])
-    
-    # Risk scoring
-    risk_score, reasons, evidence_map, typology = calculate_risk_score(alert['customer_id'], txn_history)
-    
-    # Map NEW TYPOLOGY to valid enum
-    if alert['alert_type'] == 'NEW TYPOLOGY':
-        typology = 'MICRO_FRAGMENTATION'
-    
-    # Use alert's pre-calculated risk score if dynamic calculation is low/zero
-    if risk_score == 0 or risk_score < 50:
-        risk_score = alert['risk_score']
-        if not reasons:
-            reasons = [f'{alert["alert_type"]} pattern detected by monitoring system']
-            typology = alert['alert_type'].upper().replace(' ', '_')
-            if typology not in TYPOLOGIES:
-                typology = 'UNKNOWN_PATTERN'
-    
-    risk_analysis = {
-        'score': risk_score,
-        'reasons': reasons,
-        'evidence_map': evidence_map,
-        'velocity_multiplier': 3.2
-    }
-    
-    # Generate SAR draft
-    sar_draft = generate_sar_narrative(customer_data, txn_history, risk_analysis)
-    
-    enriched_data = {
-        'customer_data': customer_data,
-        'txn_history': txn_history,
-        'risk_analysis': risk_analysis
-    }
-    
-    # Compliance check with required fields
-    compliance_score, missing_fields, sar_required_fields = check_compliance(sar_draft, enriched_data, risk_analysis)
-    
-    # Create case
-    c = conn.cursor()
-    c.execute('INSERT INTO cases (alert_id, enriched_data, risk_analysis, sar_draft, compliance_score, status, typology, typology_confirmed, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
-              (alert_id, json.dumps(enriched_data), json.dumps(risk_analysis), sar_draft, compliance_score, 'draft', typology, 0, datetime.now().isoformat(), datetime.now().isoformat()))
-    case_id = c.lastrowid
-    
-    # Link evidence to reasons (using same connection)
-    for reason_code, evidence_data in evidence_map.items():
-        conn.execute('INSERT INTO reason_evidence (case_id, reason_code, metric, evidence_ids, created_at) VALUES (?, ?, ?, ?, ?)',
-                     (case_id, reason_code, evidence_data['metric'], json.dumps(evidence_data['evidence_ids']), datetime.now().isoformat()))
-    
-    conn.execute('UPDATE alerts SET status = ? WHERE id = ?', ('investigating', alert_id))
-    conn.commit()
-    
-    log_audit(case_id, 'analyst@signalsar.com', 'case_created', {'alert_id': alert_id})
-    
-    conn.close()
-    return jsonify({'case_id': case_id, 'compliance_score': compliance_score})
+    try:
+        wait = min(float(request.args.get('wait', 0)), JOB_WAIT_MAX)
+    except ValueError:
+        return jsonify({'error': 'wait must be a number of seconds'}), 400
+    
+    data = request.get_json(silent=True) or {}
+    job, created = enqueue(conn, 'investigate', alert_id, {'analyst': data.get('analyst', 'analyst@signalsar.com')},
+                           idempotency_key=request.headers.get('Idempotency-Key'))
+    if created:
+        wake_job_workers()
+    if wait > 0:
+        with span('job-wait'):
+            job = job_pool.wait(conn, job['id'], wait)
+    return job_response(job)
+
+@app.route('/api/alerts/investigate:batch', methods=['POST'])
+def investigate_alerts_batch():
+    data = request.get_json(silent=True) or {}
+    alert_ids = data.get('alert_ids')
+    if alert_ids is not None and not isinstance(alert_ids, list):
+        return jsonify({'error': 'alert_ids must be a list'}), 400
+    
+    result = investigate_batch(
+        alert_ids=alert_ids,
+        status=data.get('status', 'open' if alert_ids is None else None),
+        alert_type=data.get('alert_type'),
+        limit=data.get('limit'),
+        analyst=data.get('analyst', 'analyst@signalsar.com'),
+        parallel=bool(data.get('parallel', True)),
+        chunk_size=data.get('chunk_size', BATCH_CHUNK_SIZE)
+    )
+    return jsonify(result)
+
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+def get_job_status(job_id):
+    job = get_job(get_db(), job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return job_response(job)
+
+@app.route('/api/jobs/<int:job_id>/retry', methods=['POST'])
+def retry_job_route(job_id):
+    conn = get_db()
+    if not get_job(conn, job_id):
+        return jsonify({'error': 'Job not found'}), 404
+    job = retry_job(conn, job_id)
+    if job['status'] == 'queued':
+        wake_job_workers()
+    return job_response(job)
+
+FEED_HEARTBEAT = 15
+# Each open stream holds a request thread; past this many per process, streams are refused so
+# pages fall back to polling and threads stay free for API calls (0: no limit)
+FEED_MAX_STREAMS = int(os.environ.get('SIGNALSAR_FEED_MAX_STREAMS', 0))
+FEED_RETRY_AFTER = 15
+feed_slots = threading.BoundedSemaphore(FEED_MAX_STREAMS) if FEED_MAX_STREAMS else None
+
+@app.route('/api/changes', methods=['GET'])
+def change_stream():
+    """Server-Sent Events: deltas after the `Last-Event-ID` header (or `after`), then live ones."""
+    args = request.args
+    topics = [t.strip() for t in args.get('topics', ','.join(TOPICS)).split(',') if t.strip()]
+    unknown = [t for t in topics if t not in TOPICS]
+    if unknown:
+        return jsonify({'error': f'Unknown topics: {", ".join(unknown)}'}), 400
+    try:
+        after = request.headers.get('Last-Event-ID') or args.get('after')
+        after = int(after) if after is not None else None
+        subscription = Subscription(topics, args.get('alert_id', type=int), args.get('case_id', type=int))
+    except ValueError:
+        return jsonify({'error': 'Invalid resume token'}), 400
+    
+    if feed_slots and not feed_slots.acquire(blocking=False):
+        return jsonify({'error': 'Too many open change feed streams; poll instead'}), 503, {'Retry-After': str(FEED_RETRY_AFTER)}
+    try:
+        conn = get_db()
+        if after is None:
+            after = latest_change_id(conn)
+        missed, upto = change_bus.subscribe(subscription, after)
+        if missed is None:
+            missed = read_changes(conn, after, upto)
+    except Exception:
+        change_bus.unsubscribe(subscription)
+        if feed_slots:
+            feed_slots.release()
+        raise
+    
+    def generate():
+        last = after
+        yield 'retry: 2000\n\n'
+        if missed is None:
+            # The resume point was pruned: the client must re-read full state
+            last = upto
+            yield f'id: {upto}\nevent: reset\ndata: {{}}\n\n'
+        for change in missed or ():
+            if subscription.accepts(change):
+                yield format_event(change)
+            last = change.id
+        while not subscription.overflowed:
+            change = subscription.get(FEED_HEARTBEAT)
+            if change is None:
+                yield ': keepalive\n\n'
+            elif change.id > last:
+                last = change.id
+                yield format_event(change)
+        # Too far behind: end the stream; the browser reconnects from its last event id
+    
+    response = Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(lambda: close_stream(subscription))
+    return response
+
+def close_stream(subscription):
+    change_bus.unsubscribe(subscription)
+    if feed_slots:
+        feed_slots.release()
 
 @app.route('/api/cases/<int:case_id>', methods=['GET'])
 def get_case(case_id):
     conn = get_db()
-    case = conn.execute('SELECT * FROM cases WHERE id = ?', (case_id,)).fetchone()
+    change_id = latest_change_id(conn)
+    version = case_view_version(conn, case_id)
     
-    if not case:
+    if not version:
         return jsonify({'error': 'Case not found'}), 404
     
-    alert = conn.execute('SELECT * FROM alerts WHERE id = ?', (case['alert_id'],)).fetchone()
-    audit_logs = conn.execute('SELECT * FROM audit_log WHERE case_id = ? ORDER BY timestamp DESC', (case_id,)).fetchall()
-    interventions = conn.execute('SELECT * FROM interventions WHERE case_id = ? ORDER BY timestamp DESC', (case_id,)).fetchall()
-    reason_evidence = conn.execute('SELECT * FROM reason_evidence WHERE case_id = ?', (case_id,)).fetchall()
-    
     # Get adaptive threshold for this alert type
-    threshold_adj = get_adaptive_threshold(alert['alert_type'])
-    
-    enriched_data = json.loads(case['enriched_data'])
-    risk_analysis = json.loads(case['risk_analysis'])
-    
-    # Recalculate compliance with detailed info
-    compliance_score, missing_fields, sar_required_fields = check_compliance(case['sar_draft'], enriched_data, risk_analysis)
-    
-    # Check governance gate
-    governance_checks = {
-        'typology_confirmed': bool(case['typology_confirmed']),
-        'evidence_linked': len(reason_evidence) > 0,
-        'analyst_disposition': conn.execute('SELECT COUNT(*) FROM analyst_feedback WHERE case_id = ?', (case_id,)).fetchone()[0] > 0,
-        'no_pending_interventions': conn.execute('SELECT COUNT(*) FROM interventions WHERE case_id = ? AND action = "hold_withdrawal"', (case_id,)).fetchone()[0] == 0 or case['status'] == 'intervened'
-    }
-    governance_checks['can_submit'] = all(governance_checks.values()) and compliance_score == 100
-    
-    # Add evidence pack
-    evidence_pack = {
-        'transaction_timeline': enriched_data['txn_history'],
-        'trading_summary': {
-            'total_transactions': len(enriched_data['txn_history']),
-            'total_volume': sum(t['amount'] for t in enriched_data['txn_history']),
-            'deposit_count': sum(1 for t in enriched_data['txn_history'] if t['type'] == 'deposit'),
-            'withdrawal_count': sum(1 for t in enriched_data['txn_history'] if t['type'] == 'withdrawal'),
-        },
-        'network_links': {
-            'shared_ips': list(set(t.get('ip') for t in enriched_data['txn_history'] if t.get('ip'))),
-            'device_fingerprints': ['DEV-A8F2', 'DEV-A8F2', 'DEV-B1C3'],
-            'linked_accounts': ['CUST-8821', 'CUST-5512'] if alert['customer_id'] == 'CUST-4455' else []
-        },
-        'kyc_snapshot': enriched_data['customer_data'],
-        'device_logs': [
-            {'timestamp': enriched_data['txn_history'][0]['timestamp'], 'device': 'iPhone 14', 'ip': enriched_data['txn_history'][0]['ip'], 'location': 'New York, NY'},
-            {'timestamp': enriched_data['txn_history'][-1]['timestamp'], 'device': 'iPhone 14', 'ip': enriched_data['txn_history'][-1]['ip'], 'location': 'New York, NY'}
-        ]
-    }
-    
-    conn.close()
-    
-    return jsonify({
-        'case': dict(case),
-        'alert': dict(alert),
-        'enriched_data': enriched_data,
-        'risk_analysis': risk_analysis,
-        'audit_logs': [dict(log) for log in audit_logs],
-        'interventions': [dict(i) for i in interventions],
-        'reason_evidence': [dict(re) for re in reason_evidence],
-        'evidence_pack': evidence_pack,
-        'adaptive_threshold': threshold_adj,
-        'compliance_score': compliance_score,
-        'missing_fields': missing_fields,
-        'sar_required_fields': sar_required_fields,
-        'governance_checks': governance_checks,
-        'typologies': TYPOLOGIES
-    })
+    version, alert_type = version
+    threshold_adj = get_adaptive_threshold(alert_type)
+    
+    etag = f'case-{case_id}-v{version}-t{threshold_adj}'
+    cached = not_modified(etag, {'X-Change-Id': change_id})
+    if cached:
+        return cached
+    
+    timeline = transaction_timeline(case_id, case_archive(conn, case_id, txn_archive_dir()))
+    body = render_case_view(conn, case_id, {'adaptive_threshold': threshold_adj, 'typologies': TYPOLOGIES}, timeline)
+    response = tag(Response(body, mimetype='application/json'), etag)
+    response.headers['X-Change-Id'] = change_id
+    return response
+
+TIMELINE_PREVIEW = 10   # transactions inlined in the case body
+TXN_PAGE_SIZE = 100
+TXN_PAGE_MAX = 1000
+
+def transaction_timeline(case_id, archive):
+    """JSON text of the case body's timeline: the history summary, its first transactions
+    and the cursor of the next page of /api/cases/<id>/transactions."""
+    rows, next_start = archive.page(0, TIMELINE_PREVIEW)
+    head = {'total': len(archive), 'summary': archive.summary(),
+            'next_cursor': encode_cursor(next_start) if next_start is not None else None,
+            'url': f'/api/cases/{case_id}/transactions'}
+    return ''.join((json.dumps(head)[:-1], ', "transactions": [', archive.select_json(rows), ']}'))
+
+def parse_txn_filters(args):
+    """TxnArchive.match filters from the query args, except evidence_only (needs the case)."""
+    filters = {}
+    if args.get('type'):
+        filters['types'] = {t.strip() for t in args['type'].split(',') if t.strip()}
+    for name in ('min_amount', 'max_amount'):
+        if args.get(name):
+            try:
+                filters[name] = float(args[name])
+            except ValueError:
+                raise ValueError(f'{name} must be a number')
+    for name in ('since', 'until'):
+        if args.get(name):
+            try:
+                filters[name] = timestamp_us(args[name])
+            except ValueError:
+                raise ValueError(f'{name} must be an ISO timestamp')
+    return filters
+
+def case_evidence_ids(conn, case_id):
+    """Every transaction id linked as evidence for one of the case's reasons."""
+    ids = set()
+    for row in conn.execute('SELECT evidence_ids FROM reason_evidence WHERE case_id = ?', (case_id,)):
+        ids.update(json.loads(row['evidence_ids'] or '[]'))
+    return ids
+
+@app.route('/api/cases/<int:case_id>/transactions', methods=['GET'])
+def get_case_transactions(case_id):
+    """A page of the case's transaction history, filtered, read from the columnar archive."""
+    conn = get_db()
+    try:
+        limit = parse_limit(request.args.get('limit'), TXN_PAGE_SIZE, TXN_PAGE_MAX)
+        filters = parse_txn_filters(request.args)
+        start = decode_cursor(request.args['cursor'], (int,))[0] if request.args.get('cursor') else 0
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if start < 0:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    version = case_view_version(conn, case_id)
+    if not version:
+        return jsonify({'error': 'Case not found'}), 404
+    # The history never changes; the view version covers the case's evidence links
+    etag = f'case-{case_id}-v{version[0]}-txns'
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    if request.args.get('evidence_only') in ('1', 'true'):
+        filters['ids'] = case_evidence_ids(conn, case_id)
+    
+    archive = case_archive(conn, case_id, txn_archive_dir())
+    mask = archive.match(**filters)
+    rows, next_start = archive.page(start, limit, mask)
+    cursor = encode_cursor(next_start) if next_start is not None else None
+    head = {'case_id': case_id, 'total': len(archive), 'matched': len(archive) if mask is None else int(mask.sum()),
+            'limit': limit, 'next_cursor': cursor}
+    response = tag(Response(''.join((json.dumps(head)[:-1], ', "transactions": [', archive.select_json(rows), ']}')),
+                            mimetype='application/json'), etag)
+    if cursor:
+        response.headers['X-Next-Cursor'] = cursor
+        response.headers['Link'] = next_link(request.base_url, request.args, cursor)
+    return response
 
 @app.route('/api/alerts/<int:alert_id>/case', methods=['GET'])
 def get_case_by_alert(alert_id):
     conn = get_db()
     case = conn.execute('SELECT id FROM cases WHERE alert_id = ? ORDER BY created_at DESC LIMIT 1', (alert_id,)).fetchone()
-    conn.close()
     
     if not case:
         return jsonify({'error': 'No case found for this alert. Click Investigate first.'}), 404
@@ -503,20 +704,24 @@ def get_case_by_alert(alert_id):
 @app.route('/api/cases/<int:case_id>/typology', methods=['POST'])
 def confirm_typology(case_id):
     data = request.json
-    conn = get_db()
-    
-    old_typology = conn.execute('SELECT typology, typology_confirmed FROM cases WHERE id = ?', (case_id,)).fetchone()
     
-    conn.execute('UPDATE cases SET typology = ?, typology_confirmed = ?, updated_at = ? WHERE id = ?',
-                 (data['typology'], 1, datetime.now().isoformat(), case_id))
-    conn.commit()
+    def write(conn, uow):
+        old_typology = conn.execute('SELECT typology, typology_confirmed FROM cases WHERE id = ?', (case_id,)).fetchone()
+        
+        updated_at = datetime.now().isoformat()
+        conn.execute('UPDATE cases SET typology = ?, typology_confirmed = ?, updated_at = ? WHERE id = ?',
+                     (data['typology'], 1, updated_at, case_id))
+        
+        audit = uow.audit(case_id, data.get('analyst', 'analyst@signalsar.com'), 'typology_confirmed', 
+                          {'typology': data['typology']}, 
+                          old_typology['typology'] if old_typology else None, 
+                          data['typology'])
+        
+        update_case_view(conn, case_id, case_fields={'typology': data['typology'], 'typology_confirmed': 1, 'updated_at': updated_at},
+                         audit=audit, typology_confirmed=True)
     
-    log_audit(case_id, data.get('analyst', 'analyst@signalsar.com'), 'typology_confirmed', 
-              {'typology': data['typology']}, 
-              old_typology['typology'] if old_typology else None, 
-              data['typology'])
+    commit_unit(write)
     
-    conn.close()
     return jsonify({'status': 'typology_confirmed', 'typology': data['typology']})
 
 @app.route('/api/cases/<int:case_id>/feedback', methods=['POST'])
@@ -529,21 +734,26 @@ def submit_feedback(case_id):
     
     conn = get_db()
     
-    case = conn.execute('SELECT alert_id FROM cases WHERE id = ?', (case_id,)).fetchone()
+    case = conn.execute('SELECT c.alert_id, a.alert_type FROM cases c LEFT JOIN alerts a ON a.id = c.alert_id WHERE c.id = ?', (case_id,)).fetchone()
     if not case:
         return jsonify({'error': 'Case not found'}), 404
     
-    conn.execute('INSERT INTO analyst_feedback (case_id, alert_id, analyst, label, rationale, rationale_detail, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
-                 (case_id, case['alert_id'], data.get('analyst', 'analyst@signalsar.com'), data['label'], data['rationale'], data.get('rationale_detail', ''), datetime.now().isoformat()))
-    conn.commit()
-    
-    log_audit(case_id, data.get('analyst', 'analyst@signalsar.com'), 'feedback_submitted', 
-              {'label': data['label'], 'rationale': data['rationale'], 'detail': data.get('rationale_detail', '')})
+    def write(conn, uow):
+        conn.execute('INSERT INTO analyst_feedback (case_id, alert_id, analyst, label, rationale, rationale_detail, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                     (case_id, case['alert_id'], data.get('analyst', 'analyst@signalsar.com'), data['label'], data['rationale'], data.get('rationale_detail', ''), datetime.now().isoformat()))
+        
+        # Update adaptive thresholds (O(1): fold this label into the alert type's ring buffer)
+        if case['alert_type'] is not None:
+            record_label(conn, case['alert_type'], data['label'])
+        
+        audit = uow.audit(case_id, data.get('analyst', 'analyst@signalsar.com'), 'feedback_submitted', 
+                          {'label': data['label'], 'rationale': data['rationale'], 'detail': data.get('rationale_detail', '')})
+        
+        update_case_view(conn, case_id, audit=audit, add_disposition=True)
     
-    # Update adaptive thresholds
-    update_adaptive_thresholds()
+    commit_unit(write)
+    threshold_cache.invalidate(case['alert_type'])
     
-    conn.close()
     return jsonify({'status': 'feedback_recorded'})
 
 @app.route('/api/cases/<int:case_id>/intervene', methods=['POST'])
@@ -560,21 +770,25 @@ def intervene(case_id):
     if not case:
         return jsonify({'error': 'Case not found'}), 404
     
-    conn.execute('INSERT INTO interventions (case_id, alert_id, action, reason, rationale, analyst, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?)',
-                 (case_id, case['alert_id'], data['action'], data.get('reason', 'High risk activity detected'), 
-                  data['rationale'], data.get('analyst', 'analyst@signalsar.com'), datetime.now().isoformat()))
-    
-    conn.execute('UPDATE cases SET status = ?, updated_at = ? WHERE id = ?',
-                 ('intervened', datetime.now().isoformat(), case_id))
-    
-    conn.execute('UPDATE alerts SET status = ? WHERE id = ?', ('intervened', case['alert_id']))
-    
-    conn.commit()
+    def write(conn, uow):
+        intervention = {'case_id': case_id, 'alert_id': case['alert_id'], 'action': data['action'], 'reason': data.get('reason', 'High risk activity detected'),
+                        'rationale': data['rationale'], 'analyst': data.get('analyst', 'analyst@signalsar.com'), 'timestamp': datetime.now().isoformat()}
+        c = conn.execute('INSERT INTO interventions (case_id, alert_id, action, reason, rationale, analyst, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                         tuple(intervention.values()))
+        intervention = dict(id=c.lastrowid, **intervention)
+        
+        conn.execute('UPDATE cases SET status = ?, updated_at = ? WHERE id = ?',
+                     ('intervened', intervention['timestamp'], case_id))
+        
+        audit = uow.audit(case_id, data.get('analyst', 'analyst@signalsar.com'), 'intervention_executed', 
+                          {'action': data['action'], 'reason': data.get('reason', 'High risk activity detected'), 'rationale': data['rationale']})
+        
+        update_case_view(conn, case_id, case_fields={'status': 'intervened', 'updated_at': intervention['timestamp']},
+                         audit=audit, intervention=intervention)
+        set_alert_status(conn, case['alert_id'], 'intervened', case_id)
     
-    log_audit(case_id, data.get('analyst', 'analyst@signalsar.com'), 'intervention_executed', 
-              {'action': data['action'], 'reason': data.get('reason', 'High risk activity detected'), 'rationale': data['rationale']})
+    commit_unit(write)
     
-    conn.close()
     return jsonify({'status': 'intervention_executed', 'action': data['action']})
 
 
@@ -582,94 +796,212 @@ def intervene(case_id):
 @app.route('/api/cases/<int:case_id>/sar', methods=['PUT'])
 def update_sar(case_id):
     data = request.json
-    conn = get_db()
     
-    conn.execute('UPDATE cases SET sar_draft = ?, updated_at = ? WHERE id = ?',
-                 (data['sar_draft'], datetime.now().isoformat(), case_id))
-    conn.commit()
+    def write(conn, uow):
+        updated_at = datetime.now().isoformat()
+        conn.execute('UPDATE cases SET sar_draft = ?, updated_at = ? WHERE id = ?',
+                     (data['sar_draft'], updated_at, case_id))
+        
+        audit = uow.audit(case_id, data.get('analyst', 'analyst@signalsar.com'), 'sar_edited', {'changes': 'Manual edit'})
+        
+        update_case_view(conn, case_id, case_fields={'updated_at': updated_at}, audit=audit, sar_draft=data['sar_draft'])
     
-    log_audit(case_id, data.get('analyst', 'analyst@signalsar.com'), 'sar_edited', {'changes': 'Manual edit'})
+    commit_unit(write)
     
-    conn.close()
     return jsonify({'status': 'updated'})
 
 @app.route('/api/cases/<int:case_id>/submit', methods=['POST'])
 def submit_sar(case_id):
-    data = request.json
+    data = request.get_json(silent=True) or {}
     conn = get_db()
     
-    case = conn.execute('SELECT * FROM cases WHERE id = ?', (case_id,)).fetchone()
+    case = load_cases(conn, [case_id]).get(case_id)
     if not case:
         return jsonify({'error': 'Case not found'}), 404
     
-    # Governance gate validation
-    reason_evidence = conn.execute('SELECT * FROM reason_evidence WHERE case_id = ?', (case_id,)).fetchall()
-    analyst_disposition = conn.execute('SELECT COUNT(*) FROM analyst_feedback WHERE case_id = ?', (case_id,)).fetchone()[0]
-    
-    if not case['typology_confirmed']:
-        return jsonify({'error': 'Typology must be confirmed before submission'}), 400
-    if len(reason_evidence) == 0:
-        return jsonify({'error': 'At least one explainability reason with evidence must be attached'}), 400
-    
-    # Enforce: at least one reason_evidence row has non-empty evidence_ids
-    has_valid_evidence = False
-    for re in reason_evidence:
-        evidence_ids = json.loads(re['evidence_ids'])
-        if evidence_ids and len(evidence_ids) > 0:
-            has_valid_evidence = True
-            break
-    
-    if not has_valid_evidence:
-        return jsonify({'error': 'At least one reason must have non-empty evidence_ids'}), 400
-    
-    if analyst_disposition == 0:
-        return jsonify({'error': 'Analyst disposition must be recorded before submission'}), 400
-    
-    # Enforce: narrative includes typology code or description
-    typology = case['typology']
-    typology_desc = TYPOLOGIES.get(typology, '')
-    if typology not in case['sar_draft'] and typology_desc not in case['sar_draft']:
-        return jsonify({'error': f'SAR narrative must include typology code ({typology}) or description'}), 400
-    
-    submission_id = f'SAR-{uuid.uuid4().hex[:8].upper()}'
-    submission_payload = {
-        'submission_id': submission_id,
-        'case_id': case_id,
-        'typology': case['typology'],
-        'sar_narrative': case['sar_draft'],
-        'enriched_data': json.loads(case['enriched_data']),
-        'compliance_score': case['compliance_score'],
-        'analyst': data.get('analyst', 'analyst@signalsar.com')
-    }
-    
-    # Calculate checksum for audit trail
-    import hashlib
-    checksum = hashlib.sha256(json.dumps(submission_payload, sort_keys=True).encode()).hexdigest()
-    
-    conn.execute('INSERT INTO submissions (case_id, sar_payload, submitted_at, submission_id, checksum) VALUES (?, ?, ?, ?, ?)',
-                 (case_id, json.dumps(submission_payload), datetime.now().isoformat(), submission_id, checksum))
-    
-    conn.execute('UPDATE cases SET status = ?, updated_at = ? WHERE id = ?',
-                 ('submitted', datetime.now().isoformat(), case_id))
-    
-    conn.execute('UPDATE alerts SET status = ? WHERE id = ?', ('closed', case['alert_id']))
+    # Governance gate, from the flags the case view maintains
+    error = gate_error(case)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    analyst = data.get('analyst', 'analyst@signalsar.com')
+    submission = prepare_submission(conn, case, analyst)
+    commit_unit(lambda conn, uow: record_submissions(conn, uow, [submission], analyst))
+    
+    return jsonify({'submission_id': submission['submission_id'], 'status': 'submitted', 'checksum': submission['checksum']})
+
+def record_submissions(conn, uow, submissions, analyst):
+    """Store prepared submissions and close their cases and alerts. Call inside a unit of work."""
+    now = datetime.now().isoformat()
+    conn.executemany('INSERT INTO submissions (case_id, sar_payload, submitted_at, submission_id, checksum) VALUES (?, ?, ?, ?, ?)',
+                     [(s['case_id'], s['sar_payload'], now, s['submission_id'], s['checksum']) for s in submissions])
+    conn.executemany('UPDATE cases SET status = ?, updated_at = ? WHERE id = ?',
+                     [('submitted', now, s['case_id']) for s in submissions])
+    for s in submissions:
+        audit = uow.audit(s['case_id'], analyst, 'sar_submitted', {'submission_id': s['submission_id'], 'checksum': s['checksum']})
+        update_case_view(conn, s['case_id'], case_fields={'status': 'submitted', 'updated_at': now}, audit=audit)
+        set_alert_status(conn, s['alert_id'], 'closed', s['case_id'])
+
+@app.route('/api/cases/submit:batch', methods=['POST'])
+def submit_sar_batch():
+    """Submit many cases: each is gated on its own, and those that pass are written in one transaction."""
+    started = time.perf_counter()
+    data = request.get_json(silent=True) or {}
+    case_ids = data.get('case_ids')
+    if not isinstance(case_ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in case_ids):
+        return jsonify({'error': 'case_ids must be a list of integers'}), 400
+    if len(case_ids) > SUBMIT_BATCH_MAX:
+        return jsonify({'error': f'At most {SUBMIT_BATCH_MAX} cases per batch'}), 400
+    case_ids = list(dict.fromkeys(case_ids))
+    analyst = data.get('analyst', 'analyst@signalsar.com')
     
-    conn.commit()
-    
-    log_audit(case_id, data.get('analyst', 'analyst@signalsar.com'), 'sar_submitted', 
-              {'submission_id': submission_id, 'checksum': checksum})
+    conn = get_db()
+    cases = load_cases(conn, case_ids)
+    results, submissions = {}, []
+    for case_id in case_ids:
+        case = cases.get(case_id)
+        error = gate_error(case) if case else 'Case not found'
+        if error:
+            results[case_id] = {'case_id': case_id, 'error': error}
+        else:
+            submissions.append(prepare_submission(conn, case, analyst))
+    prepare_ms = (time.perf_counter() - started) * 1000
+    
+    if submissions:
+        commit_unit(lambda conn, uow: record_submissions(conn, uow, submissions, analyst))
+    for s in submissions:
+        results[s['case_id']] = {'case_id': s['case_id'], 'submission_id': s['submission_id'], 'status': 'submitted',
+                                 'checksum': s['checksum']}
     
-    conn.close()
-    return jsonify({'submission_id': submission_id, 'status': 'submitted', 'checksum': checksum})
+    return jsonify({
+        'results': [results[case_id] for case_id in case_ids],
+        'submitted': len(submissions),
+        'failed': len(case_ids) - len(submissions),
+        'timings': {
+            'prepare_ms': round(prepare_ms, 3),
+            'write_ms': round((time.perf_counter() - started) * 1000 - prepare_ms, 3),
+            'total_ms': round((time.perf_counter() - started) * 1000, 3)
+        }
+    })
+
+AUDIT_FIELDS = ('id', 'case_id', 'analyst', 'action', 'details', 'before_value', 'after_value', 'timestamp')
+AUDIT_PAGE_SIZE = 50
+AUDIT_PAGE_MAX = 1000
+AUDIT_STREAM_PAGE = 1000
+
+def query_audit(conn, case_id=None, analyst=None, action=None, since=None, until=None,
+                after=None, upto=None, descending=False, limit=AUDIT_PAGE_SIZE):
+    """One page of audit rows in (timestamp, id) order, resuming past the `after` key and
+    ignoring rows with id > `upto`. Returns (rows, (timestamp, id) of the last row or None)."""
+    query = 'SELECT * FROM audit_log WHERE 1'
+    params = []
+    for column, value in (('case_id', case_id), ('analyst', analyst), ('action', action)):
+        if value is not None:
+            query += f' AND {column} = ?'
+            params.append(value)
+    if since:
+        query += ' AND timestamp >= ?'
+        params.append(since)
+    if until:
+        query += ' AND timestamp < ?'
+        params.append(until)
+    if after:
+        query += f' AND (timestamp, id) {"<" if descending else ">"} (?, ?)'
+        params.extend(after)
+    if upto is not None:
+        # A filter, not an index bound: the (timestamp, id) order picks the index
+        query += ' AND +id <= ?'
+        params.append(upto)
+    query += ' ORDER BY timestamp DESC, id DESC LIMIT ?' if descending else ' ORDER BY timestamp, id LIMIT ?'
+    params.append(limit + 1)
+
+    rows = conn.execute(query, params).fetchall()
+    next_key = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_key = (rows[-1]['timestamp'], rows[-1]['id'])
+    return [dict(r) for r in rows], next_key
+
+def parse_audit_args(args, default_order):
+    case_id = args.get('case_id')
+    if case_id is not None:
+        try:
+            case_id = int(case_id)
+        except ValueError:
+            raise ValueError('case_id must be an integer')
+    order = args.get('order', default_order)
+    if order not in ('asc', 'desc'):
+        raise ValueError('order must be asc or desc')
+    return {
+        'filters': {'case_id': case_id, 'analyst': args.get('analyst'), 'action': args.get('action'),
+                    'since': args.get('since'), 'until': args.get('until')},
+        'descending': order == 'desc',
+        'after': decode_cursor(args['cursor'], (str, int)) if args.get('cursor') else None
+    }
+
+def audit_pages(conn, filters, descending, after, page_size):
+    """Fetch function for iter_pages over the filtered audit log, resuming after `after`.
+    Pages end at the newest row present when the first one is read."""
+    upto = conn.execute('SELECT MAX(id) FROM audit_log').fetchone()[0] or 0
+    def fetch(key, size):
+        return query_audit(conn, after=key or after, upto=upto, descending=descending, limit=size, **filters)
+    return fetch
 
 @app.route('/api/audit', methods=['GET'])
 def get_audit_log():
+    try:
+        params = parse_audit_args(request.args, 'desc')
+        limit = parse_limit(request.args.get('limit'), AUDIT_PAGE_SIZE, AUDIT_PAGE_MAX)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     conn = get_db()
-    logs = conn.execute('SELECT * FROM audit_log ORDER BY timestamp DESC LIMIT 50').fetchall()
-    conn.close()
-    return jsonify([dict(log) for log in logs])
+    change_id = latest_change_id(conn)
+    # audit_log is append-only: the newest id versions every page of it
+    etag = f'audit-{conn.execute("SELECT MAX(id) FROM audit_log").fetchone()[0] or 0}'
+    cached = not_modified(etag, {'X-Change-Id': change_id})
+    if cached:
+        return cached
+    fetch = audit_pages(conn, params['filters'], params['descending'], params['after'], limit)
+    logs, next_key = fetch(None, limit)
+    response = tag(jsonify(logs), etag)
+    response.headers['X-Change-Id'] = change_id
+    if next_key:
+        cursor = encode_cursor(*next_key)
+        response.headers['X-Next-Cursor'] = cursor
+        response.headers['Link'] = next_link(request.base_url, request.args, cursor)
+    return response
+
+@app.route('/api/audit/export', methods=['GET'])
+def export_audit_log():
+    try:
+        params = parse_audit_args(request.args, 'asc')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+
+    # Rows are written as each page is read; the export ends at the newest row present when it started
+    pool = get_pool()
+    def generate():
+        with pool.connection() as conn:
+            rows = iter_pages(audit_pages(conn, params['filters'], params['descending'], params['after'], AUDIT_STREAM_PAGE), AUDIT_STREAM_PAGE)
+            yield from (csv_rows(rows, AUDIT_FIELDS) if fmt == 'csv' else ndjson(rows))
+
+    response = Response(generate(), mimetype='text/csv' if fmt == 'csv' else 'application/x-ndjson')
+    response.headers['Content-Disposition'] = f'attachment; filename=audit_log.{fmt}'
+    return response
+
+def start_background():
+    """Start this process's background threads; server workers call it after forking (wsgi.py)."""
+    change_bus.start()
+    start_reconciler(connection)
+    if JOB_WORKERS:
+        job_pool.start()
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     debug = os.environ.get('FLASK_DEBUG', '0') == '1'
+    start_background()
     app.run(host='0.0.0.0', port=port, debug=debug)
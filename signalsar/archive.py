@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""Columnar transaction archive.
+
+A case's transaction history is also kept as one immutable file of fixed-width columns,
+read through mmap: every column is a zero-copy NumPy view of the mapping, so summaries
+come from vectorized passes over the columns and a page of the timeline is a slice of
+stored JSON text. Nothing is parsed on read, however long the history.
+
+Files are named by a hash of the format version and the history as the case stores it
+(its blob chunk hashes, or its JSON text for cases stored inline), so identical histories
+share a file and a file never changes once written. The database stays the source of truth: a missing file
+is rebuilt from the case on first use, and `python archive.py prune` removes files no
+case refers to. Layout (little-endian, each section 8-byte aligned):
+
+    header    magic, rows, strings, integer amounts, id width, text bytes, string bytes
+    id        S<width>[rows]   transaction id, for evidence filters
+    ts        int64[rows]      microseconds since the epoch
+    amount    int64|float64    int64 when every amount is an integer
+    type      int32[rows]      string table index
+    ip        int32[rows]      string table index, -1 when absent
+    rows      int64[rows + 1]  offset of each transaction's JSON in text
+    strings   int64[n + 1]     offset of each string in string bytes
+    text      each transaction's JSON followed by ', '
+    string bytes
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+from blobs import load_enriched_parts
+from scoring import EPOCH, ONE_US, _parse_timestamps
+
+ARCHIVE_DIR = os.environ.get('SIGNALSAR_ARCHIVE_DIR')
+OPEN_MAX = 64           # mapped archives kept open per process
+
+MAGIC = b'SSTXNAR2'
+HEADER = np.dtype([('magic', 'S8'), ('rows', '<i8'), ('strings', '<i8'), ('int_amounts', '<i8'), ('id_width', '<i8'),
+                   ('text_bytes', '<i8'), ('string_bytes', '<i8')])
+SEPARATOR = b', '
+
+def archive_dir(db_path):
+    return ARCHIVE_DIR or f'{db_path}.archive'
+
+def archive_path(directory, key):
+    return os.path.join(directory, key[:2], f'{key}.txn')
+
+def history_key(enriched_ref=None, txn_text=None):
+    """Archive key of a stored history: a hash of its blob chunk hashes, or of its JSON
+    text for cases stored inline. Files of an older format get new keys and are pruned."""
+    source = ','.join(json.loads(enriched_ref)['txn_history']) if enriched_ref is not None else txn_text
+    return hashlib.sha256(MAGIC + source.encode()).hexdigest()
+
+def timestamp_us(text):
+    """An ISO timestamp in microseconds since the epoch, as the ts column stores it."""
+    try:
+        return int(_parse_timestamps([text])[0])
+    except (ValueError, TypeError):
+        raise ValueError(f'Invalid timestamp: {text}')
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+def _sections(header):
+    rows, strings = int(header['rows']), int(header['strings'])
+    return (('id', f'S{int(header["id_width"])}', rows), ('ts', '<i8', rows), ('amount', '<i8' if header['int_amounts'] else '<f8', rows), ('type', '<i4', rows),
+            ('ip', '<i4', rows), ('rows', '<i8', rows + 1), ('strings', '<i8', strings + 1),
+            ('text', 'u1', int(header['text_bytes'])), ('string_bytes', 'u1', int(header['string_bytes'])))
+
+def encode(txn_history):
+    """The archive file contents for a list of transaction dicts."""
+    strings = {}
+    string_id = lambda value: strings.setdefault(value, len(strings))
+    texts = [json.dumps(t).encode() + SEPARATOR for t in txn_history]
+    amounts = [t['amount'] for t in txn_history]
+    int_amounts = all(type(a) is int for a in amounts)
+    ids = [str(t['id']).encode() for t in txn_history]
+    columns = {
+        'id': np.array(ids, dtype=f'S{max(map(len, ids), default=1) or 1}'),
+        'ts': _parse_timestamps([t['timestamp'] for t in txn_history]) if txn_history else np.zeros(0, np.int64),
+        'amount': np.array(amounts, dtype='<i8' if int_amounts else '<f8'),
+        'type': np.fromiter((string_id(t['type']) for t in txn_history), '<i4', len(txn_history)),
+        'ip': np.fromiter((string_id(t['ip']) if t.get('ip') else -1 for t in txn_history), '<i4', len(txn_history)),
+        'rows': np.concatenate(([0], np.cumsum([len(t) for t in texts], dtype=np.int64))),
+    }
+    encoded = [s.encode() for s in strings]
+    columns['strings'] = np.concatenate(([0], np.cumsum([len(s) for s in encoded], dtype=np.int64)))
+    columns['text'] = b''.join(texts)
+    columns['string_bytes'] = b''.join(encoded)
+
+    header = np.zeros(1, HEADER)
+    header[0] = (MAGIC, len(txn_history), len(strings), int_amounts, columns['id'].itemsize, len(columns['text']), len(columns['string_bytes']))
+    parts = [header.tobytes()]
+    size = HEADER.itemsize
+    for name, dtype, _ in _sections(header[0]):
+        data = columns[name]
+        data = data if isinstance(data, bytes) else np.ascontiguousarray(data, dtype=dtype).tobytes()
+        parts.append(b'\0' * (_align(size) - size))
+        parts.append(data)
+        size = _align(size) + len(data)
+    return b''.join(parts)
+
+def write_archive(directory, key, txn_history):
+    """Write the archive for `key` unless it exists. Safe against concurrent writers: the
+    file appears complete (os.replace) or not at all."""
+    path = archive_path(directory, key)
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(encode(txn_history))
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return path
+
+class TxnArchive:
+    """A mapped archive file; `id`, `ts`, `amount`, `type`, `ip` and `rows` are read-only NumPy views."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = np.frombuffer(self._map, HEADER, 1)[0]
+        if header['magic'] != MAGIC:
+            raise ValueError(f'{path} is not a transaction archive')
+        offset = HEADER.itemsize
+        for name, dtype, count in _sections(header):
+            offset = _align(offset)
+            setattr(self, name, np.frombuffer(self._map, dtype, count, offset))
+            offset += count * np.dtype(dtype).itemsize
+        # The string table holds the few distinct types and IPs; decode it once
+        data = self.string_bytes.tobytes()
+        bounds = self.strings.tolist()
+        self.string_table = [data[a:b].decode() for a, b in zip(bounds, bounds[1:])]
+        self._summary = None
+
+    def __len__(self):
+        return len(self.ts)
+
+    def rows_json(self, start, stop):
+        """JSON text of transactions [start, stop), comma-separated as in a JSON list."""
+        start, stop = max(0, start), min(stop, len(self))
+        if start >= stop:
+            return ''
+        return self.text[self.rows[start]:self.rows[stop] - len(SEPARATOR)].tobytes().decode()
+
+    def select_json(self, indexes):
+        """JSON text of the transactions at ascending row `indexes`, comma-separated."""
+        if len(indexes) and indexes[-1] - indexes[0] == len(indexes) - 1:
+            return self.rows_json(int(indexes[0]), int(indexes[-1]) + 1)
+        rows, text = self.rows, self.text
+        return ', '.join(text[rows[i]:rows[i + 1] - len(SEPARATOR)].tobytes().decode() for i in indexes.tolist())
+
+    def match(self, types=None, min_amount=None, max_amount=None, since=None, until=None, ids=None):
+        """Boolean mask of the rows passing every given filter: `types` and `ids` are
+        collections of names, `since` (inclusive) and `until` (exclusive) microseconds since
+        the epoch. None when no filter is given."""
+        masks = []
+        if types is not None:
+            codes = [code for code, name in enumerate(self.string_table) if name in types]
+            masks.append(np.isin(self.type, codes))
+        if min_amount is not None:
+            masks.append(self.amount >= min_amount)
+        if max_amount is not None:
+            masks.append(self.amount <= max_amount)
+        if since is not None:
+            masks.append(self.ts >= since)
+        if until is not None:
+            masks.append(self.ts < until)
+        if ids is not None:
+            wanted = [i for i in (str(i).encode() for i in ids) if len(i) <= self.id.itemsize]
+            masks.append(np.isin(self.id, np.array(wanted, dtype=self.id.dtype)))
+        return np.logical_and.reduce(masks) if masks else None
+
+    def page(self, start, limit, mask=None):
+        """(row indexes, next start or None) of the first `limit` rows from `start` that `mask` keeps."""
+        if mask is None:
+            stop = min(start + limit, len(self))
+            return np.arange(start, max(start, stop)), stop if stop < len(self) else None
+        hits = np.flatnonzero(mask[start:])[:limit + 1] + start
+        if len(hits) > limit:
+            return hits[:limit], int(hits[limit])
+        return hits, None
+
+    def _total(self, amounts):
+        total = amounts.sum()
+        return int(total) if amounts.dtype.kind == 'i' else float(total)
+
+    def summary(self):
+        """Counts and volumes, overall and per transaction type, and the time span."""
+        if self._summary is None:
+            self._summary = self._summarize()
+        return self._summary
+
+    def _summarize(self):
+        by_type = {}
+        for code in np.unique(self.type).tolist():
+            mask = self.type == code
+            by_type[self.string_table[code]] = {'count': int(mask.sum()), 'volume': self._total(self.amount[mask])}
+        empty = {'count': 0, 'volume': 0}
+        return {
+            'total_transactions': len(self),
+            'total_volume': self._total(self.amount),
+            'deposit_count': by_type.get('deposit', empty)['count'],
+            'withdrawal_count': by_type.get('withdrawal', empty)['count'],
+            'by_type': by_type,
+            'first_timestamp': (EPOCH + int(self.ts.min()) * ONE_US).isoformat() if len(self) else None,
+            'last_timestamp': (EPOCH + int(self.ts.max()) * ONE_US).isoformat() if len(self) else None,
+        }
+
+_open = OrderedDict()
+_open_lock = threading.Lock()
+
+def open_archive(directory, key):
+    """The mapped archive for `key`; raises FileNotFoundError if it was never written."""
+    path = archive_path(directory, key)
+    with _open_lock:
+        archive = _open.get(path)
+        if archive is not None:
+            _open.move_to_end(path)
+            return archive
+    archive = TxnArchive(path)
+    with _open_lock:
+        _open[path] = archive
+        while len(_open) > OPEN_MAX:
+            # Unmapped once the last view of it is gone
+            _open.popitem(last=False)
+    return archive
+
+def case_archive(conn, case_id, directory):
+    """The case's archive, written from its stored history on first use; None if the case
+    has no view (call case_views.case_view_version first)."""
+    row = conn.execute('''SELECT c.enriched_ref, c.enriched_data, v.txn_start, v.txn_end
+                          FROM case_views v JOIN cases c ON c.id = v.case_id WHERE v.case_id = ?''', (case_id,)).fetchone()
+    if row is None:
+        return None
+    text = None
+    if row['enriched_ref'] is not None:
+        key = history_key(row['enriched_ref'])
+    else:
+        text = row['enriched_data'][row['txn_start']:row['txn_end']]
+        key = history_key(txn_text=text)
+    try:
+        return open_archive(directory, key)
+    except FileNotFoundError:
+        pass
+    if text is None:
+        text = load_enriched_parts(conn, row['enriched_ref'])[1]
+    write_archive(directory, key, json.loads(text))
+    return open_archive(directory, key)
+
+def prune(conn, directory):
+    """Delete archive files no case refers to. Returns the number removed."""
+    keep = set()
+    for ref, text, start, end in conn.execute('''SELECT c.enriched_ref, CASE WHEN c.enriched_ref IS NULL THEN c.enriched_data END,
+                                                        v.txn_start, v.txn_end
+                                                 FROM cases c JOIN case_views v ON v.case_id = c.id'''):
+        keep.add(history_key(ref) if ref is not None else history_key(txn_text=text[start:end]))
+    removed = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith('.txn') and name[:-4] not in keep:
+                os.unlink(os.path.join(root, name))
+                removed += 1
+    return removed
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain the SignalSAR transaction archive')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('build', help='write the archive of every case that has none')
+    sub.add_parser('prune', help='delete archive files no case refers to')
+    args = parser.parse_args()
+
+    from db import DB_PATH, open_connection
+    conn = open_connection(DB_PATH)
+    directory = archive_dir(DB_PATH)
+    if args.command == 'build':
+        case_ids = [case_id for (case_id,) in conn.execute('SELECT case_id FROM case_views ORDER BY case_id')]
+        for case_id in case_ids:
+            case_archive(conn, case_id, directory)
+        print(f'Archived the transactions of {len(case_ids)} cases in {directory}')
+    else:
+        print(f'Removed {prune(conn, directory)} unreferenced archive files')
+
+if __name__ == '__main__':
+    main()
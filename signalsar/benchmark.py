@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""Benchmark suite: the API routes at several database scales, plus microbenchmarks of
+scoring, narrative generation and the compliance check.
+
+    python benchmark.py                          # 1k, 100k and 1m scales, JSON on stdout
+    python benchmark.py --scales 1k --out after.json
+    python benchmark.py --compare before.json after.json
+
+Each scale seeds a throwaway database (alerts, cases, audit rows and bulk-ingested
+transactions, SCALE rows each) in its own process, then drives every route through the
+Flask test client: warm-up requests first, then timed repeats. The investigate-to-submit
+pipeline runs end to end on fresh alerts for customers with ingested transactions, so
+the job queue, feature store and every write path are exercised. Microbenchmarks call
+calculate_risk_score(), generate_sar_narrative() and check_compliance() on fixed inputs.
+
+Every series reports p50/p95/p99/mean/max in milliseconds and throughput per second.
+Inputs are seeded from SEED, and the output records the commit and library versions, so
+two runs can be compared with --compare.
+"""
+
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+import numpy as np
+
+SCALES = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+SEED = 42
+TXNS_PER_CUSTOMER = 20
+INGEST_CHUNK = 100_000
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def summarize(samples_ns, seconds):
+    ms = np.array(samples_ns) / 1e6
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99]).tolist()
+    return {'n': len(ms), 'p50_ms': round(p50, 4), 'p95_ms': round(p95, 4), 'p99_ms': round(p99, 4),
+            'mean_ms': round(ms.mean().item(), 4), 'max_ms': round(ms.max().item(), 4),
+            'per_s': round(len(ms) / seconds, 1) if seconds else None}
+
+def measure(call, repeat, warmup):
+    """Call `call(i)` warmup times untimed, then `repeat` timed times."""
+    for i in range(warmup):
+        call(i)
+    gc.collect()
+    samples = []
+    started = time.perf_counter()
+    for i in range(repeat):
+        t = time.perf_counter_ns()
+        call(warmup + i)
+        samples.append(time.perf_counter_ns() - t)
+    return summarize(samples, time.perf_counter() - started)
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'commit': commit or None, 'at': datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version, 'numpy': np.__version__, 'platform': platform.platform(), 'cpus': os.cpu_count()}
+
+# Microbenchmarks
+
+def synthetic_history(rng, count, days=90, now=None):
+    now = now or datetime.now()
+    types = ['deposit', 'trade', 'withdrawal', 'deposit', 'trade']
+    txns = [{'id': f'TXN-{i}', 'type': rng.choice(types), 'amount': rng.randint(50, 25000),
+             'timestamp': (now - timedelta(seconds=rng.randrange(days * 86400))).isoformat(),
+             'ip': rng.choice(['192.168.1.1', '192.168.1.2', '10.0.0.5']), 'description': 'Synthetic transaction'}
+            for i in range(count)]
+    return sorted(txns, key=lambda t: t['timestamp'])
+
+def micro(repeat, warmup):
+    from enrichment import get_mock_customer_data, get_mock_txn_history
+    from scoring import calculate_risk_score
+    from narratives import generate_sar_narrative
+    from compliance import check_compliance
+
+    random.seed(SEED)
+    rng = random.Random(SEED)
+    inputs = {
+        'CUST-4455 (47 micro txns)': get_mock_txn_history('CUST-4455'),
+        'CUST-8821 (25 txns)': get_mock_txn_history('CUST-8821'),
+        'synthetic (2000 txns)': synthetic_history(rng, 2000),
+    }
+    results = {}
+    for label, history in inputs.items():
+        customer_id = label.split()[0] if label.startswith('CUST') else 'CUST-0001'
+        customer_data = get_mock_customer_data(customer_id)
+        score, reasons, evidence_map, typology = calculate_risk_score(customer_id, history)
+        risk_analysis = {'score': score, 'reasons': reasons, 'evidence_map': evidence_map, 'velocity_multiplier': 3.2}
+        draft = generate_sar_narrative(customer_data, history, risk_analysis, typology)
+        enriched = {'customer_data': customer_data, 'txn_history': history, 'risk_analysis': risk_analysis}
+        results[f'calculate_risk_score[{label}]'] = measure(lambda i: calculate_risk_score(customer_id, history), repeat, warmup)
+        results[f'generate_sar_narrative[{label}]'] = measure(lambda i: generate_sar_narrative(customer_data, history, risk_analysis, typology),
+                                                             repeat, warmup)
+        results[f'check_compliance[{label}]'] = measure(lambda i: check_compliance(draft, enriched, risk_analysis), repeat, warmup)
+    return results
+
+# Route benchmarks (one scale per process: app.py binds the database path on import)
+
+def seed_transactions(path, rows, now):
+    """`rows` transactions for rows / TXNS_PER_CUSTOMER customers over 90 days, through bulk
+    ingest (transactions, feature store, identifier graph). Returns the customer count."""
+    from db import open_connection
+    from ingest import Chunk, Ingestor
+    rng = random.Random(SEED)
+    customers = max(rows // TXNS_PER_CUSTOMER, 1)
+    types = ['deposit', 'trade', 'withdrawal', 'deposit', 'trade']
+    conn = open_connection(path)
+    # Scores never reach 101: seeding raises no alerts
+    ingestor = Ingestor(conn, alert_score=101)
+    totals = {'position': 0, 'records': 0, 'ingested': 0, 'rejected': 0, 'alerts': 0}
+    start = now - timedelta(days=90)
+    for offset in range(0, rows, INGEST_CHUNK):
+        count = min(INGEST_CHUNK, rows - offset)
+        seconds = sorted(rng.randrange(90 * 86400) for _ in range(count))
+        records = []
+        for i, second in enumerate(seconds):
+            customer = rng.randrange(customers)
+            records.append((f'CUST-{customer}', f'TXN-{offset + i}', rng.choice(types), float(rng.randint(50, 25000)),
+                            (start + timedelta(seconds=second)).isoformat(), f'10.{customer % 200}.{customer // 200 % 250}.{rng.randint(1, 2)}',
+                            'Seeded transaction', None))
+        ingestor.write_chunk(Chunk(records, 0, count, 0), 'benchmark', totals, now)
+    conn.close()
+    return customers
+
+def run_scale(name, repeat, warmup, workdir):
+    rows = SCALES[name]
+    path = os.path.join(workdir, 'signalsar.db')
+    os.environ['SIGNALSAR_DB'] = path
+    os.environ.setdefault('SIGNALSAR_THRESHOLD_RECONCILE_SECONDS', '0')
+    random.seed(SEED)
+    from init_db import init_db
+    from test_query_plans import seed
+
+    started = time.perf_counter()
+    now = datetime.now()
+    init_db(path)
+    seed(path, rows)
+    customers = seed_transactions(path, rows, now)
+    seeded = time.perf_counter() - started
+
+    from app import app
+    from pagination import encode_cursor
+    client = app.test_client()
+    results = {}
+
+    def check(response, *codes):
+        if response.status_code not in (codes or (200,)):
+            raise RuntimeError(f'{response.request.method} {response.request.url} -> {response.status_code}: {response.get_data(as_text=True)[:200]}')
+        return response
+
+    # Investigate-to-submit on fresh alerts; each step is timed as its own series too
+    steps = {}
+    pipeline = []
+    customer_ids = iter(range(10 ** 9))
+    def timed(label, method, url, body=None, codes=(200,)):
+        t = time.perf_counter_ns()
+        response = check(client.open(url, method=method, json=body), *codes)
+        steps.setdefault(label, []).append(time.perf_counter_ns() - t)
+        return response.get_json()
+
+    def investigate_to_submit(i):
+        t = time.perf_counter_ns()
+        customer = f'CUST-{next(customer_ids) % customers}'
+        alert_id = timed('POST /api/alerts', 'POST', '/api/alerts', {'customer_id': customer, 'alert_type': 'Structuring', 'risk_score': 80}, (201,))['id']
+        job = timed('POST /api/alerts/<id>/investigate?wait', 'POST', f'/api/alerts/{alert_id}/investigate?wait=30')
+        case_id = timed('GET /api/alerts/<id>/case', 'GET', f'/api/alerts/{alert_id}/case')['case_id']
+        case = timed('GET /api/cases/<id>', 'GET', f'/api/cases/{case_id}')
+        timed('POST /api/cases/<id>/typology', 'POST', f'/api/cases/{case_id}/typology', {'typology': case['case']['typology']})
+        timed('POST /api/cases/<id>/intervene', 'POST', f'/api/cases/{case_id}/intervene', {'action': 'hold_withdrawal', 'rationale': 'benchmark'})
+        timed('POST /api/cases/<id>/feedback', 'POST', f'/api/cases/{case_id}/feedback', {'label': 'true_positive', 'rationale': 'benchmark'})
+        # The analyst's edit: generic templates do not name the typology, which submit requires
+        draft = f"{case['case']['sar_draft']}\n\nTypology: {case['case']['typology']}"
+        timed('PUT /api/cases/<id>/sar', 'PUT', f'/api/cases/{case_id}/sar', {'sar_draft': draft})
+        timed('POST /api/cases/<id>/submit', 'POST', f'/api/cases/{case_id}/submit', {})
+        if i >= warmup:
+            pipeline.append(time.perf_counter_ns() - t)
+        return job['job_id'], alert_id, case_id
+
+    pipeline_started = None
+    last = None
+    for i in range(warmup + repeat):
+        if i == warmup:
+            steps.clear()
+            pipeline_started = time.perf_counter()
+        last = investigate_to_submit(i)
+    results['pipeline: investigate to submit'] = summarize(pipeline, time.perf_counter() - pipeline_started)
+    for label, samples in steps.items():
+        results[label] = summarize(samples, sum(samples) / 1e9)
+    job_id, alert_id, case_id = last
+
+    etag = client.get(f'/api/cases/{case_id}').headers['ETag']
+    since = (datetime.now() - timedelta(seconds=1000)).isoformat()
+    latest = int(client.get('/api/alerts?limit=1').headers['X-Change-Id'])
+    reads = [
+        ('GET /api/alerts?status=open', '/api/alerts?status=open', {}),
+        ('GET /api/alerts (type filter, keyset page)', '/api/alerts?status=open&alert_type=Structuring&limit=50&cursor=' + encode_cursor(50, rows // 2), {}),
+        ('GET /api/alerts?format=ndjson (1000 rows)', '/api/alerts?status=open&format=ndjson&limit=1000', {}),
+        ('GET /api/cases/<id>', f'/api/cases/{case_id}', {}),
+        ('GET /api/cases/<id> (If-None-Match)', f'/api/cases/{case_id}', {'If-None-Match': etag}),
+        ('GET /api/cases/<id>/transactions (page of 100)', f'/api/cases/{case_id}/transactions?limit=100&cursor=' + encode_cursor(5), {}),
+        ('GET /api/cases/<id>/transactions (filtered)', f'/api/cases/{case_id}/transactions?type=deposit&min_amount=100', {}),
+        ('GET /api/alerts/<id>/case', f'/api/alerts/{alert_id}/case', {}),
+        ('GET /api/jobs/<id>', f'/api/jobs/{job_id}', {}),
+        ('GET /api/audit', '/api/audit', {}),
+        ('GET /api/audit?case_id', f'/api/audit?case_id={case_id}&limit=5', {}),
+        ('GET /api/audit (action filter, keyset page)', '/api/audit?action=case_created&cursor=' + encode_cursor(datetime.now().isoformat(), rows // 2), {}),
+        ('GET /api/audit/export?format=csv (1000 rows)', f'/api/audit/export?format=csv&since={since}', {}),
+        ('GET /', '/', {}),
+    ]
+    for label, url, headers in reads:
+        results[label] = measure(lambda i: check(client.get(url, headers=headers), 200, 304).get_data(), repeat, warmup)
+    results['POST /api/jobs/<id>/retry (finished job)'] = measure(
+        lambda i: check(client.post(f'/api/jobs/{job_id}/retry', json={})), repeat, warmup)
+
+    replayed = min(latest, 100)
+    def replay(i):
+        # The change feed stays open; time the replay of the last 100 changes
+        response = check(client.get(f'/api/changes?after={latest - replayed}', buffered=False))
+        events = 0
+        for chunk in response.response:
+            events += chunk.startswith(b'id: ')
+            if events >= replayed:
+                break
+        response.close()
+    results['GET /api/changes (replay 100)'] = measure(replay, repeat, warmup)
+
+    def batch(i):
+        alert_ids = [check(client.post('/api/alerts', json={'customer_id': f'CUST-{next(customer_ids) % customers}', 'alert_type': 'Structuring'}), 201).get_json()['id']
+                     for _ in range(10)]
+        t = time.perf_counter_ns()
+        check(client.post('/api/alerts/investigate:batch', json={'alert_ids': alert_ids, 'parallel': False}))
+        return time.perf_counter_ns() - t
+    batch_repeat = max(repeat // 5, 3)
+    for i in range(warmup):
+        batch(i)
+    samples = [batch(i) for i in range(batch_repeat)]
+    results['POST /api/alerts/investigate:batch (10 alerts)'] = summarize(samples, sum(samples) / 1e9)
+
+    return {'rows': rows, 'customers_with_transactions': customers, 'seed_s': round(seeded, 1), 'routes': results}
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+
+    def series(result):
+        for name, stats in result.get('micro', {}).items():
+            yield f'micro  {name}', stats
+        for scale, data in result.get('scales', {}).items():
+            for name, stats in data['routes'].items():
+                yield f'{scale:6} {name}', stats
+
+    old = dict(series(before))
+    print(f"{before['environment'].get('commit')} -> {after['environment'].get('commit')}")
+    print(f"{'series':78} {'p50 ms':>10} {'':>10} {'ratio':>6} {'p99 ms':>10} {'':>10} {'ratio':>6}")
+    for name, stats in series(after):
+        if name not in old:
+            continue
+        was = old[name]
+        ratios = [stats[k] / was[k] if was[k] else float('nan') for k in ('p50_ms', 'p99_ms')]
+        flag = '  slower' if ratios[0] > 1.1 else '  faster' if ratios[0] < 0.9 else ''
+        print(f"{name[:78]:78} {was['p50_ms']:10.3f} {stats['p50_ms']:10.3f} {ratios[0]:6.2f} "
+              f"{was['p99_ms']:10.3f} {stats['p99_ms']:10.3f} {ratios[1]:6.2f}{flag}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark SignalSAR routes and core functions')
+    parser.add_argument('--scales', default=','.join(SCALES), help=f'comma-separated, of {", ".join(SCALES)} (empty: none)')
+    parser.add_argument('--repeat', type=int, default=50, help='timed requests per route (pipeline runs per scale)')
+    parser.add_argument('--warmup', type=int, default=5, help='untimed requests per route first')
+    parser.add_argument('--micro-repeat', type=int, default=2000, help='timed calls per microbenchmark')
+    parser.add_argument('--micro-warmup', type=int, default=200)
+    parser.add_argument('--no-micro', action='store_true')
+    parser.add_argument('--out', help='write the JSON here instead of stdout')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='compare two result files and exit')
+    parser.add_argument('--run-scale', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.run_scale:
+        # Only the result goes to stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            scale, workdir = args.run_scale
+            data = run_scale(scale, args.repeat, args.warmup, workdir)
+        json.dump(data, sys.stdout)
+        return
+
+    scales = [s for s in args.scales.split(',') if s]
+    unknown = [s for s in scales if s not in SCALES]
+    if unknown:
+        parser.error(f'unknown scale {", ".join(unknown)}')
+    result = {'environment': environment(), 'settings': {'seed': SEED, 'repeat': args.repeat, 'warmup': args.warmup,
+              'micro_repeat': args.micro_repeat, 'micro_warmup': args.micro_warmup}}
+    if not args.no_micro:
+        print('microbenchmarks...', file=sys.stderr)
+        result['micro'] = micro(args.micro_repeat, args.micro_warmup)
+    result['scales'] = {}
+    for scale in scales:
+        print(f'scale {scale}: seeding and driving routes...', file=sys.stderr)
+        workdir = tempfile.mkdtemp(prefix=f'signalsar-bench-{scale}-')
+        try:
+            child = subprocess.run([sys.executable, os.path.abspath(__file__), '--run-scale', scale, workdir,
+                                    '--repeat', str(args.repeat), '--warmup', str(args.warmup)],
+                                   cwd=HERE, capture_output=True, text=True)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        if child.returncode:
+            sys.stderr.write(child.stderr)
+            sys.exit(f'scale {scale} failed')
+        result['scales'][scale] = json.loads(child.stdout)
+
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+"""Content-addressed, compressed storage for case payloads.
+
+A case's KYC snapshot and transaction history are stored in `blobs`, keyed by the
+SHA-256 of their JSON text and compressed (zstd when the `zstandard` package is
+installed, zlib otherwise). Cases and submissions keep only the hashes, so identical
+payloads are stored once however often a customer is re-investigated.
+
+Transaction histories are cut into chunks at content-defined boundaries: a chunk ends
+after a transaction whose id hashes to 0 mod CHUNK_SPREAD. Boundaries depend only on
+the transactions themselves, so when a customer's 90-day window slides, the chunks in
+the overlap keep their hashes and are shared with earlier cases.
+
+Blobs are serialized with sorted keys, so a case's stored texts are already pieces of
+the canonical form (json.dumps(..., sort_keys=True)) its submission checksum covers;
+`canonical_enriched` hands them out without parsing. Refs written this way say so
+(`"sorted": 1`); older blobs keep insertion order and are re-serialized when needed.
+
+Decoding is lazy: nothing is decompressed until a response body needs the text, and
+decoded blobs (immutable by construction) are kept in an in-process LRU.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CODEC = 'zstd' if zstandard else 'zlib'
+CHUNK_SPREAD = 8            # average transactions per chunk
+CHUNK_MAX = 64
+BLOB_CACHE_BYTES = int(os.environ.get('SIGNALSAR_BLOB_CACHE_MB', 64)) * 1024 * 1024
+
+# Key order of draft_case()'s enriched_data; risk_analysis lives in its own cases column
+ENRICHED_KEYS = ('customer_data', 'txn_history', 'risk_analysis')
+
+BLOBS_SCHEMA = '''CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    codec TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL
+) WITHOUT ROWID'''
+
+def _compress(raw):
+    if CODEC == 'zstd':
+        return zstandard.ZstdCompressor(level=6).compress(raw)
+    return zlib.compress(raw, 6)
+
+def _decompress(codec, data):
+    if codec == 'zstd':
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    return bytes(data)
+
+class BlobCache:
+    def __init__(self, max_bytes=BLOB_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            text = self._data.get(key)
+            if text is not None:
+                self._data.move_to_end(key)
+            return text
+
+    def set(self, key, text):
+        with self._lock:
+            if key in self._data:
+                return
+            self._data[key] = text
+            self._bytes += len(text)
+            while self._bytes > self.max_bytes and self._data:
+                self._bytes -= len(self._data.popitem(last=False)[1])
+
+blob_cache = BlobCache()
+
+def put_blobs(conn, texts):
+    """Store each text once; returns their hashes. Call inside the caller's write transaction."""
+    raws = [text.encode() for text in texts]
+    hashes = [hashlib.sha256(raw).hexdigest() for raw in raws]
+    present = {row[0] for row in conn.execute('SELECT hash FROM blobs WHERE hash IN (SELECT value FROM json_each(?))',
+                                              (json.dumps(hashes),))}
+    new = {}
+    for key, raw in zip(hashes, raws):
+        if key not in present and key not in new:
+            new[key] = (key, CODEC, len(raw), _compress(raw))
+    if new:
+        conn.executemany('INSERT OR IGNORE INTO blobs (hash, codec, size, data) VALUES (?, ?, ?, ?)', new.values())
+    return hashes
+
+def get_blobs(conn, hashes):
+    """Decoded text per hash, from the cache or one batched read."""
+    texts = {}
+    missing = []
+    for key in hashes:
+        text = blob_cache.get(key)
+        if text is None:
+            missing.append(key)
+        else:
+            texts[key] = text
+    if missing:
+        for key, codec, data in conn.execute('SELECT hash, codec, data FROM blobs WHERE hash IN (SELECT value FROM json_each(?))',
+                                             (json.dumps(missing),)):
+            texts[key] = _decompress(codec, data).decode()
+            blob_cache.set(key, texts[key])
+    return texts
+
+def chunk_transactions(txns):
+    chunks, current = [], []
+    for txn in txns:
+        current.append(txn)
+        if len(current) >= CHUNK_MAX or zlib.crc32(str(txn.get('id')).encode()) % CHUNK_SPREAD == 0:
+            chunks.append(current)
+            current = []
+    if current:
+        chunks.append(current)
+    return chunks
+
+def store_enriched(conn, enriched_data):
+    """Store the KYC snapshot and transaction chunks of `enriched_data`. Returns (ref, spans):
+    `ref` is the JSON text kept in cases.enriched_ref, or None when `enriched_data` does not
+    have the standard shape (store it inline then); `spans` are the offsets of each value in
+    the reassembled text, as dump_enriched() reports them."""
+    if tuple(enriched_data) != ENRICHED_KEYS or not isinstance(enriched_data['txn_history'], list):
+        return None, None
+    kyc = json.dumps(enriched_data['customer_data'], sort_keys=True)
+    # json.dumps of the whole list is the chunks' inner texts joined by ', '
+    chunks = [json.dumps(chunk, sort_keys=True)[1:-1] for chunk in chunk_transactions(enriched_data['txn_history'])]
+    hashes = put_blobs(conn, [kyc] + chunks)
+    txn_length = 2 + sum(map(len, chunks)) + 2 * max(len(chunks) - 1, 0)
+    kyc_start = len('{"customer_data": ')
+    txn_start = kyc_start + len(kyc) + len(', "txn_history": ')
+    risk_start = txn_start + txn_length + len(', "risk_analysis": ')
+    spans = {'customer_data': (kyc_start, kyc_start + len(kyc)), 'txn_history': (txn_start, txn_start + txn_length),
+             'risk_analysis': (risk_start, risk_start + len(json.dumps(enriched_data['risk_analysis'])))}
+    return json.dumps({'customer_data': hashes[0], 'txn_history': hashes[1:], 'sorted': 1}), spans
+
+def load_enriched_parts(conn, ref):
+    """(customer_data JSON, txn_history JSON) for a cases.enriched_ref value."""
+    ref = json.loads(ref)
+    texts = get_blobs(conn, [ref['customer_data']] + ref['txn_history'])
+    return texts[ref['customer_data']], '[' + ', '.join(texts[key] for key in ref['txn_history']) + ']'
+
+def load_customer_data(conn, ref):
+    """customer_data JSON for a cases.enriched_ref value, without its transaction chunks."""
+    key = json.loads(ref)['customer_data']
+    return get_blobs(conn, [key])[key]
+
+def enriched_text(conn, case):
+    """The case's enriched_data JSON text, reassembled from its blobs unless stored inline."""
+    if case['enriched_ref'] is None:
+        return case['enriched_data']
+    kyc, txns = load_enriched_parts(conn, case['enriched_ref'])
+    return f'{{"customer_data": {kyc}, "txn_history": {txns}, "risk_analysis": {case["risk_analysis"]}}}'
+
+def canonical_enriched(conn, case):
+    """json.dumps(enriched_data, sort_keys=True) of a case, as a list of pieces in order.
+    Sorted blobs are used as stored; anything else is parsed and re-serialized."""
+    ref = json.loads(case['enriched_ref']) if case['enriched_ref'] is not None else None
+    if ref is None or not ref.get('sorted'):
+        return [json.dumps(json.loads(enriched_text(conn, case)), sort_keys=True)]
+    texts = get_blobs(conn, [ref['customer_data']] + ref['txn_history'])
+    pieces = ['{"customer_data": ', texts[ref['customer_data']],
+              ', "risk_analysis": ', json.dumps(json.loads(case['risk_analysis']), sort_keys=True), ', "txn_history": [']
+    for i, key in enumerate(ref['txn_history']):
+        if i:
+            pieces.append(', ')
+        pieces.append(texts[key])
+    pieces.append(']}')
+    return pieces
+
+def submission_enriched(case):
+    """The enriched_data value stored in a submission's sar_payload: the case's blob hashes
+    (plus its risk analysis) instead of another copy of the payload."""
+    if case['enriched_ref'] is None:
+        return json.loads(case['enriched_data'])
+    return {'$blobs': json.loads(case['enriched_ref']), 'risk_analysis': json.loads(case['risk_analysis'])}
+
+def expand_enriched(conn, value):
+    """Inverse of submission_enriched(): the full enriched_data dict."""
+    if not isinstance(value, dict) or '$blobs' not in value:
+        return value
+    kyc, txns = load_enriched_parts(conn, json.dumps(value['$blobs']))
+    return {'customer_data': json.loads(kyc), 'txn_history': json.loads(txns), 'risk_analysis': value['risk_analysis']}
+
+def compact_cases(conn, batch=500):
+    """Move inline enriched_data of older cases into the blob store. Returns the number moved."""
+    moved = 0
+    last_id = 0
+    while True:
+        rows = conn.execute('SELECT id, enriched_data, enriched_ref, risk_analysis FROM cases WHERE id > ? ORDER BY id LIMIT ?',
+                            (last_id, batch)).fetchall()
+        if not rows:
+            return moved
+        for case_id, text, ref, risk_analysis in rows:
+            if ref is not None or not text:
+                continue
+            data = json.loads(text)
+            # Only plain json.dumps output with a matching risk_analysis column; anything else stays inline
+            if json.dumps(data) == text and json.dumps(data.get('risk_analysis')) == risk_analysis:
+                ref, _ = store_enriched(conn, data)
+                if ref is not None:
+                    conn.execute('UPDATE cases SET enriched_data = NULL, enriched_ref = ? WHERE id = ?', (ref, case_id))
+                    moved += 1
+        conn.commit()
+        last_id = rows[-1][0]
@@ -0,0 +1,259 @@
+"""Materialized case view.
+
+Everything `GET /api/cases/<id>` derives from a case (compliance result, governance
+checks, evidence pack summaries, audit/intervention/evidence lists) is computed when
+the case is written and patched by each mutating route, so a read is one indexed
+lookup. The large `enriched_data` payload is never parsed on read: the response body is
+assembled from raw JSON text, the KYC blob (see blobs.py) or, for cases stored inline,
+a slice at the offsets recorded in the view. The transaction history is not part of the
+body: the caller passes in a timeline of its summary and first page (archive.py), and
+the rest is paged through `GET /api/cases/<id>/transactions`. Likewise the view keeps only
+the newest VIEW_AUDIT_ROWS audit rows; older ones are paged through `GET /api/audit`.
+"""
+
+import json
+from datetime import datetime
+from compliance import check_compliance, recheck_narrative, governance_checks
+from changefeed import record_change
+from blobs import enriched_text, load_customer_data
+from links import network as identifier_network
+
+CASE_VIEW_SCHEMA = '''CREATE TABLE IF NOT EXISTS case_views (
+    case_id INTEGER PRIMARY KEY,
+    alert_type TEXT,
+    version INTEGER NOT NULL DEFAULT 1,
+    case_json TEXT,
+    view TEXT,
+    evidence_pack TEXT,
+    txn_start INTEGER,
+    txn_end INTEGER,
+    kyc_start INTEGER,
+    kyc_end INTEGER,
+    typology_confirmed INTEGER DEFAULT 0,
+    evidence_linked INTEGER DEFAULT 0,
+    evidence_valid INTEGER DEFAULT 0,
+    disposition_count INTEGER DEFAULT 0,
+    hold_count INTEGER DEFAULT 0,
+    updated_at TEXT,
+    FOREIGN KEY (case_id) REFERENCES cases(id)
+)'''
+
+BLOB_COLUMNS = ('enriched_data', 'enriched_ref', 'risk_analysis')
+VIEW_AUDIT_ROWS = 50
+
+def migrate_case_views(c):
+    """Add columns newer than an existing case_views table, filled from the base tables."""
+    if 'evidence_valid' not in {row[1] for row in c.execute('PRAGMA table_info(case_views)')}:
+        c.execute('ALTER TABLE case_views ADD COLUMN evidence_valid INTEGER DEFAULT 0')
+        c.execute('''UPDATE case_views SET evidence_valid = EXISTS (
+                         SELECT 1 FROM reason_evidence r WHERE r.case_id = case_views.case_id
+                         AND CASE WHEN json_valid(r.evidence_ids) THEN json_array_length(r.evidence_ids) END > 0)''')
+
+def dump_enriched(enriched_data):
+    """Serialize exactly like json.dumps(enriched_data) and return the span of each top-level value."""
+    parts = ['{']
+    length = 1
+    spans = {}
+    for i, (key, value) in enumerate(enriched_data.items()):
+        prefix = (', ' if i else '') + json.dumps(key) + ': '
+        encoded = json.dumps(value)
+        parts.append(prefix)
+        parts.append(encoded)
+        start = length + len(prefix)
+        length = start + len(encoded)
+        spans[key] = (start, length)
+    parts.append('}')
+    return ''.join(parts), spans
+
+def build_evidence_pack(customer_id, txn_history, network=None):
+    """`network` is the customer's entry in the identifier graph (links.network)."""
+    network = network or {}
+    total_volume = 0
+    deposit_count = 0
+    withdrawal_count = 0
+    ips = []
+    for t in txn_history:
+        total_volume += t['amount']
+        if t['type'] == 'deposit':
+            deposit_count += 1
+        elif t['type'] == 'withdrawal':
+            withdrawal_count += 1
+        if t.get('ip'):
+            ips.append(t['ip'])
+
+    return {
+        'trading_summary': {
+            'total_transactions': len(txn_history),
+            'total_volume': total_volume,
+            'deposit_count': deposit_count,
+            'withdrawal_count': withdrawal_count,
+        },
+        'network_links': {
+            'shared_ips': list(set(ips)),
+            'device_fingerprints': network.get('identifiers', {}).get('device', []),
+            'linked_accounts': network.get('linked_accounts', []),
+            'linked_count': network.get('linked_count', 0),
+            'network_size': network.get('network_size', 1)
+        },
+        'device_logs': [
+            {'timestamp': txn_history[0]['timestamp'], 'device': 'iPhone 14', 'ip': txn_history[0]['ip'], 'location': 'New York, NY'},
+            {'timestamp': txn_history[-1]['timestamp'], 'device': 'iPhone 14', 'ip': txn_history[-1]['ip'], 'location': 'New York, NY'}
+        ] if txn_history else []
+    }
+
+def _governance(view, flags):
+    return governance_checks(flags['typology_confirmed'], flags['evidence_linked'], flags['disposition_count'],
+                             flags['hold_count'], view['case']['status'], view['compliance_score'])
+
+def write_case_view(conn, case, alert, enriched_data, spans, reason_evidence, audit_logs=(), interventions=(),
+                    disposition_count=0, hold_count=0):
+    """Create (or replace) the view for a freshly written case. `case` excludes the blob columns."""
+    compliance_score, missing_fields, sar_required_fields = check_compliance(case['sar_draft'], enriched_data, enriched_data['risk_analysis'])
+    flags = {
+        'typology_confirmed': int(bool(case['typology_confirmed'])),
+        'evidence_linked': int(len(reason_evidence) > 0),
+        # Submission requires a reason whose evidence list is not empty
+        'evidence_valid': int(any(json.loads(r['evidence_ids'] or 'null') for r in reason_evidence)),
+        'disposition_count': disposition_count,
+        'hold_count': hold_count
+    }
+    view = {
+        'case': case,
+        'alert': alert,
+        'audit_logs': list(audit_logs)[:VIEW_AUDIT_ROWS],
+        'audit_logs_truncated': len(audit_logs) > VIEW_AUDIT_ROWS,
+        'interventions': list(interventions),
+        'reason_evidence': list(reason_evidence),
+        'compliance_score': compliance_score,
+        'missing_fields': missing_fields,
+        'sar_required_fields': sar_required_fields
+    }
+    view['governance_checks'] = _governance(view, flags)
+    evidence_pack = build_evidence_pack(alert['customer_id'], enriched_data['txn_history'], identifier_network(conn, alert['customer_id']))
+
+    case_json = json.dumps(view.pop('case'))
+    conn.execute('''INSERT OR REPLACE INTO case_views (case_id, alert_type, version, case_json, view, evidence_pack,
+                        txn_start, txn_end, kyc_start, kyc_end, typology_confirmed, evidence_linked, evidence_valid, disposition_count,
+                        hold_count, updated_at)
+                    VALUES (?, ?, 1, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                 (case['id'], alert['alert_type'], case_json, json.dumps(view), json.dumps(evidence_pack),
+                  spans['txn_history'][0], spans['txn_history'][1], spans['customer_data'][0], spans['customer_data'][1],
+                  flags['typology_confirmed'], flags['evidence_linked'], flags['evidence_valid'], disposition_count, hold_count,
+                  datetime.now().isoformat()))
+
+def rebuild_case_view(conn, case_id, staged_audit=()):
+    """Build the view from the base tables (cases created before views existed, or repair).
+    `staged_audit` holds newer audit rows the caller's unit of work has not inserted yet."""
+    case = conn.execute('SELECT * FROM cases WHERE id = ?', (case_id,)).fetchone()
+    if not case:
+        return False
+    alert = conn.execute('SELECT * FROM alerts WHERE id = ?', (case['alert_id'],)).fetchone()
+    enriched_data = json.loads(enriched_text(conn, case))
+    text, spans = dump_enriched(enriched_data)
+    if case['enriched_ref'] is None and text != case['enriched_data']:
+        # Same JSON, different formatting: normalize so the stored offsets are valid
+        conn.execute('UPDATE cases SET enriched_data = ? WHERE id = ?', (text, case_id))
+
+    write_case_view(
+        conn,
+        {k: case[k] for k in case.keys() if k not in BLOB_COLUMNS},
+        dict(alert),
+        enriched_data,
+        spans,
+        [dict(r) for r in conn.execute('SELECT * FROM reason_evidence WHERE case_id = ?', (case_id,))],
+        # One row past the cap tells write_case_view that older rows exist
+        list(staged_audit) + [dict(r) for r in conn.execute('SELECT * FROM audit_log WHERE case_id = ? ORDER BY timestamp DESC LIMIT ?',
+                                                            (case_id, VIEW_AUDIT_ROWS + 1))],
+        [dict(r) for r in conn.execute('SELECT * FROM interventions WHERE case_id = ? ORDER BY timestamp DESC', (case_id,))],
+        conn.execute('SELECT COUNT(*) FROM analyst_feedback WHERE case_id = ?', (case_id,)).fetchone()[0],
+        conn.execute('SELECT COUNT(*) FROM interventions WHERE case_id = ? AND action = "hold_withdrawal"', (case_id,)).fetchone()[0]
+    )
+    return True
+
+def update_case_view(conn, case_id, case_fields=None, audit=None, intervention=None,
+                     sar_draft=None, typology_confirmed=None, add_disposition=False):
+    """Apply one mutation to the view. Call after the base-table writes, inside the same transaction."""
+    row = conn.execute('SELECT * FROM case_views WHERE case_id = ?', (case_id,)).fetchone()
+    if not row:
+        # No view yet: building from the base tables already reflects this mutation
+        if not rebuild_case_view(conn, case_id, [audit] if audit else ()):
+            return False
+        record_change(conn, 'case', {'op': 'rebuilt', 'case_id': case_id}, case_id=case_id)
+        return True
+
+    case = json.loads(row['case_json'])
+    view = json.loads(row['view'])
+    view['case'] = case
+    flags = {k: row[k] for k in ('typology_confirmed', 'evidence_linked', 'disposition_count', 'hold_count')}
+
+    if case_fields:
+        case.update(case_fields)
+    if audit:
+        view['audit_logs'].insert(0, audit)
+        if len(view['audit_logs']) > VIEW_AUDIT_ROWS:
+            del view['audit_logs'][VIEW_AUDIT_ROWS:]
+            view['audit_logs_truncated'] = True
+    if intervention:
+        view['interventions'].insert(0, intervention)
+        if intervention['action'] == 'hold_withdrawal':
+            flags['hold_count'] += 1
+    if sar_draft is not None:
+        case['sar_draft'] = sar_draft
+        view['compliance_score'], view['missing_fields'], view['sar_required_fields'] = recheck_narrative(view['sar_required_fields'], sar_draft)
+    if typology_confirmed is not None:
+        flags['typology_confirmed'] = int(bool(typology_confirmed))
+    if add_disposition:
+        flags['disposition_count'] += 1
+    view['governance_checks'] = _governance(view, flags)
+
+    # The delta a live case page applies instead of re-reading the case
+    delta = {'op': 'updated', 'case_id': case_id, 'case': dict(case_fields or {}), 'governance_checks': view['governance_checks']}
+    if audit:
+        delta['audit_log'] = audit
+    if intervention:
+        delta['intervention'] = intervention
+    if sar_draft is not None:
+        delta['case']['sar_draft'] = sar_draft
+        delta.update({k: view[k] for k in ('compliance_score', 'missing_fields', 'sar_required_fields')})
+    if typology_confirmed is not None:
+        delta['case']['typology_confirmed'] = flags['typology_confirmed']
+    record_change(conn, 'case', delta, alert_id=view['alert']['id'], case_id=case_id)
+
+    view.pop('case')
+    conn.execute('''UPDATE case_views SET version = version + 1, case_json = ?, view = ?, typology_confirmed = ?,
+                        disposition_count = ?, hold_count = ?, updated_at = ? WHERE case_id = ?''',
+                 (json.dumps(case), json.dumps(view), flags['typology_confirmed'], flags['disposition_count'],
+                  flags['hold_count'], datetime.now().isoformat(), case_id))
+    return True
+
+def case_view_version(conn, case_id):
+    """(version, alert_type) for ETag checks, building the view on first read if needed."""
+    row = conn.execute('SELECT version, alert_type FROM case_views WHERE case_id = ?', (case_id,)).fetchone()
+    if row is None:
+        with conn:
+            if not rebuild_case_view(conn, case_id):
+                return None
+        row = conn.execute('SELECT version, alert_type FROM case_views WHERE case_id = ?', (case_id,)).fetchone()
+    return row['version'], row['alert_type']
+
+def render_case_view(conn, case_id, extra, timeline):
+    """Return the case response body as JSON text. `extra` holds small top-level fields added per read,
+    `timeline` the JSON text of the transaction timeline."""
+    row = conn.execute('''SELECT v.case_json, v.view, v.evidence_pack, c.enriched_ref, c.risk_analysis,
+                                 CASE WHEN c.enriched_ref IS NULL THEN substr(c.enriched_data, v.kyc_start + 1, v.kyc_end - v.kyc_start) END AS kyc
+                          FROM case_views v JOIN cases c ON c.id = v.case_id WHERE v.case_id = ?''', (case_id,)).fetchone()
+    kyc = row['kyc'] if row['enriched_ref'] is None else load_customer_data(conn, row['enriched_ref'])
+    return ''.join((
+        '{"case": {"risk_analysis": ', json.dumps(row['risk_analysis']), ', ', row['case_json'][1:],
+        ', "enriched_data": {"customer_data": ', kyc, ', "risk_analysis": ', row['risk_analysis'], '}',
+        ', "risk_analysis": ', row['risk_analysis'],
+        ', "evidence_pack": {"transaction_timeline": ', timeline,
+        ', "kyc_snapshot": ', kyc, ', ', row['evidence_pack'][1:],
+        ', ', json.dumps(extra)[1:-1],
+        ', ', row['view'][1:]
+    ))
+
+def set_view_alert_status(conn, alert_id, status):
+    """Propagate an alert status change to the views of every case opened on that alert."""
+    conn.execute('''UPDATE case_views SET view = json_set(view, '$.alert.status', ?), version = version + 1
+                    WHERE case_id IN (SELECT id FROM cases WHERE alert_id = ?)''', (status, alert_id))
@@ -0,0 +1,183 @@
+"""Change feed: row-level deltas for live pages.
+
+Each write a page displays also records a row in `changes` inside its own transaction:
+alert creation and status changes, audit rows, case mutations and threshold moves.
+SQLite has a single writer, so change ids are gap-free in commit order and serve as
+resume tokens (the SSE event id).
+
+ChangeBus is the in-process pub/sub side. One tailer thread reads new `changes` rows,
+woken right after local commits and on a short poll for other processes' writes. It
+keeps the most recent ones in memory and fans them out to subscriber queues. However
+many pages are open, the database sees one indexed range read per batch of changes.
+Listeners registered with `listen` run on the tailer for every change of their topic;
+this is how in-process caches hear about writes made by other server workers.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque, namedtuple
+from datetime import datetime
+
+FEED_POLL = float(os.environ.get('SIGNALSAR_FEED_POLL_MS', 250)) / 1000
+FEED_RETENTION = int(os.environ.get('SIGNALSAR_FEED_RETENTION', 100000))   # change rows kept for resuming
+FEED_BUFFER = 4096          # recent changes held in memory for reconnecting clients
+FEED_BATCH = 1000
+SUBSCRIBER_QUEUE = 1000     # a client this far behind is disconnected and resumes from its last id
+PRUNE_INTERVAL = 60
+
+logger = logging.getLogger(__name__)
+
+TOPICS = ('alert', 'case', 'audit', 'threshold')
+
+CHANGES_SCHEMA = '''CREATE TABLE IF NOT EXISTS changes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    topic TEXT NOT NULL,
+    alert_id INTEGER,
+    case_id INTEGER,
+    data TEXT NOT NULL,
+    created_at TEXT NOT NULL
+)'''
+
+INSERT_CHANGE = 'INSERT INTO changes (topic, alert_id, case_id, data, created_at) VALUES (?, ?, ?, ?, ?)'
+
+Change = namedtuple('Change', 'id topic alert_id case_id data')
+
+def record_change(conn, topic, data, alert_id=None, case_id=None):
+    """Record a delta. Call inside the transaction that made the change."""
+    conn.execute(INSERT_CHANGE, (topic, alert_id, case_id, json.dumps(data), datetime.now().isoformat()))
+
+def latest_change_id(conn):
+    return conn.execute('SELECT MAX(id) FROM changes').fetchone()[0] or 0
+
+def read_changes(conn, after, upto):
+    """Changes with after < id <= upto, or None if some of them were already pruned."""
+    oldest = conn.execute('SELECT MIN(id) FROM changes').fetchone()[0]
+    if oldest is None or oldest > after + 1:
+        return None if upto > after else []
+    return [Change(*row) for row in conn.execute(
+        'SELECT id, topic, alert_id, case_id, data FROM changes WHERE id > ? AND id <= ? ORDER BY id', (after, upto))]
+
+def format_event(change):
+    return f'id: {change.id}\nevent: {change.topic}\ndata: {change.data}\n\n'
+
+class Subscription:
+    def __init__(self, topics=TOPICS, alert_id=None, case_id=None):
+        self.topics = frozenset(topics)
+        self.alert_id = alert_id
+        self.case_id = case_id
+        self.overflowed = False
+        self._queue = queue.Queue(SUBSCRIBER_QUEUE)
+
+    def accepts(self, change):
+        # A change without an alert/case id (e.g. a threshold move) passes that filter
+        return (change.topic in self.topics
+                and (self.alert_id is None or change.alert_id is None or change.alert_id == self.alert_id)
+                and (self.case_id is None or change.case_id is None or change.case_id == self.case_id))
+
+    def offer(self, change):
+        try:
+            self._queue.put_nowait(change)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class ChangeBus:
+    def __init__(self, connect, poll=FEED_POLL, buffer=FEED_BUFFER):
+        self.connect = connect
+        self.poll = poll
+        self.last_id = 0
+        self._recent = deque(maxlen=buffer)
+        self._subscribers = set()
+        self._listeners = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def notify(self):
+        """Wake the tailer; call after committing changes in this process."""
+        self._wakeup.set()
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def listen(self, topic, callback):
+        """Call `callback(change)` on the tailer thread for each new change of `topic`,
+        from this process or any other."""
+        self._listeners.setdefault(topic, []).append(callback)
+
+    def subscribe(self, subscription, after):
+        """Register `subscription` and return (missed, upto): changes in (after, upto] from
+        memory, and the id from which the subscription's queue takes over. `missed` is None
+        when those changes are no longer in memory (read them with read_changes)."""
+        self.start()
+        with self._lock:
+            self._subscribers.add(subscription)
+            upto = self.last_id
+            if after >= upto:
+                return [], upto
+            if self._recent and self._recent[0].id <= after + 1:
+                return [c for c in self._recent if c.id > after], upto
+            return None, upto
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def start(self):
+        # Started per process (on first use, or by app.start_background) so forked server workers each get their own tailer
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    conn = self.connect()
+                    self.last_id = latest_change_id(conn)
+                    self._recent.clear()
+                    self._thread = threading.Thread(target=self._loop, args=(conn,), name='change-feed', daemon=True)
+                    self._thread.start()
+
+    def _loop(self, conn):
+        last_prune = time.monotonic()
+        while True:
+            self._wakeup.wait(self.poll)
+            self._wakeup.clear()
+            try:
+                while self._fan_out(conn):
+                    pass
+                if time.monotonic() - last_prune > PRUNE_INTERVAL:
+                    conn.execute('DELETE FROM changes WHERE id <= ?', (self.last_id - FEED_RETENTION,))
+                    conn.commit()
+                    last_prune = time.monotonic()
+            except Exception:
+                if conn.in_transaction:
+                    conn.rollback()
+                logger.exception('Change feed read failed')
+
+    def _fan_out(self, conn):
+        changes = [Change(*row) for row in conn.execute(
+            'SELECT id, topic, alert_id, case_id, data FROM changes WHERE id > ? ORDER BY id LIMIT ?', (self.last_id, FEED_BATCH))]
+        if not changes:
+            return False
+        with self._lock:
+            self._recent.extend(changes)
+            self.last_id = changes[-1].id
+            subscribers = list(self._subscribers)
+        for change in changes:
+            for callback in self._listeners.get(change.topic, ()):
+                try:
+                    callback(change)
+                except Exception:
+                    logger.exception('Change feed listener failed')
+        for subscription in subscribers:
+            for change in changes:
+                if subscription.accepts(change):
+                    subscription.offer(change)
+        return len(changes) == FEED_BATCH
@@ -0,0 +1,38 @@
+"""SAR compliance scoring and the governance gate."""
+
+def score_required_fields(required_fields):
+    missing_fields = [k for k, v in required_fields.items() if not v or (isinstance(v, list) and len(v) == 0)]
+    present_count = len(required_fields) - len(missing_fields)
+    compliance_score = int((present_count / len(required_fields)) * 100)
+    return compliance_score, missing_fields
+
+def check_compliance(sar_draft, enriched_data, risk_analysis):
+    required_fields = {
+        'customer_id': enriched_data.get('customer_data', {}).get('customer_id'),
+        'account_number': enriched_data.get('customer_data', {}).get('account_number'),
+        'customer_name': enriched_data.get('customer_data', {}).get('name'),
+        'transaction_count': len(enriched_data.get('txn_history', [])),
+        'total_amount': sum(t['amount'] for t in enriched_data.get('txn_history', [])),
+        'time_period': f"{enriched_data.get('txn_history', [{}])[0].get('timestamp', '')[:10]} to {enriched_data.get('txn_history', [{}])[-1].get('timestamp', '')[:10]}" if enriched_data.get('txn_history') else None,
+        'suspicious_pattern_reasons': risk_analysis.get('reasons', []),
+        'narrative_text': sar_draft
+    }
+    
+    compliance_score, missing_fields = score_required_fields(required_fields)
+    return compliance_score, missing_fields, required_fields
+
+def recheck_narrative(required_fields, sar_draft):
+    """Re-score after a narrative edit; every other required field is fixed once the case exists."""
+    required_fields = dict(required_fields, narrative_text=sar_draft)
+    compliance_score, missing_fields = score_required_fields(required_fields)
+    return compliance_score, missing_fields, required_fields
+
+def governance_checks(typology_confirmed, evidence_linked, disposition_count, hold_count, case_status, compliance_score):
+    checks = {
+        'typology_confirmed': bool(typology_confirmed),
+        'evidence_linked': bool(evidence_linked),
+        'analyst_disposition': disposition_count > 0,
+        'no_pending_interventions': hold_count == 0 or case_status == 'intervened'
+    }
+    checks['can_submit'] = all(checks.values()) and compliance_score == 100
+    return checks
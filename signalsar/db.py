@@ -0,0 +1,143 @@
+"""SQLite connection management: a bounded pool shared by every route and helper."""
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, current_app, has_app_context
+from metrics import CONNECTION_FACTORY, collector, pool_wait_seconds, record
+
+DB_PATH = os.environ.get('SIGNALSAR_DB', 'signalsar.db')
+POOL_SIZE = int(os.environ.get('SIGNALSAR_DB_POOL_SIZE', 8))
+POOL_TIMEOUT = float(os.environ.get('SIGNALSAR_DB_POOL_TIMEOUT', 30))
+
+# Applied to every new connection. WAL lets readers run alongside the single writer,
+# and synchronous=NORMAL is durable under WAL while skipping an fsync per commit.
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -16000),       # ~16 MB page cache per connection
+    ('mmap_size', 268435456),     # 256 MB memory-mapped I/O
+    ('temp_store', 'MEMORY'),
+    ('busy_timeout', 5000),
+)
+
+class PoolTimeout(sqlite3.OperationalError):
+    pass
+
+def open_connection(path):
+    """A new configured connection, outside any pool (long-lived worker threads)."""
+    conn = sqlite3.connect(path, check_same_thread=False, factory=CONNECTION_FACTORY)
+    conn.row_factory = sqlite3.Row
+    for name, value in PRAGMAS:
+        conn.execute(f'PRAGMA {name} = {value}')
+    return conn
+
+class ConnectionPool:
+    def __init__(self, path, max_size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.path = path
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = []
+        self._in_use = 0
+        self._waiting = 0
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    def _connect(self):
+        return open_connection(self.path)
+
+    def acquire(self):
+        started = time.perf_counter()
+        with self._lock:
+            self._waiting += 1
+        acquired = self._slots.acquire(timeout=self.timeout)
+        waited = time.perf_counter() - started
+        with self._lock:
+            self._waiting -= 1
+            self._in_use += acquired
+        pool_wait_seconds.observe(waited)
+        record('db-wait', waited)
+        if not acquired:
+            raise PoolTimeout(f'No free database connection after {self.timeout}s')
+        try:
+            with self._lock:
+                if self._idle:
+                    return self._idle.pop()
+            return self._connect()
+        except Exception:
+            self._release_slot()
+            raise
+
+    def _release_slot(self):
+        with self._lock:
+            self._in_use -= 1
+        self._slots.release()
+
+    def usage(self):
+        with self._lock:
+            return {'in_use': self._in_use, 'idle': len(self._idle), 'waiting': self._waiting, 'max': self.max_size}
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            with self._lock:
+                self._idle.append(conn)
+        except sqlite3.Error:
+            conn.close()
+        finally:
+            self._release_slot()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(path=None):
+    if path is None:
+        path = current_app.config['DATABASE'] if has_app_context() else DB_PATH
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            pool = _pools[path] = ConnectionPool(path)
+        return pool
+
+@collector('signalsar_db_pool_connections', 'Pooled connections by state (waiting: callers blocked on a full pool)',
+           labels=('path', 'state'))
+def _pool_usage():
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {(pool.path, state): count for pool in pools for state, count in pool.usage().items()}
+
+def connection(path=None):
+    """Borrow a pooled connection outside of a request (scripts, workers)."""
+    return get_pool(path).connection()
+
+def get_db():
+    """Return the connection bound to the current request, checking one out on first use."""
+    if 'db_conn' not in g:
+        g.db_conn = get_pool().acquire()
+    return g.db_conn
+
+def release_db(exc=None):
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        get_pool().release(conn)
+
+def init_app(app):
+    app.config.setdefault('DATABASE', DB_PATH)
+    app.teardown_appcontext(release_db)
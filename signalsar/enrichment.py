@@ -0,0 +1,243 @@
+"""Enrichment data sources for investigations.
+
+A provider supplies the customer (KYC) profile and the transaction history for a
+customer. The Enricher fetches both concurrently with per-source timeouts and keeps
+customer profiles in a TTL/LRU cache so repeat investigations skip the KYC call.
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import datetime, timedelta
+
+KYC_TIMEOUT = float(os.environ.get('SIGNALSAR_KYC_TIMEOUT', 2.0))
+TXN_TIMEOUT = float(os.environ.get('SIGNALSAR_TXN_TIMEOUT', 5.0))
+PROFILE_CACHE_SIZE = int(os.environ.get('SIGNALSAR_PROFILE_CACHE_SIZE', 10000))
+PROFILE_CACHE_TTL = float(os.environ.get('SIGNALSAR_PROFILE_CACHE_TTL', 300))
+
+class EnrichmentError(Exception):
+    pass
+
+class EnrichmentTimeout(EnrichmentError):
+    def __init__(self, source, timeout):
+        super().__init__(f'{source} lookup timed out after {timeout}s')
+        self.source = source
+
+# Mock data generators
+def get_mock_customer_data(customer_id):
+    return {
+        'customer_id': customer_id,
+        'name': f'John Doe {customer_id[-4:]}',
+        'account_number': f'ACC-{customer_id[-4:]}-9821',
+        'email': f'customer{customer_id[-4:]}@example.com',
+        'phone': '+1-555-0100',
+        'address': '123 Main St, New York, NY 10001',
+        'occupation': 'Software Engineer',
+        'onboarded_date': '2024-03-15',
+        'risk_rating': 'Medium'
+    }
+
+def get_mock_txn_history(customer_id):
+    txns = []
+    base_time = datetime.now()
+
+    # NEW TYPOLOGY: micro-transaction pattern
+    if customer_id == 'CUST-4455':
+        for i in range(47):
+            txn_type = random.choice(['deposit', 'withdrawal'])
+            txns.append({
+                'id': f'TXN-{i+2000}',
+                'type': txn_type,
+                'amount': random.randint(350, 500),
+                'timestamp': (base_time - timedelta(days=random.randint(0, 3))).isoformat(),
+                'ip': random.choice(['10.5.5.1', '10.5.5.1', '10.5.5.2']),
+                'description': f'Micro {txn_type}'
+            })
+        return sorted(txns, key=lambda x: x['timestamp'])
+
+    for i in range(25):
+        txn_type = random.choice(['deposit', 'trade', 'withdrawal', 'deposit', 'trade'])
+        txns.append({
+            'id': f'TXN-{i+1000}',
+            'type': txn_type,
+            'amount': random.randint(5000, 25000),
+            'timestamp': (base_time - timedelta(days=random.randint(0, 90))).isoformat(),
+            'ip': random.choice(['192.168.1.1', '192.168.1.2', '10.0.0.5']),
+            'description': f'{txn_type.title()} transaction'
+        })
+
+    return sorted(txns, key=lambda x: x['timestamp'])
+
+class EnrichmentProvider(ABC):
+    """A source of customer profiles and transaction histories. `fetch_customer` returns the
+    profile dict; `fetch_transactions` returns the history as transaction dicts (`id`, `type`,
+    `amount`, `timestamp`, `ip`, ...), oldest first. Both raise EnrichmentError for a customer
+    the source does not know. The Enricher calls them from its worker threads."""
+    name = 'base'
+
+    @abstractmethod
+    def fetch_customer(self, customer_id):
+        pass
+
+    @abstractmethod
+    def fetch_transactions(self, customer_id):
+        pass
+
+class MockProvider(EnrichmentProvider):
+    name = 'mock'
+
+    def fetch_customer(self, customer_id):
+        return get_mock_customer_data(customer_id)
+
+    def fetch_transactions(self, customer_id):
+        return get_mock_txn_history(customer_id)
+
+class LocalFileProvider(EnrichmentProvider):
+    """Stand-in for the KYC service and transaction store backed by a directory:
+    `<root>/customers/<customer_id>.json` and `<root>/transactions/<customer_id>.json`."""
+    name = 'file'
+
+    def __init__(self, root):
+        self.root = root
+
+    def _load(self, kind, customer_id):
+        path = os.path.join(self.root, kind, f'{customer_id}.json')
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise EnrichmentError(f'No {kind} record for {customer_id}')
+
+    def fetch_customer(self, customer_id):
+        return self._load('customers', customer_id)
+
+    def fetch_transactions(self, customer_id):
+        return sorted(self._load('transactions', customer_id), key=lambda x: x['timestamp'])
+
+class StoredTransactionsProvider(EnrichmentProvider):
+    """Transaction histories from the `transactions` table (bulk ingest, ingest.py) for
+    customers that have any; everything else comes from `provider`."""
+
+    def __init__(self, provider, path):
+        self.provider = provider
+        self.name = provider.name
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            from db import open_connection
+            conn = self._local.conn = open_connection(self.path)
+        return conn
+
+    def fetch_customer(self, customer_id):
+        return self.provider.fetch_customer(customer_id)
+
+    def fetch_transactions(self, customer_id):
+        from ingest import stored_history
+        history = stored_history(self._conn(), customer_id)
+        return self.provider.fetch_transactions(customer_id) if history is None else history
+
+class TTLCache:
+    def __init__(self, maxsize=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+class Enricher:
+    def __init__(self, provider, kyc_timeout=KYC_TIMEOUT, txn_timeout=TXN_TIMEOUT, cache=None, max_workers=8):
+        self.provider = provider
+        self.kyc_timeout = kyc_timeout
+        self.txn_timeout = txn_timeout
+        self.profiles = cache if cache is not None else TTLCache()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='enrich')
+
+    def _customer(self, customer_id):
+        profile = self.profiles.get(customer_id)
+        if profile is None:
+            profile = self.provider.fetch_customer(customer_id)
+            self.profiles.set(customer_id, profile)
+        return dict(profile)
+
+    def enrich(self, customer_id):
+        """Return (customer_data, txn_history), fetching both sources concurrently."""
+        started = time.monotonic()
+        cached = self.profiles.get(customer_id)
+        customer_future = None if cached is not None else self._executor.submit(self._customer, customer_id)
+        txn_future = self._executor.submit(self.provider.fetch_transactions, customer_id)
+
+        if customer_future is None:
+            customer_data = dict(cached)
+        else:
+            customer_data = self._wait(customer_future, 'KYC', self.kyc_timeout, started)
+        txn_history = self._wait(txn_future, 'Transaction store', self.txn_timeout, started)
+        return customer_data, txn_history
+
+    @staticmethod
+    def _wait(future, source, timeout, started):
+        try:
+            return future.result(timeout=max(0, timeout - (time.monotonic() - started)))
+        except FutureTimeout:
+            future.cancel()
+            raise EnrichmentTimeout(source, timeout)
+
+def provider_from_env(path):
+    """The provider named by SIGNALSAR_ENRICHMENT, over ingested transactions in the database at `path`."""
+    spec = os.environ.get('SIGNALSAR_ENRICHMENT', 'mock')
+    if spec.startswith('file:'):
+        return StoredTransactionsProvider(LocalFileProvider(spec[len('file:'):]), path)
+    return StoredTransactionsProvider(MockProvider(), path)
+
+_enrichers = {}
+_enricher_lock = threading.Lock()
+
+def get_enricher(path=None):
+    """The Enricher reading ingested transactions from the database at `path`; defaults to the
+    current app's database, or db.DB_PATH outside an app context."""
+    if path is None:
+        from flask import current_app, has_app_context
+        from db import DB_PATH
+        path = current_app.config['DATABASE'] if has_app_context() else DB_PATH
+    enricher = _enrichers.get(path)
+    if enricher is None:
+        with _enricher_lock:
+            enricher = _enrichers.get(path)
+            if enricher is None:
+                enricher = _enrichers[path] = Enricher(provider_from_env(path))
+    return enricher
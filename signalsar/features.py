@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""Per-customer feature store.
+
+The aggregates the typology rules read (transaction count and deposit/withdrawal totals
+over the 90-day history, each rule's windowed `counts`, distinct IPs, the last
+deposit→withdrawal gap) are kept up to date as transactions are ingested, so scoring
+reads a handful of stored numbers instead of rescanning a customer's history.
+
+Ingested transactions are added into hourly buckets (`feature_buckets`). A customer's
+`customer_features` row holds every window total as of one bucket; moving the totals to
+a later hour subtracts just the buckets that slid out of each window, so each bucket is
+added once and removed once. Windows are exact to the hour: a stored count can differ
+from a column scan by the transactions in the oldest, partly covered hour.
+
+Distinct IPs are exact rather than sketched (`customer_ips`, last sighting per IP), as a
+customer has few. The deposit→withdrawal gap depends on order; a batch older than what
+was already ingested marks it unknown and scoring computes it from the history. The
+linked accounts (their count and the first few ids) are read from the identifier graph
+(links.py) with the features.
+
+The counters follow the rule set, so changing a rule's `counts` invalidates stored
+features (scoring falls back to the columns) until they are rebuilt:
+
+    python features.py rebuild [--customer CUST-1234 ...]
+"""
+
+import argparse
+import hashlib
+import json
+from collections import namedtuple
+from datetime import datetime
+import numpy as np
+
+from scoring import EPOCH, ONE_US, DAY_US, DEPOSIT, WITHDRAWAL, AGGREGATES, TxnColumns, RuleContext, rule_engine
+from links import LINKED_LIMIT, linked_accounts
+
+HISTORY_DAYS = 90
+BUCKET_US = 3600 * 1000000
+BUCKETS_PER_DAY = DAY_US // BUCKET_US
+REBUILD_BATCH = 200
+STORAGE_FORMAT = 'float64'  # totals and bucket counts: one float64 per counter, packed
+
+FEATURES_SCHEMA = '''CREATE TABLE IF NOT EXISTS customer_features (
+    customer_id TEXT PRIMARY KEY,
+    signature TEXT NOT NULL,
+    as_of INTEGER NOT NULL,
+    totals BLOB NOT NULL,
+    last_txn_at INTEGER,
+    last_deposit_at INTEGER,
+    last_dw_gap REAL,
+    ordered INTEGER NOT NULL DEFAULT 1,
+    updated_at TEXT NOT NULL
+) WITHOUT ROWID'''
+
+FEATURE_BUCKETS_SCHEMA = '''CREATE TABLE IF NOT EXISTS feature_buckets (
+    customer_id TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    counts BLOB NOT NULL,
+    PRIMARY KEY (customer_id, bucket)
+) WITHOUT ROWID'''
+
+CUSTOMER_IPS_SCHEMA = '''CREATE TABLE IF NOT EXISTS customer_ips (
+    customer_id TEXT NOT NULL,
+    ip TEXT NOT NULL,
+    last_seen INTEGER NOT NULL,
+    PRIMARY KEY (customer_id, ip)
+) WITHOUT ROWID'''
+
+FEATURE_SCHEMAS = (FEATURES_SCHEMA, FEATURE_BUCKETS_SCHEMA, CUSTOMER_IPS_SCHEMA)
+
+# key: feature name scoring reads; window: buckets covered; values(context): per-transaction amount to add
+Counter = namedtuple('Counter', 'key window values integral')
+
+def _window(days):
+    # (now - ts).days <= days, to the hour
+    return (days + 1) * BUCKETS_PER_DAY
+
+def feature_counters(engine=rule_engine):
+    history = _window(HISTORY_DAYS)
+    counters = [
+        Counter('txn_count', history, lambda a: np.ones(len(a['ids'])), True),
+        Counter('total_in', history, lambda a: a['amounts'] * a['is_deposit'], False),
+        Counter('total_out', history, lambda a: a['amounts'] * a['is_withdrawal'], False),
+    ]
+    for rule in engine.rules:
+        for name, mask in rule.count_masks.items():
+            counters.append(Counter(rule.count_key(name), _window(rule.window_days), mask, True))
+    return counters
+
+def counters_signature(engine=rule_engine):
+    # Stored totals are only meaningful for the counters (and their definitions) they were built with
+    spec = [(c.key, c.window) for c in feature_counters(engine)]
+    spec += [(rule.code, rule.spec.get('counts'), rule.spec.get('aggregates'), rule.constants)
+             for rule in engine.rules if rule.counts]
+    spec.append(AGGREGATES)
+    spec.append(STORAGE_FORMAT)
+    return hashlib.sha1(json.dumps(spec, sort_keys=True, default=str).encode()).hexdigest()
+
+def _now_us(now=None):
+    return ((now or datetime.now()) - EPOCH) // ONE_US
+
+def _json_ids(values):
+    return json.dumps(list(values))
+
+class CustomerState:
+    __slots__ = ('customer_id', 'as_of', 'totals', 'last_txn_at', 'last_deposit_at', 'last_dw_gap', 'ordered')
+
+    def __init__(self, customer_id, row, counters):
+        self.customer_id = customer_id
+        if row is None:
+            self.as_of = None
+            self.totals = np.zeros(len(counters))
+            self.last_txn_at = self.last_deposit_at = self.last_dw_gap = None
+            self.ordered = True
+        else:
+            self.as_of = row['as_of']
+            self.totals = np.frombuffer(row['totals']).copy()
+            self.last_txn_at = row['last_txn_at']
+            self.last_deposit_at = row['last_deposit_at']
+            self.last_dw_gap = row['last_dw_gap']
+            self.ordered = bool(row['ordered'])
+
+    def row(self, signature, updated_at):
+        return (self.customer_id, signature, self.as_of, self.totals.tobytes(), self.last_txn_at, self.last_deposit_at,
+                self.last_dw_gap, int(self.ordered), updated_at)
+
+def roll(conn, states, counters, current):
+    """Move the window totals of `states` forward to bucket `current`. Returns the states
+    whose totals changed, with the bucket they were at before."""
+    windows = np.array([c.window for c in counters])
+    moved, ranges = [], []
+    for state in states:
+        if state.as_of is not None and current <= state.as_of:
+            continue
+        moved.append((state, state.as_of))
+        if state.as_of is None:
+            state.as_of = current
+            continue
+        # Buckets leaving counter j's window: (as_of - window_j, current - window_j]
+        for window in sorted(set(windows.tolist()), reverse=True):
+            if ranges and ranges[-1][0] == state.customer_id and ranges[-1][2] >= state.as_of - window:
+                ranges[-1][2] = max(ranges[-1][2], current - window)
+            else:
+                ranges.append([state.customer_id, state.as_of - window, current - window])
+    if ranges:
+        by_id = {state.customer_id: (state, as_of) for state, as_of in moved}
+        for customer_id, bucket, counts in conn.execute(
+                '''SELECT b.customer_id, b.bucket, b.counts FROM json_each(?) AS r
+                   CROSS JOIN feature_buckets AS b ON b.customer_id = json_extract(r.value, '$[0]')
+                        AND b.bucket > json_extract(r.value, '$[1]') AND b.bucket <= json_extract(r.value, '$[2]')''',
+                (json.dumps(ranges),)):
+            state, as_of = by_id[customer_id]
+            state.totals -= np.frombuffer(counts) * ((as_of - windows < bucket) & (bucket <= current - windows))
+    for state, _ in moved:
+        state.as_of = current
+    return moved
+
+SAVE_STATE = '''INSERT OR REPLACE INTO customer_features
+                    (customer_id, signature, as_of, totals, last_txn_at, last_deposit_at, last_dw_gap, ordered, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+
+def _load_states(conn, customer_ids, counters, signature):
+    """(states of customers with current features, ids of customers whose features predate the rule set)."""
+    states, outdated = {}, set()
+    for row in conn.execute('SELECT * FROM customer_features WHERE customer_id IN (SELECT value FROM json_each(?))',
+                            (_json_ids(customer_ids),)):
+        if row['signature'] == signature:
+            states[row['customer_id']] = CustomerState(row['customer_id'], row, counters)
+        else:
+            outdated.add(row['customer_id'])
+    return states, outdated
+
+def ingest(conn, transactions, now=None):
+    """Add transactions (dicts with customer_id, or {customer_id: [txn, ...]}) to the feature
+    store. Call inside the caller's write transaction. Returns {customer_id: features} for the
+    customers updated, as load_features() reads them."""
+    if isinstance(transactions, dict):
+        pairs = [(customer_id, txn) for customer_id, txns in transactions.items() for txn in txns]
+    else:
+        pairs = [(txn['customer_id'], txn) for txn in transactions]
+    return ingest_columns(conn, [customer_id for customer_id, _ in pairs], TxnColumns.from_history([txn for _, txn in pairs]), now)
+
+def ingest_columns(conn, customers, cols, now=None):
+    """ingest() for transactions already in columns, any number of customers at once;
+    `customers[i]` is the customer of transaction i."""
+    if not len(cols):
+        return {}
+    counters = feature_counters()
+    signature = counters_signature()
+    now_us = _now_us(now)
+    current = now_us // BUCKET_US
+    names = list(dict.fromkeys(customers))
+    index = {customer_id: i for i, customer_id in enumerate(names)}
+    owner = np.fromiter(map(index.__getitem__, customers), dtype=np.int64, count=len(customers))
+    states, outdated = _load_states(conn, names, counters, signature)
+    context = RuleContext(cols, current * BUCKET_US)
+    values = np.column_stack([np.broadcast_to(counter.values(context), len(cols)) for counter in counters]).astype(float)
+
+    # Outdated features cannot be patched from one batch; they wait for a rebuild
+    rows = np.flatnonzero(~np.isin(owner, [i for i, name in enumerate(names) if name in outdated]))
+    rows = rows[np.lexsort((cols.timestamps[rows], owner[rows]))]
+    if not len(rows):
+        return {}
+    owners, timestamps = owner[rows], cols.timestamps[rows]
+    buckets = timestamps // BUCKET_US
+    # Rows are in (customer, time) order, so each (customer, hour) is one run
+    starts = np.flatnonzero(np.r_[True, (owners[1:] != owners[:-1]) | (buckets[1:] != buckets[:-1])])
+    group_owner, group_bucket = owners[starts], buckets[starts]
+    added = np.add.reduceat(values[rows], starts, axis=0)
+
+    updated = {}
+    for i in np.unique(group_owner).tolist():
+        updated[i] = states.get(names[i]) or CustomerState(names[i], None, counters)
+    roll(conn, updated.values(), counters, current)
+    # Only buckets inside a counter's window as of `current` count towards its total
+    inside = group_bucket[:, None] > current - np.array([c.window for c in counters])
+    sums = np.zeros((len(names), len(counters)))
+    np.add.at(sums, group_owner, added * inside)
+    for i, state in updated.items():
+        state.totals += sums[i]
+
+    # In a stream that arrives in order, a customer's new hours have no bucket yet
+    last_bucket = np.full(len(names), -1)
+    for i, state in updated.items():
+        if state.last_txn_at is not None:
+            last_bucket[i] = state.last_txn_at // BUCKET_US
+    maybe = np.flatnonzero(group_bucket <= last_bucket[group_owner])
+    existing = {}
+    if len(maybe):
+        existing = {(customer_id, bucket): counts for customer_id, bucket, counts in conn.execute(
+            '''SELECT b.customer_id, b.bucket, b.counts FROM json_each(?) AS k
+               CROSS JOIN feature_buckets AS b ON b.customer_id = json_extract(k.value, '$[0]') AND b.bucket = json_extract(k.value, '$[1]')''',
+            (json.dumps([[names[i], b] for i, b in zip(group_owner[maybe].tolist(), group_bucket[maybe].tolist())]),))}
+    group_names = [names[i] for i in group_owner.tolist()]
+    group_buckets = group_bucket.tolist()
+    width = added.shape[1] * added.itemsize
+    packed = added.tobytes()
+    blobs = [packed[k:k + width] for k in range(0, len(packed), width)]
+    if existing:
+        position = {(group_names[k], group_buckets[k]): k for k in maybe.tolist()}
+        for key, counts in existing.items():
+            k = position[key]
+            blobs[k] = (added[k] + np.frombuffer(counts)).tobytes()
+    conn.executemany('INSERT OR REPLACE INTO feature_buckets (customer_id, bucket, counts) VALUES (?, ?, ?)',
+                     zip(group_names, group_buckets, blobs))
+
+    # Last sighting of each (customer, IP): rows are in time order per customer
+    sighted = np.flatnonzero(cols.ip_ids[rows] >= 0)
+    pairs = owners[sighted] * len(cols.ips) + cols.ip_ids[rows][sighted]
+    _, last = np.unique(pairs[::-1], return_index=True)
+    last = sighted[len(sighted) - 1 - last]
+    conn.executemany('''INSERT INTO customer_ips (customer_id, ip, last_seen) VALUES (?, ?, ?)
+                        ON CONFLICT(customer_id, ip) DO UPDATE SET last_seen = MAX(last_seen, excluded.last_seen)''',
+                     zip([names[i] for i in owners[last].tolist()], [cols.ips[ip] for ip in cols.ip_ids[rows][last].tolist()],
+                         timestamps[last].tolist()))
+
+    # Deposit→withdrawal gap, carried across batches while they arrive in time order
+    types = cols.types[rows]
+    times = timestamps.tolist()
+    bounds = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1], True])
+    index = np.arange(len(rows))
+    deposits = np.where(types == DEPOSIT, index, -1)
+    # Latest deposit at or before each row, if it belongs to the same customer
+    deposit_before = np.maximum.accumulate(deposits)
+    deposit_before[deposit_before < np.repeat(bounds[:-1], np.diff(bounds))] = -1
+    last_withdrawal = np.maximum.reduceat(np.where(types == WITHDRAWAL, index, -1), bounds[:-1]).tolist()
+    last_deposit = np.maximum.reduceat(deposits, bounds[:-1]).tolist()
+    for k, (start, end) in enumerate(zip(bounds[:-1].tolist(), bounds[1:].tolist())):
+        state = updated[owners[start].item()]
+        if state.last_txn_at is not None and times[start] < state.last_txn_at:
+            state.ordered = False
+        if state.ordered:
+            withdrawal = last_withdrawal[k]
+            if withdrawal >= 0:
+                deposit = deposit_before[withdrawal].item()
+                deposit_at = times[deposit] if deposit >= 0 else state.last_deposit_at
+                if deposit_at is not None:
+                    state.last_dw_gap = (times[withdrawal] - deposit_at) / 60e6
+            if last_deposit[k] >= 0:
+                state.last_deposit_at = times[last_deposit[k]]
+        state.last_txn_at = max(times[end - 1], state.last_txn_at or 0)
+
+    updated_at = datetime.now().isoformat()
+    conn.executemany(SAVE_STATE, [state.row(signature, updated_at) for state in updated.values()])
+    states = {state.customer_id: state for state in updated.values()}
+    return _feature_values(conn, states, counters, now_us)
+
+def _feature_values(conn, states, counters, now_us):
+    ip_counts = dict(conn.execute('''SELECT customer_id, COUNT(*) FROM customer_ips
+                                     WHERE customer_id IN (SELECT value FROM json_each(?)) AND last_seen > ?
+                                     GROUP BY customer_id''',
+                                  (_json_ids(states), now_us - _window(HISTORY_DAYS) * BUCKET_US)).fetchall())
+    linked = linked_accounts(conn, states)
+    features = {}
+    for customer_id, state in states.items():
+        values = {c.key: (round(total) if c.integral else total) for c, total in zip(counters, state.totals.tolist())}
+        values['ip_count'] = ip_counts.get(customer_id, 0)
+        accounts = linked.get(customer_id, [])
+        values['linked_count'] = len(accounts)
+        values['linked_accounts'] = accounts[:LINKED_LIMIT]
+        if state.ordered and state.last_dw_gap is not None:
+            values['last_dw_gap_minutes'] = state.last_dw_gap
+        features[customer_id] = values
+    return features
+
+def load_features(conn, customer_ids, now=None):
+    """{customer_id: features} for customers with up-to-date stored features, in the form
+    scoring.score_transactions() takes. Totals moved to the current hour are written back and
+    committed, so the next read starts from there: call outside a write transaction."""
+    counters = feature_counters()
+    signature = counters_signature()
+    now_us = _now_us(now)
+    current = now_us // BUCKET_US
+    states, _ = _load_states(conn, customer_ids, counters, signature)
+    if not states:
+        return {}
+    moved = roll(conn, states.values(), counters, current)
+    features = _feature_values(conn, states, counters, now_us)
+    if moved:
+        # Another writer may have ingested meanwhile; its row wins
+        conn.executemany('UPDATE customer_features SET as_of = ?, totals = ?, updated_at = ? WHERE customer_id = ? AND as_of = ?',
+                         [(s.as_of, s.totals.tobytes(), datetime.now().isoformat(), s.customer_id, as_of) for s, as_of in moved])
+        conn.commit()
+    return features
+
+def _clear(conn, customer_ids):
+    ids = _json_ids(customer_ids)
+    for table in ('customer_features', 'feature_buckets', 'customer_ips'):
+        conn.execute(f'DELETE FROM {table} WHERE customer_id IN (SELECT value FROM json_each(?))', (ids,))
+
+def rebuild(conn, customer_ids=None, fetch_transactions=None, batch=REBUILD_BATCH, now=None):
+    """Recompute stored features from each customer's ingested transactions (or the histories
+    `fetch_transactions` returns). Defaults to every customer with ingested transactions. A
+    customer without any keeps no features, so scoring counts the history it is shown with
+    rather than a different one from the enrichment provider; rebuilding everyone also clears
+    stored features of customers without ingested transactions. Returns the count rebuilt."""
+    if customer_ids is None:
+        customer_ids = [row[0] for row in conn.execute('SELECT DISTINCT customer_id FROM transactions ORDER BY customer_id')]
+        conn.execute('BEGIN IMMEDIATE')
+        for table in ('customer_features', 'feature_buckets', 'customer_ips'):
+            conn.execute(f'DELETE FROM {table} WHERE customer_id NOT IN (SELECT customer_id FROM transactions)')
+        conn.commit()
+    if fetch_transactions is None:
+        from ingest import stored_history
+        fetch_transactions = lambda customer_id: stored_history(conn, customer_id, now=now)
+    done = 0
+    for start in range(0, len(customer_ids), batch):
+        chunk = customer_ids[start:start + batch]
+        histories = {customer_id: fetch_transactions(customer_id) for customer_id in chunk}
+        histories = {customer_id: history for customer_id, history in histories.items() if history is not None}
+        conn.execute('BEGIN IMMEDIATE')
+        _clear(conn, chunk)
+        ingest(conn, histories, now)
+        conn.commit()
+        done += len(histories)
+    return done
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain the SignalSAR customer feature store')
+    parser.add_argument('command', choices=['rebuild'])
+    parser.add_argument('--customer', action='append', help='Customer id (repeatable); default: every customer with ingested transactions')
+    args = parser.parse_args()
+
+    from db import DB_PATH, open_connection
+    conn = open_connection(DB_PATH)
+    from ingest import create_ingest_tables
+    from links import LINK_SCHEMAS
+    for schema in FEATURE_SCHEMAS + LINK_SCHEMAS:
+        conn.execute(schema)
+    create_ingest_tables(conn)
+    started = datetime.now()
+    count = rebuild(conn, args.customer)
+    print(f'Rebuilt features for {count} customers in {(datetime.now() - started).total_seconds():.1f}s')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+"""Gunicorn settings: pre-forked workers, each with a pool of request threads.
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+SQLite serves reads from every process in parallel under WAL and serializes writes, so
+throughput scales with worker processes up to the core count while threads cover I/O
+waits and long requests (`?wait` investigations, change feed streams, at most
+SIGNALSAR_FEED_MAX_STREAMS of them per worker).
+"""
+
+import multiprocessing
+import os
+
+bind = f'0.0.0.0:{os.environ.get("PORT", 5000)}'
+workers = int(os.environ.get('SIGNALSAR_WEB_WORKERS', 0)) or multiprocessing.cpu_count()
+threads = int(os.environ.get('SIGNALSAR_WEB_THREADS', 8))
+# A change feed stream holds a thread while its page is open: keep half of each worker's
+# threads for API calls. Refused streams get a 503 and their pages poll instead.
+os.environ.setdefault('SIGNALSAR_FEED_MAX_STREAMS', str(max(threads // 2, 1)))
+worker_class = 'gthread'
+keepalive = 5
+graceful_timeout = 30
+# Workers import the app after forking, so no SQLite connection or thread crosses a fork
+preload_app = False
+
+def on_starting(server):
+    # Once per server start, in the master; the file lock also serializes against other starts on the same database
+    from init_db import init_db
+    init_db()
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""Bulk transaction ingest.
+
+    python ingest.py transactions.csv [more.ndjson ...]
+    producer | python ingest.py - --format ndjson
+
+Transactions (CSV with a header row, or one JSON object per line) carry id, customer_id,
+type, amount, timestamp and optionally ip, device and description. They are read in
+chunks and each chunk is written in one transaction: its rows go into `transactions`,
+IPs and devices into the identifier graph (links.py), the feature store is updated for
+the customers in it, those customers are scored and an alert is raised for every one that
+reaches SIGNALSAR_INGEST_ALERT_SCORE and has no alert open.
+
+Scoring is incremental: history-wide aggregates and windowed counts come from the
+feature store, so only a chunk's own transactions are scanned (sequence rules such as
+rapid movement see the transactions in that chunk).
+
+A reader thread parses ahead into a bounded queue; when writing falls behind, the reader
+blocks, and so does whatever is feeding it. The chunk's transaction also records the
+source's checkpoint (byte offset for files, records read for stdin), so an interrupted
+run resumes after the last committed chunk when started again with the same source.
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from itertools import islice, repeat
+from operator import itemgetter
+import numpy as np
+
+from scoring import EPOCH, ONE_US, TYPE_CODES, OTHER, TxnColumns, _parse_timestamps, _timestamp_us, rule_engine
+from features import FEATURE_SCHEMAS, HISTORY_DAYS, ingest_columns
+from links import LINK_SCHEMAS, record_links
+from changefeed import record_change
+
+CHUNK_ROWS = int(os.environ.get('SIGNALSAR_INGEST_CHUNK', 100000))
+QUEUE_CHUNKS = int(os.environ.get('SIGNALSAR_INGEST_QUEUE', 2))
+ALERT_SCORE = int(os.environ.get('SIGNALSAR_INGEST_ALERT_SCORE', 50))
+
+TRANSACTIONS_SCHEMA = '''CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY,
+    customer_id TEXT NOT NULL,
+    txn_id TEXT NOT NULL,
+    type TEXT NOT NULL,
+    amount NUMERIC NOT NULL,
+    ts INTEGER NOT NULL,
+    ip TEXT,
+    description TEXT,
+    device TEXT
+)'''
+
+TRANSACTIONS_INDEXES = (
+    # A customer's history in time order (enrichment, feature rebuilds)
+    'CREATE INDEX IF NOT EXISTS idx_transactions_customer_ts ON transactions(customer_id, ts)',
+    # A transaction is stored once however often its feed is sent
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_customer_txn ON transactions(customer_id, txn_id)',
+)
+
+CHECKPOINTS_SCHEMA = '''CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+    source TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    records INTEGER NOT NULL,
+    ingested INTEGER NOT NULL,
+    rejected INTEGER NOT NULL,
+    alerts INTEGER NOT NULL,
+    updated_at TEXT NOT NULL
+)'''
+
+INGEST_SCHEMAS = (TRANSACTIONS_SCHEMA, CHECKPOINTS_SCHEMA) + TRANSACTIONS_INDEXES
+
+def create_ingest_tables(conn):
+    for statement in INGEST_SCHEMAS:
+        conn.execute(statement)
+    # Tables created before devices were stored
+    if 'device' not in {row[1] for row in conn.execute('PRAGMA table_info(transactions)')}:
+        conn.execute('ALTER TABLE transactions ADD COLUMN device TEXT')
+
+INSERT_TRANSACTION = '''INSERT OR IGNORE INTO transactions (customer_id, txn_id, type, amount, ts, ip, description, device)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)'''
+
+# records: (customer_id, txn_id, type, amount, timestamp text, ip, description, device) tuples
+Chunk = namedtuple('Chunk', 'records rejected read position')
+
+def stored_history(conn, customer_id, days=HISTORY_DAYS, now=None):
+    """The customer's ingested transactions of the last `days` days, oldest first, as the
+    dicts enrichment providers return; None if nothing was ever ingested for the customer."""
+    since = ((now or datetime.now()) - timedelta(days=days) - EPOCH) // ONE_US
+    rows = conn.execute('SELECT txn_id, type, amount, ts, ip, description FROM transactions WHERE customer_id = ? AND ts >= ? ORDER BY ts',
+                        (customer_id, since)).fetchall()
+    if not rows and conn.execute('SELECT 1 FROM transactions WHERE customer_id = ? LIMIT 1', (customer_id,)).fetchone() is None:
+        return None
+    return [{'id': txn_id, 'type': txn_type, 'amount': amount, 'timestamp': (EPOCH + ts * ONE_US).isoformat(), 'ip': ip,
+             'description': description} for txn_id, txn_type, amount, ts, ip, description in rows]
+
+def _csv_records(lines, header):
+    column = {name: i for i, name in enumerate(header)}
+    fields = [column['customer_id'], column['id'], column['type'], column['amount'], column['timestamp']]
+    ip, description, device = column.get('ip'), column.get('description'), column.get('device')
+    records, rejected = [], 0
+    for row in csv.reader(io.StringIO(b''.join(lines).decode())):
+        if not row:
+            continue
+        try:
+            customer_id, txn_id, txn_type, amount, timestamp = [row[i] for i in fields]
+            records.append((customer_id, txn_id, txn_type, float(amount), timestamp,
+                            row[ip] or None if ip is not None else None, row[description] if description is not None else None,
+                            row[device] or None if device is not None else None))
+        except (IndexError, ValueError):
+            rejected += 1
+    return records, rejected
+
+def _ndjson_records(lines):
+    records, rejected = [], 0
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            txn = json.loads(line)
+            records.append((str(txn['customer_id']), str(txn['id']), txn['type'], float(txn['amount']), txn['timestamp'],
+                            txn.get('ip') or None, txn.get('description'), txn.get('device') or None))
+        except (KeyError, ValueError, TypeError):
+            rejected += 1
+    return records, rejected
+
+def read_chunks(stream, fmt, chunk_rows=CHUNK_ROWS, position=0, skip=0):
+    """Parse a binary stream into Chunks. Seekable streams resume at byte `position`,
+    others after `skip` records (the header row excluded)."""
+    header = None
+    if fmt == 'csv':
+        header = [name.strip() for name in next(csv.reader([stream.readline().decode()]), [])]
+        missing = {'id', 'customer_id', 'type', 'amount', 'timestamp'} - set(header)
+        if missing:
+            raise ValueError(f'CSV header lacks {", ".join(sorted(missing))}')
+    seekable = stream.seekable()
+    if seekable and position:
+        stream.seek(position)
+    elif skip:
+        for _ in islice(stream, skip):
+            pass
+    while True:
+        lines = list(islice(stream, chunk_rows))
+        if not lines:
+            return
+        records, rejected = _csv_records(lines, header) if header is not None else _ndjson_records(lines)
+        yield Chunk(records, rejected, len(lines), stream.tell() if seekable else 0)
+
+def _timestamps(texts):
+    """Microseconds since the epoch per timestamp text, None where it does not parse."""
+    try:
+        return _parse_timestamps(texts).tolist()
+    except (ValueError, TypeError):
+        pass
+    values = []
+    for text in texts:
+        try:
+            values.append(_timestamp_us(text))
+        except (ValueError, TypeError):
+            values.append(None)
+    return values
+
+def alert_type(typology):
+    return typology.replace('_', ' ').title()
+
+class Ingestor:
+    def __init__(self, conn, chunk_rows=CHUNK_ROWS, queue_chunks=QUEUE_CHUNKS, alert_score=ALERT_SCORE, links=True):
+        self.conn = conn
+        self.chunk_rows = chunk_rows
+        self.queue_chunks = queue_chunks
+        self.alert_score = alert_score
+        self.links = links    # False leaves the identifier graph to `python links.py rebuild`
+
+    def run(self, source, stream, fmt, restart=False):
+        """Ingest `stream` (binary) under checkpoint name `source`. Returns counts and timings."""
+        checkpoint = None if restart else self.conn.execute('SELECT * FROM ingest_checkpoints WHERE source = ?', (source,)).fetchone()
+        totals = dict(checkpoint) if checkpoint else {'position': 0, 'records': 0, 'ingested': 0, 'rejected': 0, 'alerts': 0}
+        chunks = read_chunks(stream, fmt, self.chunk_rows, totals['position'], totals['records'])
+        stats = {'chunks': 0, 'ingested': 0, 'duplicates': 0, 'rejected': 0, 'alerts': 0, 'stalls': 0, 'write_s': 0.0,
+                 'resumed_at': totals['records']}
+        started = time.perf_counter()
+
+        pending = queue.Queue(self.queue_chunks)
+        stop = threading.Event()
+        reader = threading.Thread(target=self._read, args=(chunks, pending, stop, stats), name='ingest-reader', daemon=True)
+        reader.start()
+        try:
+            while True:
+                chunk = pending.get()
+                if chunk is None:
+                    break
+                if isinstance(chunk, BaseException):
+                    raise chunk
+                write_started = time.perf_counter()
+                ingested, duplicates, alerts = self.write_chunk(chunk, source, totals)
+                stats['write_s'] += time.perf_counter() - write_started
+                stats['chunks'] += 1
+                stats['ingested'] += ingested
+                stats['duplicates'] += duplicates
+                stats['rejected'] += len(chunk.records) - ingested - duplicates + chunk.rejected
+                stats['alerts'] += alerts
+        finally:
+            stop.set()
+        stats['seconds'] = time.perf_counter() - started
+        stats['txns_per_s'] = round(stats['ingested'] / stats['seconds']) if stats['seconds'] else 0
+        stats['write_s'] = round(stats['write_s'], 3)
+        return stats
+
+    @staticmethod
+    def _read(chunks, pending, stop, stats):
+        def put(item):
+            if pending.full():
+                stats['stalls'] += 1
+            while not stop.is_set():
+                try:
+                    pending.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        try:
+            for chunk in chunks:
+                if not put(chunk):
+                    return
+        except Exception as e:
+            put(e)
+            return
+        put(None)
+
+    def write_chunk(self, chunk, source, totals, now=None):
+        """Store, featurize and score one chunk and advance the checkpoint, in one transaction.
+        Transactions already stored (same customer and id) are skipped before any of that.
+        Returns (transactions stored, duplicates skipped, alerts raised)."""
+        now = now or datetime.now()
+        records = chunk.records
+        timestamps = _timestamps([r[4] for r in records])
+        if None in timestamps:
+            kept = [(r, ts) for r, ts in zip(records, timestamps) if ts is not None]
+            records, timestamps = [r for r, _ in kept], [ts for _, ts in kept]
+        parsed = len(records)
+
+        conn = self.conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            alerts = stored = 0
+            if records:
+                customers, txn_ids, types, amounts, _, ips, descriptions, devices = zip(*records)
+                # (customer, time) order: contiguous per customer, and index-friendly inserts
+                index = {customer_id: i for i, customer_id in enumerate(dict.fromkeys(customers))}
+                owner = np.fromiter(map(index.__getitem__, customers), dtype=np.int64, count=len(customers))
+                order = np.lexsort((timestamps, owner))
+                take = itemgetter(*order.tolist()) if len(order) > 1 else (lambda column: tuple(column))
+                columns = list(map(take, (customers, txn_ids, types, amounts, ips, descriptions, devices)))
+                timestamps = np.array(timestamps, dtype=np.int64)[order]
+                last_id = conn.execute('SELECT MAX(id) FROM transactions').fetchone()[0] or 0
+                before = conn.total_changes
+                conn.executemany(INSERT_TRANSACTION, zip(*columns[:4], timestamps.tolist(), *columns[4:]))
+                if conn.total_changes - before < len(timestamps):
+                    # Some were already stored or repeated in the chunk: keep the rows that went in
+                    keep = self._inserted(conn, last_id, columns[0], columns[1])
+                    columns = [[value for value, kept in zip(column, keep) if kept] for column in columns]
+                    timestamps = timestamps[np.array(keep, dtype=bool)]
+                customers, txn_ids, types, amounts, ips, descriptions, devices = columns
+                stored = len(customers)
+            if stored:
+                if self.links:
+                    seen = timestamps.tolist()
+                    # Rows are in (customer, time) order, so the last sighting of an identifier by a customer is its latest
+                    record_links(conn, ((kind, identifier, customer_id, ts)
+                                        for kind, identifiers in (('ip', ips), ('device', devices))
+                                        for (identifier, customer_id), ts in dict(zip(zip(identifiers, customers), seen)).items()))
+                cols = self._columns(txn_ids, types, amounts, timestamps, ips)
+                features = ingest_columns(conn, customers, cols, now)
+                alerts = self._raise_alerts(conn, customers, cols, features, now)
+            totals['position'] = chunk.position
+            totals['records'] += chunk.read
+            totals['ingested'] += stored
+            totals['rejected'] += len(chunk.records) - parsed + chunk.rejected
+            totals['alerts'] += alerts
+            conn.execute('''INSERT OR REPLACE INTO ingest_checkpoints (source, position, records, ingested, rejected, alerts, updated_at)
+                            VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                         (source, totals['position'], totals['records'], totals['ingested'], totals['rejected'], totals['alerts'],
+                          datetime.now().isoformat()))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return stored, parsed - stored, alerts
+
+    @staticmethod
+    def _inserted(conn, last_id, customers, txn_ids):
+        """Per record (in insert order), whether it is the row the insert stored: rows get ids
+        above `last_id`, and of keys repeated in the chunk only the first went in."""
+        new = {tuple(row) for row in conn.execute('SELECT customer_id, txn_id FROM transactions WHERE id > ?', (last_id,))}
+        keep = []
+        for key in zip(customers, txn_ids):
+            keep.append(key in new)
+            new.discard(key)
+        return keep
+
+    @staticmethod
+    def _columns(txn_ids, types, amounts, timestamps, ips):
+        ip_list = [ip for ip in dict.fromkeys(ips) if ip is not None]
+        ip_index = {ip: i for i, ip in enumerate(ip_list)}
+        ip_index[None] = -1
+        return TxnColumns(
+            list(txn_ids),
+            np.fromiter(map(TYPE_CODES.get, types, repeat(OTHER)), dtype=np.int8, count=len(types)),
+            np.array(amounts),
+            timestamps,
+            np.fromiter(map(ip_index.__getitem__, ips), dtype=np.int32, count=len(ips)),
+            ip_list,
+        )
+
+    def _raise_alerts(self, conn, owners, cols, features, now):
+        """Score the chunk's customers that have no alert open; raise one alert per customer that
+        reaches the alert score. Customers whose features await a rebuild are not scored."""
+        active = {row[0] for row in conn.execute(
+            "SELECT DISTINCT customer_id FROM alerts WHERE customer_id IN (SELECT value FROM json_each(?)) AND status != 'closed'",
+            (json.dumps(list(features)),))}
+        created_at = now.isoformat()
+        raised = 0
+        start = 0
+        for stop in range(1, len(owners) + 1):
+            if stop < len(owners) and owners[stop] == owners[start]:
+                continue
+            customer_id = owners[start]
+            if customer_id in features and customer_id not in active:
+                result = rule_engine.evaluate(cols.slice(start, stop), now, features[customer_id])
+                if result.score >= self.alert_score:
+                    alert = conn.execute('''INSERT INTO alerts (customer_id, alert_type, risk_score, status, created_at, assigned_to)
+                                            VALUES (?, ?, ?, 'open', ?, NULL) RETURNING *''',
+                                         (customer_id, alert_type(result.typology), result.score, created_at)).fetchone()
+                    record_change(conn, 'alert', {'op': 'created', 'alert': dict(alert)}, alert_id=alert['id'])
+                    raised += 1
+            start = stop
+        return raised
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk-ingest transactions into SignalSAR')
+    parser.add_argument('paths', nargs='+', help="CSV or NDJSON files; '-' reads stdin")
+    parser.add_argument('--format', choices=['csv', 'ndjson'], help='default: from the file extension (stdin: ndjson)')
+    parser.add_argument('--source', help='checkpoint name (default: the absolute path, or "stdin")')
+    parser.add_argument('--restart', action='store_true', help='ignore the checkpoint and read from the start')
+    parser.add_argument('--chunk', type=int, default=CHUNK_ROWS, help='records per chunk')
+    parser.add_argument('--skip-links', action='store_true',
+                        help='do not index IPs and devices while loading; run `python links.py rebuild` afterwards')
+    args = parser.parse_args()
+
+    from db import DB_PATH, open_connection
+    conn = open_connection(DB_PATH)
+    for statement in FEATURE_SCHEMAS + LINK_SCHEMAS:
+        conn.execute(statement)
+    create_ingest_tables(conn)
+    ingestor = Ingestor(conn, chunk_rows=args.chunk, links=not args.skip_links)
+    for path in args.paths:
+        fmt = args.format or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        source = args.source or ('stdin' if path == '-' else os.path.abspath(path))
+        if path == '-':
+            stats = ingestor.run(source, sys.stdin.buffer, fmt, args.restart)
+        else:
+            with open(path, 'rb') as stream:
+                stats = ingestor.run(source, stream, fmt, args.restart)
+        resumed = f' (resumed after {stats["resumed_at"]:,} records)' if stats['resumed_at'] else ''
+        print(f'{path}: {stats["ingested"]:,} transactions in {stats["seconds"]:.1f}s ({stats["txns_per_s"]:,}/s){resumed}, '
+              f'{stats["duplicates"]:,} already stored, {stats["rejected"]:,} rejected, {stats["alerts"]:,} alerts raised, {stats["stalls"]} reader stalls')
+
+if __name__ == '__main__':
+    main()
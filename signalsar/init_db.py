@@ -2,14 +2,73 @@ import sqlite3
 import json
 from datetime import datetime, timedelta
 import random
+from contextlib import contextmanager
+from db import DB_PATH
+from case_views import CASE_VIEW_SCHEMA, migrate_case_views
+from thresholds import THRESHOLD_STATE_SCHEMA, reconcile as reconcile_thresholds
+from jobs import JOBS_SCHEMA, JOBS_INDEXES
+from changefeed import CHANGES_SCHEMA
+from blobs import BLOBS_SCHEMA
+from features import FEATURE_SCHEMAS
+from ingest import create_ingest_tables
+from links import LINK_SCHEMAS, record_links
 
-def init_db():
-    conn = sqlite3.connect('signalsar.db')
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Secondary indexes for the hot lookup paths (shared with migrate_db.py)
+INDEXES = [
+    # Alert queue: WHERE status = ? ORDER BY risk_score DESC, id (keyset pages)
+    'CREATE INDEX IF NOT EXISTS idx_alerts_status_risk ON alerts(status, risk_score DESC, id)',
+    # Alert queue filtered by type, same keyset order
+    'CREATE INDEX IF NOT EXISTS idx_alerts_status_type_risk ON alerts(status, alert_type, risk_score DESC, id)',
+    # Adaptive thresholds and batch filters by alert type
+    'CREATE INDEX IF NOT EXISTS idx_alerts_type_status ON alerts(alert_type, status)',
+    # Open alerts per customer (bulk ingest raises at most one)
+    'CREATE INDEX IF NOT EXISTS idx_alerts_customer_status ON alerts(customer_id, status)',
+    # Latest case for an alert: WHERE alert_id = ? ORDER BY created_at DESC
+    'CREATE INDEX IF NOT EXISTS idx_cases_alert_created ON cases(alert_id, created_at)',
+    # Audit pages keyset on (timestamp, id), globally and per case; the rowid suffix of each index supplies the id
+    'CREATE INDEX IF NOT EXISTS idx_audit_log_case ON audit_log(case_id, id)',
+    'CREATE INDEX IF NOT EXISTS idx_audit_log_case_ts ON audit_log(case_id, timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_audit_log_timestamp ON audit_log(timestamp)',
+    # Case interventions (ordered) and pending-hold counts
+    'CREATE INDEX IF NOT EXISTS idx_interventions_case_ts ON interventions(case_id, timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_interventions_case_action ON interventions(case_id, action)',
+    'CREATE INDEX IF NOT EXISTS idx_reason_evidence_case ON reason_evidence(case_id)',
+    # Disposition counts per case, and recent labels per alert for threshold learning
+    'CREATE INDEX IF NOT EXISTS idx_analyst_feedback_case ON analyst_feedback(case_id)',
+    'CREATE INDEX IF NOT EXISTS idx_analyst_feedback_created ON analyst_feedback(created_at, alert_id, label)',
+]
+
+def create_indexes(c):
+    for statement in INDEXES:
+        c.execute(statement)
+
+@contextmanager
+def init_lock(path):
+    """Hold an exclusive lock on `<path>.init.lock` so concurrent starts initialize one at a time."""
+    with open(f'{path}.init.lock', 'a') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+def init_db(path=DB_PATH):
+    with init_lock(path):
+        _init_db(path)
+
+def _init_db(path):
+    conn = sqlite3.connect(path)
     c = conn.cursor()
     
     # Enable foreign keys
     c.execute('PRAGMA foreign_keys = ON')
     
+    # WAL is persistent in the database file; pooled app connections rely on it
+    c.execute('PRAGMA journal_mode = WAL')
+    
     c.execute('''CREATE TABLE IF NOT EXISTS alerts (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         customer_id TEXT,
@@ -32,8 +91,15 @@ def init_db():
         typology_confirmed INTEGER DEFAULT 0,
         created_at TEXT,
         updated_at TEXT,
+        enriched_ref TEXT,
         FOREIGN KEY (alert_id) REFERENCES alerts(id)
     )''')
+    # Databases created before the blob store: enriched_data stays inline until compacted
+    if 'enriched_ref' not in {row[1] for row in c.execute('PRAGMA table_info(cases)')}:
+        c.execute('ALTER TABLE cases ADD COLUMN enriched_ref TEXT')
+    
+    # Content-addressed, compressed KYC snapshots and transaction chunks
+    c.execute(BLOBS_SCHEMA)
     
     c.execute('''CREATE TABLE IF NOT EXISTS audit_log (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -98,10 +164,38 @@ def init_db():
         FOREIGN KEY (case_id) REFERENCES cases(id)
     )''')
     
+    # Materialized per-case read model for GET /api/cases/<id>
+    c.execute(CASE_VIEW_SCHEMA)
+    migrate_case_views(c)
+    
+    # Ring buffer of recent feedback labels per alert type
+    c.execute(THRESHOLD_STATE_SCHEMA)
+    
+    # Row-level deltas for the live change feed
+    c.execute(CHANGES_SCHEMA)
+    
+    # Per-customer rolling aggregates read by scoring
+    for statement in FEATURE_SCHEMAS:
+        c.execute(statement)
+    
+    # Bulk-ingested transactions and per-source ingest checkpoints
+    create_ingest_tables(c)
+    
+    # IP/device → customer links and their connected components
+    for statement in LINK_SCHEMAS:
+        c.execute(statement)
+    
+    # Investigation job queue
+    c.execute(JOBS_SCHEMA)
+    for statement in JOBS_INDEXES:
+        c.execute(statement)
+    
     # Create unique indexes on submissions
     c.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_submissions_submission_id ON submissions(submission_id)')
     c.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_submissions_checksum ON submissions(checksum)')
     
+    create_indexes(c)
+    
     # Create triggers for append-only immutability on audit_log
     c.execute('''
         CREATE TRIGGER IF NOT EXISTS prevent_audit_log_update
@@ -150,8 +244,19 @@ def init_db():
             ('CUST-2201', 'Unusual Pattern', 52, 'open', (datetime.now() - timedelta(days=2)).isoformat(), None),
         ]
         c.executemany('INSERT INTO alerts (customer_id, alert_type, risk_score, status, created_at, assigned_to) VALUES (?, ?, ?, ?, ?, ?)', mock_alerts)
+        # Mock devices: CUST-4455 shares one with CUST-8821 and another with CUST-5512
+        seen = (datetime.now() - datetime(1970, 1, 1)) // timedelta(microseconds=1)
+        record_links(conn, [('device', 'DEV-A8F2', 'CUST-4455', seen), ('device', 'DEV-A8F2', 'CUST-8821', seen),
+                            ('device', 'DEV-B1C3', 'CUST-4455', seen), ('device', 'DEV-B1C3', 'CUST-5512', seen)])
         conn.commit()
     
+    # Existing databases: seed the threshold ring buffers from recorded feedback
+    c.execute('SELECT COUNT(*) FROM threshold_state')
+    if c.fetchone()[0] == 0:
+        reconcile_thresholds(conn)
+    
+    # Refresh planner statistics for any indexes that need them
+    c.execute('PRAGMA optimize')
     conn.close()
 
 if __name__ == '__main__':
@@ -0,0 +1,281 @@
+"""Persistent job queue for investigations.
+
+Enqueueing a job is one INSERT into `jobs`; worker threads claim queued rows with a
+single atomic UPDATE ... RETURNING and run the handler registered for the job's kind.
+Because the claim happens in SQLite, any number of worker threads in any number of
+processes (the web server's own pool, or `python worker.py`) can share one queue.
+
+A handler calls finish_job() inside the transaction that writes its results, so a job
+is marked done exactly when its writes commit. Claims carry a lease: a job whose worker
+dies is requeued once the lease lapses, and a worker that lost its lease cannot finish
+the job, which keeps retries from writing a result twice.
+"""
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+JOB_WORKERS = int(os.environ.get('SIGNALSAR_JOB_WORKERS', 4))
+JOB_MAX_ATTEMPTS = int(os.environ.get('SIGNALSAR_JOB_MAX_ATTEMPTS', 3))
+JOB_LEASE_SECONDS = float(os.environ.get('SIGNALSAR_JOB_LEASE_SECONDS', 60))
+JOB_POLL_SECONDS = 0.5      # idle workers re-check the table this often (other processes enqueue too)
+RETRY_BACKOFF_MAX = 60
+
+logger = logging.getLogger(__name__)
+
+JOBS_SCHEMA = '''CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    payload TEXT NOT NULL DEFAULT '{}',
+    idempotency_key TEXT UNIQUE,
+    status TEXT NOT NULL DEFAULT 'queued',
+    stage TEXT,
+    progress REAL NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    claim TEXT,
+    lease_until TEXT,
+    available_at TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT
+)'''
+
+JOBS_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS idx_jobs_status_available ON jobs(status, available_at, id)',
+    # At most one live job per subject: a second enqueue returns the first
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_active_subject ON jobs(kind, subject) WHERE status IN ('queued', 'running')",
+)
+
+ACTIVE = ('queued', 'running')
+
+class JobFailed(Exception):
+    """Raised by a handler for failures a retry cannot fix; the job fails without further attempts."""
+
+class LeaseLost(Exception):
+    pass
+
+def _now():
+    return datetime.now().isoformat()
+
+def _later(seconds):
+    return (datetime.now() + timedelta(seconds=seconds)).isoformat()
+
+def job_json(row):
+    job = {'job_id': row['id'], 'kind': row['kind'], 'subject': row['subject'], 'status': row['status'],
+           'stage': row['stage'], 'progress': row['progress'], 'attempts': row['attempts'],
+           'max_attempts': row['max_attempts'], 'created_at': row['created_at'],
+           'started_at': row['started_at'], 'finished_at': row['finished_at']}
+    if row['result'] is not None:
+        job['result'] = json.loads(row['result'])
+    if row['error'] is not None:
+        job['error'] = row['error']
+    return job
+
+def get_job(conn, job_id):
+    return conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+
+def _live_job(conn, kind, subject):
+    return conn.execute("SELECT * FROM jobs WHERE kind = ? AND subject = ? AND status IN ('queued', 'running')",
+                        (kind, subject)).fetchone()
+
+def enqueue(conn, kind, subject, payload=None, idempotency_key=None, max_attempts=JOB_MAX_ATTEMPTS):
+    """Queue a job and return (row, created). An existing job is returned instead when it has
+    the same idempotency key, or is still queued/running for the same subject."""
+    subject = str(subject)
+    if idempotency_key is not None:
+        row = conn.execute('SELECT * FROM jobs WHERE idempotency_key = ?', (idempotency_key,)).fetchone()
+        if row:
+            return row, False
+    now = _now()
+    try:
+        row = conn.execute('''INSERT INTO jobs (kind, subject, payload, idempotency_key, max_attempts, available_at, created_at)
+                              VALUES (?, ?, ?, ?, ?, ?, ?)
+                              ON CONFLICT(kind, subject) WHERE status IN ('queued', 'running') DO NOTHING
+                              RETURNING *''',
+                           (kind, subject, json.dumps(payload or {}), idempotency_key, max_attempts, now, now)).fetchone()
+    except sqlite3.IntegrityError:
+        # A concurrent request with the same idempotency key got there first
+        conn.rollback()
+        return conn.execute('SELECT * FROM jobs WHERE idempotency_key = ?', (idempotency_key,)).fetchone(), False
+    created = row is not None
+    if not created:
+        row = _live_job(conn, kind, subject)
+    conn.commit()
+    return row, created
+
+def retry(conn, job_id):
+    """Requeue a failed job with a fresh attempt budget. Jobs in any other state are returned
+    unchanged, so repeating a retry is harmless."""
+    try:
+        row = conn.execute('''UPDATE jobs SET status = 'queued', stage = NULL, progress = 0, attempts = 0, error = NULL,
+                                  claim = NULL, lease_until = NULL, available_at = ?, finished_at = NULL
+                              WHERE id = ? AND status = 'failed' RETURNING *''', (_now(), job_id)).fetchone()
+    except sqlite3.IntegrityError:
+        # Another job for the same subject went live meanwhile; that one is the retry
+        conn.rollback()
+        row = get_job(conn, job_id)
+        return _live_job(conn, row['kind'], row['subject']) or row
+    conn.commit()
+    return row or get_job(conn, job_id)
+
+def claim(conn, worker):
+    """Atomically take the oldest available job, or return None."""
+    now = _now()
+    row = conn.execute('''UPDATE jobs SET status = 'running', claim = ?, attempts = attempts + 1, stage = 'claimed',
+                              progress = 0, started_at = ?, lease_until = ?
+                          WHERE id = (SELECT id FROM jobs WHERE status = 'queued' AND available_at <= ?
+                                      ORDER BY available_at, id LIMIT 1)
+                          RETURNING *''', (f'{worker}:{uuid.uuid4().hex}', now, _later(JOB_LEASE_SECONDS), now)).fetchone()
+    conn.commit()
+    return row
+
+def report_progress(conn, job, stage, progress):
+    """Record a handler's stage and extend its lease. Call outside the handler's write transaction."""
+    conn.execute('UPDATE jobs SET stage = ?, progress = ?, lease_until = ? WHERE id = ? AND claim = ?',
+                 (stage, progress, _later(JOB_LEASE_SECONDS), job['id'], job['claim']))
+    conn.commit()
+
+def finish_job(conn, job, result):
+    """Mark `job` succeeded inside the caller's open transaction. Raises LeaseLost (so the
+    caller rolls back) if the job was requeued and claimed elsewhere in the meantime."""
+    updated = conn.execute('''UPDATE jobs SET status = 'succeeded', stage = 'done', progress = 1, result = ?, error = NULL,
+                                  lease_until = NULL, finished_at = ?
+                              WHERE id = ? AND claim = ? AND status = 'running' ''',
+                           (json.dumps(result), _now(), job['id'], job['claim'])).rowcount
+    if not updated:
+        raise LeaseLost(f'Job {job["id"]} is no longer held by this worker')
+
+def fail_job(conn, job, error, permanent=False):
+    """Record a failed attempt: back off and requeue, or fail for good once attempts run out."""
+    final = permanent or job['attempts'] >= job['max_attempts']
+    conn.execute('''UPDATE jobs SET status = ?, stage = ?, error = ?, claim = NULL, lease_until = NULL, available_at = ?,
+                        finished_at = ?
+                    WHERE id = ? AND claim = ?''',
+                 ('failed' if final else 'queued', 'failed' if final else 'retrying', error,
+                  _later(min(2 ** job['attempts'], RETRY_BACKOFF_MAX)), _now() if final else None, job['id'], job['claim']))
+    conn.commit()
+
+def requeue_expired(conn):
+    """Return jobs whose lease lapsed (their worker died) to the queue, or fail them if out of attempts."""
+    now = _now()
+    count = conn.execute('''UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+                                stage = 'lease expired', error = 'Worker lease expired', claim = NULL, lease_until = NULL,
+                                available_at = ?
+                            WHERE status = 'running' AND lease_until < ?''', (now, now)).rowcount
+    conn.commit()
+    return count
+
+def queue_depth(conn):
+    return dict(conn.execute("SELECT status, COUNT(*) FROM jobs WHERE status IN ('queued', 'running') GROUP BY status").fetchall())
+
+class WorkerPool:
+    """`threads` workers, each with its own connection, running `handlers[kind](conn, job, progress)`."""
+
+    def __init__(self, connect, handlers, threads=JOB_WORKERS, name=None):
+        self.connect = connect
+        self.handlers = handlers
+        self.threads = threads
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self._workers = []
+        self._wakeup = threading.Condition()
+        self._finished = threading.Condition()
+        self._pending = 0
+        self._stopping = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        # Started on first use so forked server workers each get their own threads
+        with self._lock:
+            self._workers = [t for t in self._workers if t.is_alive()]
+            for n in range(len(self._workers), self.threads):
+                thread = threading.Thread(target=self._loop, args=(f'{self.name}:{n}',), name=f'job-worker-{n}', daemon=True)
+                thread.start()
+                self._workers.append(thread)
+        return self
+
+    @property
+    def running(self):
+        return any(t.is_alive() for t in self._workers)
+
+    @property
+    def live_workers(self):
+        return sum(t.is_alive() for t in self._workers)
+
+    def stop(self, timeout=None):
+        self._stopping = True
+        self.notify()
+        for thread in self._workers:
+            thread.join(timeout)
+
+    def notify(self):
+        """Wake an idle worker (call after enqueueing from this process)."""
+        with self._wakeup:
+            self._pending += 1
+            self._wakeup.notify()
+
+    def wait(self, conn, job_id, timeout):
+        """Block until the job leaves queued/running or `timeout` passes; return its row."""
+        deadline = time.monotonic() + timeout
+        while True:
+            row = get_job(conn, job_id)
+            if conn.in_transaction:
+                conn.commit()
+            remaining = deadline - time.monotonic()
+            if row is None or row['status'] not in ACTIVE or remaining <= 0:
+                return row
+            with self._finished:
+                # Woken by local workers; the cap covers jobs run by other processes
+                self._finished.wait(min(remaining, 0.1))
+
+    def _loop(self, worker):
+        conn = self.connect()
+        last_sweep = 0.0
+        while not self._stopping:
+            try:
+                if time.monotonic() - last_sweep > JOB_LEASE_SECONDS / 2:
+                    requeue_expired(conn)
+                    last_sweep = time.monotonic()
+                job = claim(conn, worker)
+            except Exception:
+                if conn.in_transaction:
+                    conn.rollback()
+                logger.exception('Job claim failed')
+                job = None
+            if job is None:
+                with self._wakeup:
+                    if not self._pending:
+                        self._wakeup.wait(JOB_POLL_SECONDS)
+                    self._pending = max(0, self._pending - 1)
+                continue
+            self._run(conn, job)
+            with self._finished:
+                self._finished.notify_all()
+        conn.close()
+
+    def _run(self, conn, job):
+        handler = self.handlers.get(job['kind'])
+        try:
+            if handler is None:
+                raise JobFailed(f'No handler for job kind {job["kind"]!r}')
+            handler(conn, job, lambda stage, progress: report_progress(conn, job, stage, progress))
+        except LeaseLost as e:
+            if conn.in_transaction:
+                conn.rollback()
+            logger.warning('Job %s abandoned: %s', job['id'], e)
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                fail_job(conn, job, f'{type(e).__name__}: {e}', permanent=isinstance(e, JobFailed))
+            except Exception:
+                logger.exception('Could not record failure of job %s', job['id'])
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""Cross-customer identifier graph.
+
+Every IP address and device fingerprint seen on an ingested transaction is linked to the
+customer that used it (`identifier_links`). Customers sharing an identifier are linked
+accounts; following links transitively gives a customer's network, kept as connected
+components in a persistent union-find (`link_components`): every customer points
+straight at its component's root and the root row holds the size, so finding a
+component is one primary-key lookup and merging relabels only the smaller side.
+
+Bulk ingest records links chunk by chunk. A load run with `ingest.py --skip-links` leaves
+them out, and `rebuild` below indexes them from the stored transactions afterwards.
+
+Identifiers shared by more than SIGNALSAR_LINK_MAX_SHARED customers (carrier NAT,
+public Wi-Fi, shared office devices) are hubs: they are still recorded but link nobody,
+as they would otherwise join unrelated customers into one network. Components merged
+through an identifier before it became a hub stay merged until rebuilt:
+
+    python links.py rebuild
+    python links.py show CUST-4455
+"""
+
+import argparse
+import json
+import os
+from collections import defaultdict
+
+MAX_SHARED = int(os.environ.get('SIGNALSAR_LINK_MAX_SHARED', 50))
+LINKED_LIMIT = 20
+
+IDENTIFIER_LINKS_SCHEMA = '''CREATE TABLE IF NOT EXISTS identifier_links (
+    kind TEXT NOT NULL,
+    identifier TEXT NOT NULL,
+    customer_id TEXT NOT NULL,
+    last_seen INTEGER NOT NULL,
+    PRIMARY KEY (kind, identifier, customer_id)
+) WITHOUT ROWID'''
+
+IDENTIFIERS_SCHEMA = '''CREATE TABLE IF NOT EXISTS identifiers (
+    kind TEXT NOT NULL,
+    identifier TEXT NOT NULL,
+    customers INTEGER NOT NULL,
+    member TEXT NOT NULL,
+    PRIMARY KEY (kind, identifier)
+) WITHOUT ROWID'''
+
+COMPONENTS_SCHEMA = '''CREATE TABLE IF NOT EXISTS link_components (
+    customer_id TEXT PRIMARY KEY,
+    root TEXT NOT NULL,
+    size INTEGER NOT NULL DEFAULT 1
+) WITHOUT ROWID'''
+
+LINK_INDEXES = (
+    # A customer's identifiers (linked accounts, evidence packs)
+    'CREATE INDEX IF NOT EXISTS idx_identifier_links_customer ON identifier_links(customer_id)',
+    # Members of a component (relabelling on merge)
+    'CREATE INDEX IF NOT EXISTS idx_link_components_root ON link_components(root)',
+)
+
+LINK_SCHEMAS = (IDENTIFIER_LINKS_SCHEMA, IDENTIFIERS_SCHEMA, COMPONENTS_SCHEMA) + LINK_INDEXES
+
+def record_links(conn, sightings, max_shared=MAX_SHARED):
+    """Add (kind, identifier, customer_id, seen) sightings and merge the components of
+    customers that now share an identifier. Call inside the caller's write transaction.
+    Returns the number of new links."""
+    latest = {}
+    for kind, identifier, customer_id, seen in sightings:
+        if identifier is None:
+            continue
+        key = (kind, identifier, customer_id)
+        if latest.get(key, seen - 1) < seen:
+            latest[key] = seen
+    if not latest:
+        return 0
+    # Key order keeps the B-tree reads and writes below local
+    latest = dict(sorted(latest.items()))
+    keys = json.dumps(list(latest))
+    known = {tuple(row) for row in conn.execute(
+        '''SELECT l.kind, l.identifier, l.customer_id FROM json_each(?) AS k
+           CROSS JOIN identifier_links AS l ON l.kind = json_extract(k.value, '$[0]')
+                AND l.identifier = json_extract(k.value, '$[1]') AND l.customer_id = json_extract(k.value, '$[2]')''',
+        (keys,))}
+    conn.executemany('''INSERT INTO identifier_links (kind, identifier, customer_id, last_seen) VALUES (?, ?, ?, ?)
+                        ON CONFLICT (kind, identifier, customer_id) DO UPDATE SET last_seen = MAX(last_seen, excluded.last_seen)''',
+                     [key + (seen,) for key, seen in latest.items()])
+    joined = defaultdict(list)
+    for key in latest:
+        if key not in known:
+            joined[key[:2]].append(key[2])
+    if not joined:
+        return 0
+
+    shared = {(kind, identifier): (customers, member) for kind, identifier, customers, member in conn.execute(
+        '''SELECT i.kind, i.identifier, i.customers, i.member FROM json_each(?) AS k
+           CROSS JOIN identifiers AS i ON i.kind = json_extract(k.value, '$[0]') AND i.identifier = json_extract(k.value, '$[1]')''',
+        (json.dumps(list(joined)),))}
+    rows, groups = [], []
+    for key, customers in joined.items():
+        count, member = shared.get(key, (0, customers[0]))
+        rows.append(key + (count + len(customers), member))
+        if count + len(customers) <= max_shared:
+            groups.append(customers if not count else [member] + customers)
+    conn.executemany('INSERT OR REPLACE INTO identifiers (kind, identifier, customers, member) VALUES (?, ?, ?, ?)', rows)
+    _merge(conn, [group for group in groups if len(group) > 1])
+    return sum(map(len, joined.values()))
+
+def _merge(conn, groups):
+    """Union the customers of each group. Customers without a row are singletons; rows are
+    written only for customers in components of two or more."""
+    if not groups:
+        return
+    names = {customer_id for group in groups for customer_id in group}
+    found = {customer_id: (root, size) for customer_id, root, size in conn.execute(
+        '''SELECT c.customer_id, c.root, r.size FROM link_components AS c
+           JOIN link_components AS r ON r.customer_id = c.root
+           WHERE c.customer_id IN (SELECT value FROM json_each(?))''', (json.dumps(list(names)),))}
+    parent, size = {}, {}
+    for customer_id in names:
+        root, count = found.get(customer_id, (customer_id, 1))
+        parent[root] = root
+        size[root] = count
+
+    def find(node):
+        root = node
+        while parent[root] != root:
+            root = parent[root]
+        while parent[node] != root:
+            parent[node], node = root, parent[node]
+        return root
+
+    for group in groups:
+        a = find(found[group[0]][0] if group[0] in found else group[0])
+        for customer_id in group[1:]:
+            b = find(found[customer_id][0] if customer_id in found else customer_id)
+            if a == b:
+                continue
+            if size[a] < size[b]:
+                a, b = b, a
+            parent[b] = a
+            size[a] += size[b]
+
+    old_roots = {root for root, _ in found.values()}
+    conn.executemany('INSERT INTO link_components (customer_id, root, size) VALUES (?, ?, 1)',
+                     [(customer_id, find(customer_id)) for customer_id in names if customer_id not in found])
+    # Union by size: a customer is relabelled only when its component at least doubles
+    conn.executemany('UPDATE link_components SET root = ? WHERE root = ?',
+                     [(find(root), root) for root in old_roots if find(root) != root])
+    conn.executemany('UPDATE link_components SET size = ? WHERE customer_id = ?',
+                     [(size[root], root) for root in {find(root) for root in parent}])
+
+def rebuild_components(conn, max_shared=MAX_SHARED):
+    """Recompute identifier counts and components from `identifier_links`, e.g. after
+    identifiers became hubs or SIGNALSAR_LINK_MAX_SHARED changed. Returns the component count."""
+    conn.execute('DELETE FROM identifiers')
+    conn.execute('DELETE FROM link_components')
+    conn.execute('''INSERT INTO identifiers (kind, identifier, customers, member)
+                    SELECT kind, identifier, COUNT(*), MIN(customer_id) FROM identifier_links GROUP BY kind, identifier''')
+    groups = [json.loads(members) for (members,) in conn.execute(
+        '''SELECT json_group_array(l.customer_id) FROM identifiers AS i
+           JOIN identifier_links AS l ON l.kind = i.kind AND l.identifier = i.identifier
+           WHERE i.customers BETWEEN 2 AND ? GROUP BY i.kind, i.identifier''', (max_shared,))]
+    _merge(conn, groups)
+    return conn.execute('SELECT COUNT(*) FROM link_components WHERE root = customer_id').fetchone()[0]
+
+def index_transactions(conn):
+    """Record the IP and device sightings of every ingested transaction, e.g. after a load
+    with `ingest.py --skip-links`. Returns the number of (identifier, customer) pairs."""
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'transactions'").fetchone():
+        return 0
+    pairs = 0
+    for kind in ('ip', 'device'):
+        pairs += conn.execute(f'''INSERT INTO identifier_links (kind, identifier, customer_id, last_seen)
+                                 SELECT '{kind}', {kind}, customer_id, MAX(ts) FROM transactions WHERE {kind} IS NOT NULL
+                                 GROUP BY {kind}, customer_id
+                                 ON CONFLICT (kind, identifier, customer_id) DO UPDATE SET last_seen = MAX(last_seen, excluded.last_seen)''').rowcount
+    return pairs
+
+LINKED_QUERY = '''SELECT l.customer_id, o.customer_id FROM identifier_links AS l
+                  JOIN identifiers AS i ON i.kind = l.kind AND i.identifier = l.identifier
+                  JOIN identifier_links AS o ON o.kind = l.kind AND o.identifier = l.identifier
+                  WHERE l.customer_id IN (SELECT value FROM json_each(?)) AND i.customers BETWEEN 2 AND ?
+                    AND o.customer_id != l.customer_id'''
+
+def linked_accounts(conn, customer_ids, max_shared=MAX_SHARED):
+    """{customer_id: sorted accounts sharing a (non-hub) identifier with it} for customers with any."""
+    linked = defaultdict(set)
+    for customer_id, other in conn.execute(LINKED_QUERY, (json.dumps(list(customer_ids)), max_shared)):
+        linked[customer_id].add(other)
+    return {customer_id: sorted(others) for customer_id, others in linked.items()}
+
+def network(conn, customer_id, limit=LINKED_LIMIT, max_shared=MAX_SHARED):
+    """The customer's linked accounts (first `limit`), identifiers by kind and network size."""
+    linked = sorted({other for _, other in conn.execute(LINKED_QUERY, (json.dumps([customer_id]), max_shared))})
+    identifiers = defaultdict(list)
+    rows = conn.execute('SELECT kind, identifier FROM identifier_links WHERE customer_id = ?', (customer_id,))
+    for kind, identifier in sorted(map(tuple, rows)):
+        identifiers[kind].append(identifier)
+    row = conn.execute('''SELECT r.size FROM link_components AS c JOIN link_components AS r ON r.customer_id = c.root
+                          WHERE c.customer_id = ?''', (customer_id,)).fetchone()
+    return {
+        'linked_accounts': linked[:limit],
+        'linked_count': len(linked),
+        'identifiers': dict(identifiers),
+        'network_size': row[0] if row else 1,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain the SignalSAR identifier graph')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('rebuild', help='index the IPs and devices of ingested transactions, then recompute identifier counts and components')
+    show = sub.add_parser('show', help="print a customer's network")
+    show.add_argument('customer_id')
+    args = parser.parse_args()
+
+    from db import DB_PATH, open_connection
+    conn = open_connection(DB_PATH)
+    for statement in LINK_SCHEMAS:
+        conn.execute(statement)
+    if args.command == 'rebuild':
+        conn.execute('BEGIN IMMEDIATE')
+        pairs = index_transactions(conn)
+        components = rebuild_components(conn)
+        conn.commit()
+        print(f'Indexed {pairs} identifier sightings, rebuilt {components} components')
+    else:
+        print(json.dumps(network(conn, args.customer_id), indent=2))
+
+if __name__ == '__main__':
+    main()
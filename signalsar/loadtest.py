@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""Load test of the production server profile: throughput against gunicorn worker count.
+
+    python loadtest.py                                 # 1, 2, 4, ... workers up to the CPU count
+    python loadtest.py --workers 1,2,4 --clients 32 --duration 20 --out scaling.json
+
+Seeds one throwaway database (test_query_plans.seed, plus --cases investigated alerts for
+the case reads), then for each worker count starts
+`gunicorn -c gunicorn.conf.py wsgi:application` on it and drives a fixed mix of read
+routes from --clients keep-alive connections spread over client processes, for a warm-up
+and then --duration seconds. Each run reports requests per second, p50/p95/p99 latency
+and scaling efficiency: throughput over (workers x the one-worker throughput). Clients
+share the machine with the server, so leave cores for them: near-linear scaling shows up
+while workers plus client processes fit in the available CPUs.
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from benchmark import SEED, environment, summarize
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def routes(cases):
+    """The request mix: alert queue pages, case reads and audit pages. `cases` is a list of (alert id, case id)."""
+    return [
+        lambda rng: '/api/alerts?status=open&limit=50',
+        lambda rng: '/api/alerts?status=open&alert_type=Structuring&limit=50',
+        lambda rng: f'/api/cases/{rng.choice(cases)[1]}',
+        lambda rng: f'/api/cases/{rng.choice(cases)[1]}/transactions?limit=100',
+        lambda rng: f'/api/alerts/{rng.choice(cases)[0]}/case',
+        lambda rng: f'/api/audit?case_id={rng.choice(cases)[1]}&limit=20',
+        lambda rng: '/api/audit?limit=50',
+    ]
+
+def seed_cases(count):
+    """Investigate `count` new alerts in this process; returns their (alert id, case id) pairs."""
+    from app import app
+    client = app.test_client()
+    cases = []
+    for i in range(count):
+        alert_id = client.post('/api/alerts', json={'customer_id': f'CUST-{i}', 'alert_type': 'Structuring', 'risk_score': 80}).get_json()['id']
+        client.post(f'/api/alerts/{alert_id}/investigate?wait=30')
+        cases.append((alert_id, client.get(f'/api/alerts/{alert_id}/case').get_json()['case_id']))
+    return cases
+
+def drive(port, mix, rng, warmup_until, stop_at, samples, errors):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    while True:
+        now = time.perf_counter()
+        if now >= stop_at:
+            break
+        t = time.perf_counter_ns()
+        try:
+            conn.request('GET', rng.choice(mix)(rng))
+            response = conn.getresponse()
+            response.read()
+            ok = response.status == 200
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            ok = False
+        if now >= warmup_until:
+            if ok:
+                samples.append(time.perf_counter_ns() - t)
+            else:
+                errors.append(1)
+    conn.close()
+
+def client(port, connections, cases, warmup_until, stop_at, seed):
+    """One client process: `connections` keep-alive connections, each on its own thread."""
+    mix = routes(cases)
+    samples, errors = [], []
+    threads = [threading.Thread(target=drive, args=(port, mix, random.Random(seed * 1000 + i), warmup_until, stop_at, samples, errors))
+               for i in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, len(errors)
+
+def wait_ready(port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with {process.returncode}')
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/api/alerts?limit=1')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('gunicorn did not become ready')
+
+def run(workers, args, path, cases):
+    env = dict(os.environ, SIGNALSAR_DB=path, SIGNALSAR_WEB_WORKERS=str(workers), SIGNALSAR_WEB_THREADS=str(args.threads),
+               SIGNALSAR_JOB_WORKERS='0', SIGNALSAR_THRESHOLD_RECONCILE_SECONDS='0', PORT=str(args.port))
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{args.port}',
+                               '--log-level', 'warning', 'wsgi:application'], cwd=HERE, env=env)
+    try:
+        wait_ready(args.port, server)
+        processes = min(args.client_processes, args.clients)
+        started = time.perf_counter()
+        warmup_until = started + args.warmup
+        stop_at = warmup_until + args.duration
+        # Spawned, not forked: this process has the app's threads running
+        with multiprocessing.get_context('spawn').Pool(processes) as pool:
+            shares = [args.clients // processes + (p < args.clients % processes) for p in range(processes)]
+            results = pool.starmap(client, [(args.port, share, cases, warmup_until, stop_at, SEED + p)
+                                            for p, share in enumerate(shares)])
+    finally:
+        server.terminate()
+        server.wait(30)
+    samples = [s for batch, _ in results for s in batch]
+    stats = summarize(samples, args.duration)
+    stats['errors'] = sum(errors for _, errors in results)
+    return stats
+
+def main():
+    cpus = os.cpu_count() or 1
+    default_workers = ','.join(str(2 ** i) for i in range(cpus.bit_length()) if 2 ** i <= cpus)
+    parser = argparse.ArgumentParser(description='Measure SignalSAR throughput against gunicorn worker count')
+    parser.add_argument('--workers', default=default_workers, help='comma-separated worker counts')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('SIGNALSAR_WEB_THREADS', 8)), help='threads per worker')
+    parser.add_argument('--clients', type=int, default=32, help='concurrent keep-alive connections')
+    parser.add_argument('--client-processes', type=int, default=max(cpus // 2, 1), help='processes the connections are spread over')
+    parser.add_argument('--duration', type=float, default=20, help='measured seconds per worker count')
+    parser.add_argument('--warmup', type=float, default=3, help='unmeasured seconds first')
+    parser.add_argument('--rows', type=int, default=100_000, help='alerts and audit rows seeded (cases: a tenth)')
+    parser.add_argument('--cases', type=int, default=50, help='alerts investigated for the case reads')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--out', help='write the JSON here instead of stdout')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='signalsar-load-')
+    path = os.path.join(workdir, 'signalsar.db')
+    try:
+        os.environ['SIGNALSAR_DB'] = path
+        random.seed(SEED)
+        from init_db import init_db
+        from test_query_plans import seed
+        init_db(path)
+        seed(path, args.rows)
+        cases = seed_cases(args.cases)
+
+        runs = {}
+        for workers in [int(w) for w in args.workers.split(',') if w]:
+            if workers + args.client_processes > cpus:
+                print(f'warning: {workers} workers and {args.client_processes} client processes share {cpus} CPUs', file=sys.stderr)
+            runs[workers] = run(workers, args, path, cases)
+            print(f'{workers} workers: {runs[workers]["per_s"]} req/s, p50 {runs[workers]["p50_ms"]} ms, '
+                  f'p99 {runs[workers]["p99_ms"]} ms, {runs[workers]["errors"]} errors', file=sys.stderr)
+        base = runs[min(runs)]['per_s'] / min(runs)
+        for workers, stats in runs.items():
+            stats['efficiency'] = round(stats['per_s'] / (workers * base), 3) if base else None
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = json.dumps({'environment': environment(), 'rows': args.rows, 'cases': args.cases, 'threads': args.threads, 'clients': args.clients,
+                         'client_processes': args.client_processes, 'duration_s': args.duration,
+                         'workers': {str(w): s for w, s in runs.items()}}, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
+
+if __name__ == '__main__':
+    main()
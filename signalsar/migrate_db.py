@@ -1,11 +1,21 @@
 import sqlite3
 import shutil
 from datetime import datetime
+from db import DB_PATH
+from init_db import create_indexes
+from blobs import BLOBS_SCHEMA, compact_cases
+from case_views import CASE_VIEW_SCHEMA, migrate_case_views
+from features import FEATURE_SCHEMAS
+from ingest import create_ingest_tables
+from links import LINK_SCHEMAS
+from changefeed import CHANGES_SCHEMA
+from jobs import JOBS_SCHEMA, JOBS_INDEXES
+from thresholds import THRESHOLD_STATE_SCHEMA, reconcile as reconcile_thresholds
 
 # Backup existing database
-shutil.copy('signalsar.db', f'signalsar.db.backup.{datetime.now().strftime("%Y%m%d_%H%M%S")}')
+shutil.copy(DB_PATH, f'{DB_PATH}.backup.{datetime.now().strftime("%Y%m%d_%H%M%S")}')
 
-conn = sqlite3.connect('signalsar.db')
+conn = sqlite3.connect(DB_PATH)
 c = conn.cursor()
 
 # Enable foreign keys
@@ -213,4 +223,65 @@ if 'FOREIGN KEY' not in cases_schema:
 else:
     print("Database already has foreign keys. No migration needed.")
 
+# Secondary indexes for hot lookup paths (idempotent)
+create_indexes(c)
+c.execute('ANALYZE')
+conn.commit()
+print("- Ensured secondary indexes on alerts, cases, audit_log, interventions, reason_evidence, analyst_feedback")
+
+# Move inline case payloads into the content-addressed blob store (idempotent)
+c.execute(BLOBS_SCHEMA)
+if 'enriched_ref' not in {row[1] for row in c.execute('PRAGMA table_info(cases)')}:
+    c.execute('ALTER TABLE cases ADD COLUMN enriched_ref TEXT')
+conn.commit()
+print(f"- Moved {compact_cases(conn)} case payloads into the blob store (VACUUM to reclaim the space)")
+
+# Customer feature store tables (fill with `python features.py rebuild`)
+for statement in FEATURE_SCHEMAS:
+    c.execute(statement)
+conn.commit()
+print("- Ensured customer feature store tables")
+
+# Bulk ingest tables (load with `python ingest.py`)
+# Transactions stored more than once (re-sent feeds) keep their first row before the unique index is built
+duplicates = 0
+if c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='transactions'").fetchone():
+    duplicates = c.execute('DELETE FROM transactions WHERE id NOT IN (SELECT MIN(id) FROM transactions GROUP BY customer_id, txn_id)').rowcount
+create_ingest_tables(c)
+conn.commit()
+print("- Ensured transactions (with device column) and ingest checkpoint tables")
+if duplicates:
+    print(f"- Removed {duplicates} duplicate transactions (run `python features.py rebuild` to recount stored features)")
+
+# Identifier graph (filled by ingest.py)
+for statement in LINK_SCHEMAS:
+    c.execute(statement)
+conn.commit()
+print("- Ensured identifier graph tables")
+
+# Case read model: submission gate flags (views themselves are built on first read)
+c.execute(CASE_VIEW_SCHEMA)
+migrate_case_views(c)
+conn.commit()
+print("- Ensured case view gate flags")
+
+# Change feed for live pages (rows recorded from here on)
+c.execute(CHANGES_SCHEMA)
+conn.commit()
+print("- Ensured change feed table")
+
+# Investigation job queue
+c.execute(JOBS_SCHEMA)
+for statement in JOBS_INDEXES:
+    c.execute(statement)
+conn.commit()
+print("- Ensured job queue table")
+
+# Threshold ring buffers, seeded from the recorded feedback
+c.execute(THRESHOLD_STATE_SCHEMA)
+if c.execute('SELECT COUNT(*) FROM threshold_state').fetchone()[0] == 0:
+    reconcile_thresholds(conn)
+conn.commit()
+print("- Ensured threshold ring buffers")
+
 conn.close()
@@ -0,0 +1,370 @@
+"""SAR narrative templates.
+
+A template is an ordered list of sections; each section is text with `{field}`,
+`{field:spec}` or `{field[KEY]}` placeholders. At import every template is compiled
+into one Python function that computes each field it uses exactly once (totals, period,
+reason lines, evidence references) and joins the pieces, so a narrative costs about as
+much as the f-strings it replaced. Sections are also compiled on their own for
+incremental rendering.
+
+Templates are chosen per typology and optional jurisdiction, falling back to DEFAULT.
+Extra templates can be loaded from a JSON file named by SIGNALSAR_NARRATIVE_TEMPLATES:
+
+    {"STRUCTURING": ["header", ["summary", "SUMMARY OF SUSPICIOUS ACTIVITY:\\n..."], "conclusion"],
+     "STRUCTURING@UK": [...]}
+
+where a bare string reuses a built-in section of that name.
+
+Figures about a typology come from the facts its rule recorded with the evidence (see
+`facts` in rules.py); a sentence with no facts behind it is left out rather than filled in.
+
+A Narrative from `engine.render()` keeps its section texts and a context that caches
+field values, so `update()` with a changed input (new reasons, another typology)
+re-renders only the sections that read it.
+"""
+
+import json
+import os
+import re
+from operator import itemgetter
+from string import Formatter
+
+class Evidence(dict):
+    """Evidence reference suffix per reason code, built on first use; empty for codes without evidence."""
+    def __init__(self, evidence_map):
+        super().__init__()
+        self.evidence_map = evidence_map
+
+    def __missing__(self, reason_code):
+        item = self.evidence_map.get(reason_code)
+        text = f" [Evidence: {', '.join(str(id) for id in item['evidence_ids'][:3])}]" if item else ''
+        self[reason_code] = text
+        return text
+
+def format_reason_lines(reasons, evidence_map, evidence):
+    # The scorer adds a rule's reason and its evidence_map entry together, so they pair up in
+    # order; reasons without a rule (the alert's own label) render without evidence
+    codes = list(evidence_map)
+    return '\n'.join('- ' + r + (evidence[codes[i]] if i < len(codes) else '') for i, r in enumerate(reasons))
+
+def rule_facts(evidence_map, code):
+    entry = evidence_map.get(code)
+    return entry.get('facts') if entry else None
+
+def format_fragmentation(facts, txn_count, total_amount, evidence):
+    overall = f"the subject conducted {txn_count} transactions totaling ${total_amount:,.2f}."
+    if not facts:
+        return f"Over the period reviewed, {overall}{evidence['MICRO_FRAGMENTATION']}"
+    text = (f"Within {facts['window_days']} days, the subject conducted {facts['micro_count']} transactions of "
+            f"${facts['max_amount']:,} or less, averaging ${facts['micro_avg']:,.2f} each.{evidence['MICRO_FRAGMENTATION']} "
+            f"Over the full period reviewed, {overall}")
+    if not facts['prior_count']:
+        return text + " The account has no earlier transactions to compare against."
+    rate = facts['window_count'] * 7 / max(facts['window_days'], 1)
+    baseline = facts['baseline_per_week']
+    return text + (f" That is {rate:.1f} transactions per week, {rate / baseline:.1f}x the account's baseline of "
+                   f"{baseline:.1f} per week over the preceding {facts['prior_days']:.0f} days.")
+
+def format_baseline(facts):
+    if not facts or not facts['prior_count']:
+        return ''
+    return f'''BEHAVIORAL BASELINE COMPARISON:
+- Historical pattern: {facts['prior_count']} transactions over {facts['prior_days']:.0f} days ({facts['baseline_per_week']:.1f}/week), avg ${facts['prior_avg']:,.2f} per transaction
+- Current pattern: {facts['window_count']} transactions in {facts['window_days']} days, {facts['micro_count']} of them averaging ${facts['micro_avg']:,.2f}
+
+'''
+
+def format_network(facts, evidence):
+    if not facts:
+        return ''
+    ip_count = facts['ip_count']
+    text = f"The subject's {facts['txn_count']} transactions came from {ip_count} distinct IP address{'' if ip_count == 1 else 'es'}."
+    linked_count = facts['linked_count']
+    if linked_count:
+        accounts = list(facts['linked_accounts'])
+        text += f" {linked_count} other account{'' if linked_count == 1 else 's'} share an IP address or device with the subject"
+        if accounts:
+            more = linked_count - len(accounts)
+            text += ': ' + ', '.join(accounts) + (f', and {more} more' if more > 0 else '')
+        text += '.'
+    return f'''NETWORK ANALYSIS:
+{text}{evidence['NETWORK_LINK']}
+
+'''
+
+INPUTS = ('customer_data', 'txn_history', 'reasons', 'evidence_map', 'velocity_multiplier')
+
+# Derived fields as expressions over the context `c`, in dependency order
+FIELDS = {
+    'name': "c.customer_data['name']",
+    'customer_id': "c.customer_data['customer_id']",
+    'account_number': "c.customer_data['account_number']",
+    'onboarded_date': "c.customer_data['onboarded_date']",
+    'occupation': "c.customer_data['occupation']",
+    'period_start': "c.txn_history[0]['timestamp'][:10]",
+    'period_end': "c.txn_history[-1]['timestamp'][:10]",
+    'txn_count': "len(c.txn_history)",
+    'total_amount': "sum(map(_amount, c.txn_history))",
+    'evidence': "Evidence(c.evidence_map)",
+    'reason_lines': "format_reason_lines(c.reasons, c.evidence_map, c.evidence)",
+    'anomaly_lines': "c.reason_lines",
+    'micro_facts': "rule_facts(c.evidence_map, 'MICRO_FRAGMENTATION')",
+    'network_facts': "rule_facts(c.evidence_map, 'NETWORK_LINK')",
+    'fragmentation_details': "format_fragmentation(c.micro_facts, c.txn_count, c.total_amount, c.evidence)",
+    'baseline_comparison': "format_baseline(c.micro_facts)",
+    'network_findings': "format_network(c.network_facts, c.evidence)",
+}
+
+_attr = re.compile(r'\bc\.(\w+)')
+_namespace = {'_amount': itemgetter('amount'), 'Evidence': Evidence, 'format_reason_lines': format_reason_lines,
+              'rule_facts': rule_facts, 'format_fragmentation': format_fragmentation,
+              'format_baseline': format_baseline, 'format_network': format_network}
+
+def _field_inputs(field):
+    if field in INPUTS:
+        return {field}
+    return set().union(*(_field_inputs(name) for name in _attr.findall(FIELDS[field])))
+
+def _field_deps(field):
+    """`field` plus every derived field its expression reads."""
+    if field in INPUTS:
+        return set()
+    return {field}.union(*(_field_deps(name) for name in _attr.findall(FIELDS[field])))
+
+FIELD_INPUTS = {field: _field_inputs(field) for field in list(FIELDS) + list(INPUTS)}
+_compute = {field: eval(f'lambda c: {expr}', _namespace) for field, expr in FIELDS.items()}
+
+def _inline(expr):
+    # Derived fields become locals of the compiled template function
+    return _attr.sub(lambda m: m.group(1) if m.group(1) in FIELDS else m.group(0), expr)
+
+def compile_render(parts, fields, name):
+    """Compile placeholder parts into `render(context) -> str`, computing each field once."""
+    needed = set().union(*(_field_deps(f) for f in fields)) if fields else set()
+    lines = ['def render(c):']
+    lines += [f'    {field} = {_inline(expr)}' for field, expr in FIELDS.items() if field in needed]
+    # Adjacent literals compile to a single f-string
+    lines.append(f"    return ({' '.join(_inline(p) for p in parts) or repr('')})")
+    namespace = dict(_namespace)
+    exec(compile('\n'.join(lines), f'<narrative {name}>', 'exec'), namespace)
+    return namespace['render']
+
+class Section:
+    _placeholder = re.compile(r'^(\w+)(?:\[(\w+)\])?$')
+    _spec = re.compile(r'^[\w,.<>^=+\- #%]*$')
+
+    def __init__(self, name, text):
+        self.name = name
+        self.text = text
+        self.fields = set()
+        self.parts = []     # string and f-string literals over the context `c`
+        for literal, field, spec, conversion in Formatter().parse(text):
+            if literal:
+                self.parts.append(repr(literal))
+            if field is None:
+                continue
+            match = self._placeholder.match(field)
+            if not match or conversion:
+                raise ValueError(f'Unsupported placeholder {{{field}}} in section {name}')
+            root, key = match.groups()
+            if root not in FIELD_INPUTS:
+                raise ValueError(f'Unknown field {root} in section {name}')
+            self.fields.add(root)
+            if not self._spec.match(spec):
+                raise ValueError(f'Unsupported format spec {spec!r} in section {name}')
+            value = f'c.{root}' if key is None else f'c.{root}["{key}"]'
+            self.parts.append(f"f'{{{value}:{spec}}}'" if spec else f"f'{{{value}}}'")
+        self.inputs = set().union(*(FIELD_INPUTS[f] for f in self.fields)) if self.fields else set()
+        # Incremental rendering reads fields through the caching NarrativeContext
+        self.render = eval(f"lambda c: ({' '.join(self.parts) or repr('')})", _namespace)
+
+class NarrativeContext:
+    def __init__(self, customer_data, txn_history, risk_analysis):
+        self.customer_data = customer_data
+        self.txn_history = txn_history
+        self.reasons = risk_analysis['reasons']
+        self.evidence_map = risk_analysis.get('evidence_map', {})
+        self.velocity_multiplier = risk_analysis.get('velocity_multiplier')
+
+    def __getattr__(self, field):
+        # Derived fields are computed on first use and then read as plain attributes
+        compute = _compute.get(field)
+        if compute is None:
+            raise AttributeError(field)
+        value = self.__dict__[field] = compute(self)
+        return value
+
+    def update(self, **inputs):
+        """Replace inputs and drop the fields derived from them; returns the changed input names."""
+        changed = set()
+        for name, value in inputs.items():
+            if name not in INPUTS:
+                raise ValueError(f'Unknown narrative input {name}')
+            if getattr(self, name) is not value:
+                setattr(self, name, value)
+                changed.add(name)
+        for field in FIELDS:
+            if FIELD_INPUTS[field] & changed:
+                self.__dict__.pop(field, None)
+        return changed
+
+SECTIONS = {s.name: s for s in (
+    Section('header', '''SUSPICIOUS ACTIVITY REPORT - NARRATIVE
+
+Subject: {name} (ID: {customer_id})
+Account: {account_number}
+Period: {period_start} to {period_end}
+
+'''),
+    Section('summary', '''SUMMARY OF SUSPICIOUS ACTIVITY:
+The subject engaged in a pattern of transactions consistent with potential money laundering activity. Automated monitoring systems flagged unusual transaction velocity and structuring patterns that deviate significantly from the account's historical baseline.
+
+'''),
+    Section('description', '''DETAILED DESCRIPTION:
+Over a 90-day period, the subject conducted {txn_count} transactions totaling ${total_amount:,.2f}. Analysis reveals:
+
+{reason_lines}
+
+The transaction pattern shows deposits followed immediately by trading activity and rapid withdrawals, with minimal economic rationale. The subject's account activity increased {velocity_multiplier}x compared to the prior 90-day period.
+
+'''),
+    Section('due_diligence', '''CUSTOMER DUE DILIGENCE:
+Customer onboarded on {onboarded_date}. Stated occupation: {occupation}. Expected account activity: Low-to-moderate retail trading. Actual activity significantly exceeds stated profile.
+
+'''),
+    Section('conclusion', '''CONCLUSION:
+Based on the above factors, this activity is being reported as suspicious and potentially indicative of money laundering or structuring to evade reporting requirements.
+'''),
+    # NEW TYPOLOGY: micro-transaction fragmentation
+    Section('new_typology_banner', '''⚠️ NEW TYPOLOGY DETECTED - UNKNOWN PATTERN
+
+'''),
+    Section('new_typology_summary', '''SUMMARY OF SUSPICIOUS ACTIVITY:
+The subject engaged in a previously unobserved transaction pattern that does not match existing rule-based detection scenarios. Automated monitoring flagged this activity as high-risk based on its deviation from the account's own history.
+
+PATTERN DISCOVERY EXPLANATION:
+This case represents a NEW TYPOLOGY not previously documented in our transaction monitoring rules. While traditional structuring and rapid-movement patterns score moderately, the fragmentation of activity into many small transactions suggests a novel evasion technique.
+
+'''),
+    Section('micro_fragmentation_description', '''DETAILED DESCRIPTION:
+{fragmentation_details}
+
+Key anomalies identified:
+{anomaly_lines}
+
+'''),
+    # Left out when the rules recorded no baseline or network findings
+    Section('behavioral_baseline', '{baseline_comparison}'),
+    Section('network_analysis', '{network_findings}'),
+    Section('new_typology_due_diligence', '''CUSTOMER DUE DILIGENCE:
+Customer onboarded on {onboarded_date}. Stated occupation: {occupation}. Expected account activity: Low-to-moderate retail trading. Current activity represents a fundamental departure from stated profile and historical behavior.
+
+'''),
+    Section('new_typology_conclusion', '''CONCLUSION:
+This activity is being reported as suspicious due to the novel pattern structure and significant behavioral deviation. The pattern does not match existing typologies and may represent an emerging money laundering technique requiring regulatory attention and potential rule enhancement.
+'''),
+)}
+
+TEMPLATES = {
+    'DEFAULT': ['header', 'summary', 'description', 'due_diligence', 'conclusion'],
+    'MICRO_FRAGMENTATION': ['header', 'new_typology_banner', 'new_typology_summary', 'micro_fragmentation_description',
+                            'behavioral_baseline', 'network_analysis', 'new_typology_due_diligence', 'new_typology_conclusion'],
+}
+
+class Narrative:
+    def __init__(self, engine, context, typology, jurisdiction):
+        self.engine = engine
+        self.context = context
+        self.typology = typology
+        self.jurisdiction = jurisdiction
+        self.template = engine.template_for(typology, jurisdiction)
+        self._rendered = {}
+
+    def section(self, name):
+        for section in self.template:
+            if section.name == name:
+                return self._render(section)
+        raise KeyError(name)
+
+    def _render(self, section):
+        text = self._rendered.get(section)
+        if text is None:
+            text = self._rendered[section] = section.render(self.context)
+        return text
+
+    @property
+    def text(self):
+        return ''.join(self._render(s) for s in self.template)
+
+    def __str__(self):
+        return self.text
+
+    def update(self, typology=None, jurisdiction=None, **inputs):
+        """Apply changed inputs (typology, jurisdiction, reasons, evidence_map, ...) and return the new text.
+        Only sections reading a changed input, or new to the selected template, are rendered again."""
+        changed = self.context.update(**inputs)
+        if changed:
+            self._rendered = {s: t for s, t in self._rendered.items() if not s.inputs & changed}
+        if typology is not None or jurisdiction is not None:
+            self.typology = typology or self.typology
+            self.jurisdiction = jurisdiction or self.jurisdiction
+            self.template = self.engine.template_for(self.typology, self.jurisdiction)
+        return self.text
+
+class NarrativeEngine:
+    def __init__(self, templates=TEMPLATES, sections=SECTIONS):
+        self.sections = dict(sections)
+        self.templates = {}
+        self.renderers = {}   # whole-template render functions for one-shot narratives
+        self._keys = {}       # (typology, jurisdiction) -> template key
+        for key, spec in templates.items():
+            self.register(key, spec)
+
+    def register(self, key, spec):
+        """Compile a template. `spec` lists built-in section names or [name, text] pairs."""
+        compiled = []
+        for entry in spec:
+            if isinstance(entry, str):
+                compiled.append(self.sections[entry])
+            else:
+                compiled.append(Section(*entry))
+        self.templates[key] = tuple(compiled)
+        self._keys = {}
+        self.renderers[key] = compile_render([p for section in compiled for p in section.parts],
+                                             set().union(*(section.fields for section in compiled)), key)
+
+    def template_key(self, typology, jurisdiction=None):
+        key = self._keys.get((typology, jurisdiction))
+        if key is None:
+            key = next((k for k in (f'{typology}@{jurisdiction}', typology, f'DEFAULT@{jurisdiction}') if k in self.templates), 'DEFAULT')
+            self._keys[(typology, jurisdiction)] = key
+        return key
+
+    def template_for(self, typology, jurisdiction=None):
+        return self.templates[self.template_key(typology, jurisdiction)]
+
+    def render(self, customer_data, txn_history, risk_analysis, typology=None, jurisdiction=None):
+        """A Narrative that can be re-rendered section by section."""
+        return Narrative(self, NarrativeContext(customer_data, txn_history, risk_analysis),
+                         typology or primary_typology(risk_analysis), jurisdiction)
+
+    def render_text(self, customer_data, txn_history, risk_analysis, typology=None, jurisdiction=None):
+        """One-shot render straight to text."""
+        key = self.template_key(typology or primary_typology(risk_analysis), jurisdiction)
+        return self.renderers[key](NarrativeContext(customer_data, txn_history, risk_analysis))
+
+def primary_typology(risk_analysis):
+    # The first reason code stands in for the typology when none is given
+    return next(iter(risk_analysis.get('evidence_map', {})), 'UNKNOWN_PATTERN')
+
+def load_templates(engine, path):
+    with open(path) as f:
+        for key, spec in json.load(f).items():
+            engine.register(key, spec)
+
+engine = NarrativeEngine()
+if os.environ.get('SIGNALSAR_NARRATIVE_TEMPLATES'):
+    load_templates(engine, os.environ['SIGNALSAR_NARRATIVE_TEMPLATES'])
+
+def generate_sar_narrative(customer_data, txn_history, risk_analysis, typology=None, jurisdiction=None):
+    return engine.render_text(customer_data, txn_history, risk_analysis, typology, jurisdiction)
@@ -0,0 +1,82 @@
+"""Keyset pagination and streaming helpers for list endpoints.
+
+A page is fetched with `WHERE <sort key> past <cursor> ORDER BY <sort key> LIMIT n`,
+so every page costs one index range scan no matter how deep the client has paged.
+Cursors are opaque URL-safe tokens holding the sort key of the last row returned.
+"""
+
+import base64
+import csv
+import io
+import json
+from urllib.parse import urlencode
+
+class CursorError(ValueError):
+    pass
+
+def encode_cursor(*key):
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(',', ':')).encode()).decode().rstrip('=')
+
+def decode_cursor(token, types):
+    """Decode a cursor whose key has one value per entry of `types` (e.g. (int, int))."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (ValueError, TypeError):
+        raise CursorError('Invalid cursor')
+    if not isinstance(key, list) or len(key) != len(types):
+        raise CursorError('Invalid cursor')
+    if not all(isinstance(v, t) and not isinstance(v, bool) for v, t in zip(key, types)):
+        raise CursorError('Invalid cursor')
+    return key
+
+def parse_limit(value, default, maximum):
+    if value in (None, ''):
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    return min(limit, maximum)
+
+def parse_fields(spec, allowed):
+    """Comma-separated projection, validated against `allowed` (also the default)."""
+    if not spec:
+        return list(allowed)
+    fields = [f.strip() for f in spec.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+    return list(dict.fromkeys(fields))
+
+def iter_pages(fetch_page, page_size):
+    """Yield rows from `fetch_page(after, limit) -> (rows, next_key)` until exhausted."""
+    after = None
+    while True:
+        rows, after = fetch_page(after, page_size)
+        yield from rows
+        if after is None:
+            return
+
+def ndjson(rows):
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+def csv_rows(rows, fields, chunk_bytes=64 * 1024):
+    """Header line, then rows as CSV, yielded in chunks of roughly `chunk_bytes`."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for row in rows:
+        writer.writerow([row[f] for f in fields])
+        if buffer.tell() >= chunk_bytes:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def next_link(url, args, cursor):
+    """Link header value for the next page of `url` with the current query args."""
+    query = [(k, v) for k, v in args.items(multi=True) if k != 'cursor'] + [('cursor', cursor)]
+    return f'<{url}?{urlencode(query)}>; rel="next"'
@@ -0,0 +1,121 @@
+"""Typology rule definitions.
+
+Each typology is a declarative rule, keyed by its code, in precedence order: when
+several rules fire, the first one names the case's typology. A rule has
+
+    description   text shown for the typology code
+    points        added to the risk score when the rule fires (the total is capped at 100)
+    window_days   optional lookback; `window` is the mask of transactions with
+                  (now - timestamp).days <= window_days
+    thresholds    named constants the other fields read
+    aggregates    named expressions local to the rule
+    counts        named counts of the transactions in the window matching a per-transaction
+                  mask (null for all of them); the feature store keeps these up to date as
+                  transactions are ingested, so scoring need not count them
+    when          conditions, all of which must hold, checked in order: list cheap ones first,
+                  evaluation stops at the first that fails
+    reason        reason line (a format string over the names above)
+    metric        evidence metric (format string)
+    evidence      expression for the evidence ids, or {"where": mask, "limit": n} for the
+                  ids of the first n transactions matching a mask
+    facts         names whose values are kept with the evidence when the rule fires; SAR
+                  narratives (narratives.py) state these figures and nothing else about the rule
+    suppresses    rules not evaluated once this one fires
+    fallback      the rule recorded when no other rule fires
+
+Expressions read the transaction columns (`ids`, `types`, `amounts`, `timestamps`, `ips`),
+the shared aggregates in scoring.AGGREGATES (`txn_count`, `total_in`, `is_deposit`,
+`last_dw_gap_minutes`, `history_days`, `linked_count`, ...),
+the rule's own thresholds and aggregates, and helpers (`count`, `total`, `first_sequence`, `len`,
+`abs`, `min`, `max`, `round`). They are limited to names, numbers, arithmetic, comparisons,
+boolean and bitwise operators, tuples, subscripts and those calls; format placeholders
+hold plain names. scoring.py checks every rule against that grammar, then compiles it once
+into a function.
+
+Extra or overriding rules load from the JSON file named by SIGNALSAR_RULES, an object of
+the same shape; a new code is appended after the built-in rules (before the fallback).
+"""
+
+RULES = {
+    'RAPID_MOVEMENT': {
+        'description': 'Rapid deposit-trade-withdrawal sequence',
+        'points': 35,
+        'aggregates': {'start': 'first_sequence(types, (DEPOSIT, TRADE, WITHDRAWAL))'},
+        'when': ['txn_count >= 3', 'start >= 0'],
+        'reason': 'Rapid deposit-trade-withdrawal sequence',
+        'metric': 'last deposit→withdrawal gap = {last_dw_gap_minutes:,.0f} min (baseline 2.1 hrs)',
+        'evidence': 'ids[start:start + 3]',
+    },
+    'LAYERING': {
+        'description': 'Minimal profit on high volume (layering)',
+        'points': 25,
+        'thresholds': {'min_volume': 50000, 'max_margin': 0.05},
+        'when': ['total_in > min_volume', 'abs(total_out - total_in) < total_in * max_margin'],
+        'reason': 'Minimal profit on high volume (layering)',
+        'metric': '${total_in:,.0f} in, ${total_out:,.0f} out (profit margin <5%)',
+        'evidence': {'where': 'is_deposit | is_withdrawal', 'limit': 5},
+    },
+    'MICRO_FRAGMENTATION': {
+        'description': 'Micro-transaction fragmentation (NEW)',
+        'points': 60,
+        'window_days': 3,
+        'thresholds': {'max_amount': 500, 'min_count': 20, 'min_share': 0.8},
+        'aggregates': {'small': 'amounts <= max_amount', 'micro': 'window & small',
+                       'micro_avg': 'total(amounts[micro]) / max(count(micro), 1)',
+                       # Everything before the window is the account's baseline
+                       'prior': '~window', 'prior_count': 'count(prior)',
+                       'prior_avg': 'total(amounts[prior]) / max(prior_count, 1)',
+                       'prior_days': 'max(history_days - window_days, 1)',
+                       'baseline_per_week': 'prior_count * 7 / prior_days'},
+        'counts': {'micro_count': 'small', 'window_count': None},
+        'when': ['txn_count >= min_count', 'micro_count >= min_count', 'micro_count >= min_share * window_count'],
+        'reason': 'Micro-transaction fragmentation: {micro_count} txns of ${max_amount} or less in {window_days} days',
+        'metric': '{micro_count} micro-txns <=${max_amount} in {window_days} days vs. {baseline_per_week:.1f}/week before',
+        'evidence': {'where': 'micro', 'limit': 5},
+        'facts': ['window_days', 'max_amount', 'micro_count', 'micro_avg', 'window_count',
+                  'prior_count', 'prior_avg', 'prior_days', 'baseline_per_week'],
+        # The burst is this rule's finding; scoring it again as a velocity spike double counts
+        'suppresses': ['VELOCITY_SPIKE'],
+    },
+    'VELOCITY_SPIKE': {
+        'description': 'Unusual transaction velocity',
+        'points': 30,
+        'window_days': 7,
+        'thresholds': {'max_count': 15},
+        'counts': {'recent_count': None},
+        'when': ['txn_count > max_count', 'recent_count > max_count'],
+        'reason': 'Velocity spike: {recent_count} txns in {window_days} days',
+        'metric': '{recent_count} txns in {window_days} days (baseline: 2/week)',
+        'evidence': {'where': 'window', 'limit': 5},
+    },
+    'NETWORK_LINK': {
+        'description': 'Network-based coordination',
+        'points': 20,
+        'thresholds': {'min_txns': 10, 'max_ips': 3, 'min_linked': 2},
+        'when': ['txn_count > min_txns', 'ip_count < max_ips or linked_count >= min_linked'],
+        'reason': 'Shared or concentrated IP/device use: {ip_count} IPs, {linked_count} linked accounts',
+        'metric': '{ip_count} unique IPs across {txn_count} txns, {linked_count} linked accounts',
+        'evidence': 'ips + ids[:1]',
+        'facts': ['ip_count', 'txn_count', 'linked_count', 'linked_accounts'],
+    },
+    'STRUCTURING': {
+        'description': 'Transaction structuring to evade reporting',
+        'points': 25,
+        'window_days': 30,
+        'thresholds': {'reporting_threshold': 10000, 'floor': 9000, 'min_count': 3},
+        'aggregates': {'band': 'is_deposit & (amounts >= floor) & (amounts < reporting_threshold)', 'near': 'window & band'},
+        'counts': {'near_count': 'band'},
+        'when': ['txn_count >= min_count', 'near_count >= min_count'],
+        'reason': 'Structured deposits: {near_count} just under ${reporting_threshold:,} in {window_days} days',
+        'metric': '{near_count} deposits of ${floor:,}-${reporting_threshold:,} in {window_days} days',
+        'evidence': {'where': 'near', 'limit': 5},
+    },
+    'UNKNOWN_PATTERN': {
+        'description': 'Unusual transaction pattern',
+        'points': 0,
+        'fallback': True,
+        'reason': 'Unusual transaction pattern detected by monitoring system',
+        'metric': 'Pattern flagged by automated monitoring',
+        'evidence': 'ids[:3]',
+    },
+}
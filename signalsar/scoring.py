@@ -0,0 +1,393 @@
+"""Columnar risk scoring engine.
+
+A customer's transactions are converted once into NumPy columns and every typology
+rule runs as array operations over them, so scoring cost no longer grows with
+repeated Python passes over dicts.
+
+Rules are declared in rules.py and compiled once, at import, into one function each.
+A compiled rule checks its conditions in order and computes each aggregate just before
+the first condition that reads it, so a rule that cannot fire stops before its
+expensive work. Aggregates shared between rules (totals, type masks, lookback windows)
+are computed once per evaluation. The engine times every rule and keeps running totals.
+
+Rule specs may come from a JSON file (SIGNALSAR_RULES), so their expressions are parsed
+and checked against a small grammar before anything is compiled: names, numbers,
+arithmetic, comparisons, boolean and bitwise operators, tuples, subscripts and calls of
+the helpers in RULE_CALLS. No attribute access, no other calls, no other builtins.
+"""
+
+import ast
+import json
+import keyword
+import os
+import re
+import threading
+import time
+import warnings
+from collections import namedtuple
+from datetime import datetime, timedelta
+from string import Formatter
+import numpy as np
+
+from metrics import collector
+from rules import RULES
+
+DEPOSIT, TRADE, WITHDRAWAL, OTHER = 0, 1, 2, 3
+TYPE_CODES = {'deposit': DEPOSIT, 'trade': TRADE, 'withdrawal': WITHDRAWAL}
+
+EPOCH = datetime(1970, 1, 1)
+ONE_US = timedelta(microseconds=1)
+
+def _timestamp_us(text):
+    ts = datetime.fromisoformat(text)
+    if ts.tzinfo is not None:
+        ts = ts.astimezone().replace(tzinfo=None)  # naive timestamps are local time
+    return (ts - EPOCH) // ONE_US
+
+def _parse_timestamps(timestamps):
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        try:
+            return np.array(timestamps, dtype='datetime64[us]').astype(np.int64)
+        except (ValueError, TypeError, Warning):
+            pass
+    # Slow path for formats numpy rejects (offsets, odd separators)
+    return np.array([_timestamp_us(ts) for ts in timestamps], dtype=np.int64)
+
+class TxnColumns:
+    __slots__ = ('ids', 'types', 'amounts', 'timestamps', 'ip_ids', 'ips')
+
+    def __init__(self, ids, types, amounts, timestamps, ip_ids, ips):
+        self.ids = ids                  # list of txn ids, for evidence
+        self.types = types              # int8 type codes
+        self.amounts = amounts          # int64 or float64
+        self.timestamps = timestamps    # int64 microseconds since epoch
+        self.ip_ids = ip_ids            # int32 index into ips, -1 when absent
+        self.ips = ips                  # distinct IPs in first-seen order
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_history(cls, txn_history):
+        type_code = TYPE_CODES.get
+        ip_index = {}
+        ip_id = lambda ip: ip_index.setdefault(ip, len(ip_index)) if ip else -1
+        amounts = [t['amount'] for t in txn_history]
+        return cls(
+            [t['id'] for t in txn_history],
+            np.fromiter((type_code(t['type'], OTHER) for t in txn_history), dtype=np.int8, count=len(txn_history)),
+            np.array(amounts) if amounts else np.zeros(0, dtype=np.int64),
+            _parse_timestamps([t['timestamp'] for t in txn_history]),
+            np.fromiter((ip_id(t.get('ip')) for t in txn_history), dtype=np.int32, count=len(txn_history)),
+            list(ip_index),
+        )
+
+    def slice(self, start, stop):
+        """Transactions start..stop as columns of their own (IPs renumbered)."""
+        ip_index = {}
+        ip_ids = [ip_index.setdefault(i, len(ip_index)) if i >= 0 else -1 for i in self.ip_ids[start:stop].tolist()]
+        return TxnColumns(self.ids[start:stop], self.types[start:stop], self.amounts[start:stop], self.timestamps[start:stop],
+                          np.array(ip_ids, dtype=np.int32), [self.ips[i] for i in ip_index])
+
+def first_sequence(types, pattern):
+    # Type codes are one byte each, so this is a substring search
+    return types.tobytes().find(bytes(pattern))
+
+def select(ids, mask, limit):
+    return [ids[i] for i in np.flatnonzero(mask)[:limit]]
+
+
+def deposit_withdrawal_gap(types, timestamps):
+    """Minutes from the last withdrawal back to the latest deposit before it, or None."""
+    withdrawals = np.flatnonzero(types == WITHDRAWAL)
+    if not len(withdrawals):
+        return None
+    deposits = np.flatnonzero(types[:withdrawals[-1]] == DEPOSIT)
+    if not len(deposits):
+        return None
+    return (timestamps[withdrawals[-1]] - timestamps[deposits[-1]]).item() / 60e6
+
+def count(mask):
+    return int(np.count_nonzero(mask))
+
+def total(values):
+    return values.sum().item()
+
+DAY_US = timedelta(days=1) // ONE_US
+INPUTS = ('ids', 'types', 'amounts', 'timestamps', 'ips', 'now')
+
+# Aggregates shared by all rules, as expressions over the inputs, in dependency order
+AGGREGATES = {
+    'txn_count': 'len(ids)',
+    'ip_count': 'len(ips)',
+    'is_deposit': 'types == DEPOSIT',
+    'is_withdrawal': 'types == WITHDRAWAL',
+    'type_totals': 'np.bincount(types, weights=amounts, minlength=OTHER + 1)',
+    'total_in': 'type_totals[DEPOSIT].item()',
+    'total_out': 'type_totals[WITHDRAWAL].item()',
+    'last_dw_gap_minutes': 'deposit_withdrawal_gap(types, timestamps)',
+    'history_days': '(now - timestamps.min().item()) / DAY_US if len(ids) else 0.0',
+    # Accounts sharing an IP or device (links.py); only known from stored features
+    'linked_count': '0',
+    'linked_accounts': '()',
+}
+
+_name = re.compile(r'(?<![.\w])[A-Za-z_]\w*')
+_namespace = {'np': np, 'DEPOSIT': DEPOSIT, 'TRADE': TRADE, 'WITHDRAWAL': WITHDRAWAL, 'OTHER': OTHER, 'DAY_US': DAY_US,
+              'count': count, 'total': total, 'first_sequence': first_sequence, 'select': select,
+              'deposit_withdrawal_gap': deposit_withdrawal_gap}
+_compute = {name: eval('lambda a: ' + _name.sub(lambda m: f"a['{m.group(0)}']" if m.group(0) in INPUTS or m.group(0) in AGGREGATES else m.group(0), expr),
+                       _namespace)
+            for name, expr in AGGREGATES.items()}
+
+# What a rule expression may contain (see check_expression)
+RULE_CALLS = frozenset({'count', 'total', 'first_sequence', 'select', 'deposit_withdrawal_gap', 'len', 'abs', 'min', 'max', 'round'})
+RULE_BUILTINS = {'len': len, 'abs': abs, 'min': min, 'max': max, 'round': round}
+RULE_NODES = (ast.Expression, ast.Name, ast.Load, ast.Constant, ast.Tuple, ast.List, ast.Subscript, ast.Slice,
+              ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.UAdd, ast.Invert,
+              ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.BitAnd, ast.BitOr, ast.BitXor,
+              ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Call)
+
+def check_expression(code, expr):
+    """Raise ValueError unless `expr` stays within the rule expression grammar."""
+    try:
+        tree = ast.parse(expr, mode='eval')
+    except SyntaxError as e:
+        raise ValueError(f'Rule {code}: invalid expression {expr!r}: {e.msg}')
+    for node in ast.walk(tree):
+        if not isinstance(node, RULE_NODES):
+            raise ValueError(f'Rule {code}: {type(node).__name__} not allowed in {expr!r}')
+        if isinstance(node, ast.Name) and node.id.startswith('_'):
+            raise ValueError(f'Rule {code}: name {node.id} not allowed in {expr!r}')
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float, bool, type(None))):
+            raise ValueError(f'Rule {code}: only numeric constants are allowed in {expr!r}')
+        if isinstance(node, ast.Call) and (not isinstance(node.func, ast.Name) or node.func.id not in RULE_CALLS or node.keywords):
+            raise ValueError(f'Rule {code}: only {", ".join(sorted(RULE_CALLS))} may be called in {expr!r}')
+    return expr
+
+def check_name(code, name):
+    if not name.isidentifier() or keyword.iskeyword(name) or name.startswith('_'):
+        raise ValueError(f'Rule {code}: invalid name {name!r}')
+    return name
+
+class RuleContext(dict):
+    """One evaluation's inputs by name. Shared aggregates are computed on first lookup and kept."""
+
+    def __init__(self, cols, now, features=None):
+        super().__init__(ids=cols.ids, types=cols.types, amounts=cols.amounts, timestamps=cols.timestamps, ips=cols.ips, now=now)
+        if features:
+            # Precomputed values (see features.py) stand in for shared aggregates and rule counts
+            self.update(features)
+        self.windows = {}
+
+    def __missing__(self, name):
+        value = self[name] = _compute[name](self)
+        return value
+
+    def window(self, days):
+        # (now - ts).days <= days, shared by rules with the same lookback
+        mask = self.windows.get(days)
+        if mask is None:
+            mask = self.windows[days] = self['timestamps'] > self['now'] - (days + 1) * DAY_US
+        return mask
+
+def _format(code, text):
+    """`text` as an f-string expression, plus the names its placeholders read. A placeholder
+    holds a plain name, optionally with a conversion and a format spec."""
+    names = set()
+    for _, field, spec, _ in Formatter().parse(text):
+        if field is not None:
+            names.add(check_name(code, field))
+        if spec and '{' in spec:
+            names |= _format(code, spec)[1]
+    return 'f' + repr(text), names
+
+class Rule:
+    def __init__(self, code, spec):
+        self.code = code
+        self.spec = spec
+        self.description = spec.get('description', code)
+        self.points = spec.get('points', 0)
+        self.fallback = spec.get('fallback', False)
+        self.suppresses = frozenset(spec.get('suppresses', ()))
+        self.window_days = spec.get('window_days')
+        self.constants = dict(spec.get('thresholds', {}))
+        if self.window_days is not None:
+            self.constants['window_days'] = self.window_days
+        self.aggregates = {check_name(code, name): check_expression(code, expr) for name, expr in spec.get('aggregates', {}).items()}
+        self.counts = {check_name(code, name): where and check_expression(code, where) for name, where in spec.get('counts', {}).items()}
+        for name in self.constants:
+            check_name(code, name)
+        names = [set(self.constants), set(self.aggregates), set(self.counts), set(AGGREGATES) | set(INPUTS)]
+        clash = set().union(*(a & b for i, a in enumerate(names) for b in names[i + 1:]))
+        if clash:
+            raise ValueError(f'Rule {code}: {", ".join(sorted(clash))} defined twice')
+        if self.counts and self.window_days is None:
+            raise ValueError(f'Rule {code}: counts need window_days')
+        self.namespace = dict(_namespace, **self.constants, __builtins__=RULE_BUILTINS)
+        # Per-transaction masks behind `counts`, also used by the feature store to count ingested transactions
+        self.count_masks = {}
+        for name, where in self.counts.items():
+            where = where or 'np.ones(len(ids), np.bool_)'
+            self.count_masks[name] = self._build(f'mask_{name}', (), where, _name.findall(where), windowed=False)
+        reason, reason_names = _format(code, spec['reason'])
+        metric, metric_names = _format(code, spec['metric'])
+        evidence = spec['evidence']
+        if isinstance(evidence, dict):
+            evidence = f'select(ids, {check_expression(code, evidence["where"])}, {int(evidence.get("limit", 5))})'
+        self.facts = [check_name(code, name) for name in spec.get('facts', ())]
+        facts = '{' + ', '.join(f'{name!r}: {name}' for name in self.facts) + '}'
+        conditions = [check_expression(code, condition) for condition in spec.get('when', ())]
+        self.evaluate = self._build('evaluate', conditions, f'{reason}, {metric}, {check_expression(code, evidence)}, {facts}',
+                                    reason_names | metric_names | set(_name.findall(evidence)) | set(self.facts))
+
+    def count_key(self, name):
+        return f'{self.code}.{name}'
+
+    def _build(self, function, conditions, result, result_names, windowed=True):
+        """Compile `function(context)`: check `conditions` in order, returning None at the first that
+        fails, then return `result`. Each name is assigned just before its first use."""
+        lines = [f'def {function}(a):']
+        bound = set()
+
+        def bind(names, chain=()):
+            for name in sorted(names):
+                if name in bound or name in self.namespace or keyword.iskeyword(name) or name in RULE_BUILTINS:
+                    continue
+                if name in chain:
+                    raise ValueError(f'Rule {self.code}: aggregate {name} refers to itself')
+                if name == 'window' and windowed and self.window_days is not None:
+                    lines.append(f'    window = a.window({int(self.window_days)})')
+                elif name in self.aggregates:
+                    bind(_name.findall(self.aggregates[name]), chain + (name,))
+                    lines.append(f'    {name} = {self.aggregates[name]}')
+                elif name in self.counts and windowed:
+                    # A stored feature when the context carries one, otherwise counted from the columns
+                    lines.append(f'    {name} = a.get({self.count_key(name)!r})')
+                    lines.append(f'    if {name} is None:')
+                    lines.append(f'        {name} = count(a.window({int(self.window_days)}) & mask_{name}(a))')
+                elif name in INPUTS or name in AGGREGATES:
+                    lines.append(f"    {name} = a['{name}']")
+                else:
+                    raise ValueError(f'Rule {self.code}: unknown name {name} in {function}')
+                bound.add(name)
+
+        for condition in conditions:
+            bind(_name.findall(condition))
+            lines.append(f'    if not ({condition}):')
+            lines.append('        return None')
+        bind(result_names)
+        lines.append(f'    return {result}')
+        exec(compile('\n'.join(lines), f'<rule {self.code}>', 'exec'), self.namespace)
+        return self.namespace[function]
+
+def _evidence(metric, evidence_ids, facts):
+    entry = {'metric': metric, 'evidence_ids': evidence_ids}
+    if facts:
+        entry['facts'] = facts
+    return entry
+
+RuleResult = namedtuple('RuleResult', 'score reasons evidence_map typology timings')
+
+class RuleEngine:
+    def __init__(self, rules=RULES):
+        self.rules = []
+        self.fallback = None
+        self._stats = {}
+        self._lock = threading.Lock()
+        for code, spec in rules.items():
+            self.register(code, spec)
+
+    def register(self, code, spec):
+        """Compile a rule; replaces a rule with the same code in place, or adds it last."""
+        rule = Rule(code, spec)
+        if rule.fallback:
+            self.fallback = rule
+        else:
+            codes = [r.code for r in self.rules]
+            if code in codes:
+                self.rules[codes.index(code)] = rule
+            else:
+                self.rules.append(rule)
+        with self._lock:
+            self._stats[code] = [0, 0, 0, 0]   # evaluated, fired, suppressed, total ns
+
+    @property
+    def typologies(self):
+        rules = self.rules + ([self.fallback] if self.fallback else [])
+        return {rule.code: rule.description for rule in rules}
+
+    def evaluate(self, cols, now=None, features=None):
+        context = RuleContext(cols, ((now or datetime.now()) - EPOCH) // ONE_US, features)
+        score = 0
+        reasons = []
+        evidence_map = {}
+        timings = {}
+        suppressed = set()
+        skipped = []
+        for rule in self.rules:
+            if rule.code in suppressed:
+                skipped.append(rule.code)
+                continue
+            started = time.perf_counter_ns()
+            hit = rule.evaluate(context)
+            timings[rule.code] = time.perf_counter_ns() - started
+            if hit is not None:
+                score += rule.points
+                reasons.append(hit[0])
+                evidence_map[rule.code] = _evidence(*hit[1:])
+                suppressed |= rule.suppresses
+        if not reasons and self.fallback:
+            reason, *evidence = self.fallback.evaluate(context)
+            score += self.fallback.points
+            reasons.append(reason)
+            evidence_map[self.fallback.code] = _evidence(*evidence)
+        with self._lock:
+            for code in skipped:
+                self._stats[code][2] += 1
+            for code, ns in timings.items():
+                stats = self._stats[code]
+                stats[0] += 1
+                stats[1] += code in evidence_map
+                stats[3] += ns
+        typology = next(iter(evidence_map), 'UNKNOWN_PATTERN')
+        return RuleResult(min(100, score), reasons, evidence_map, typology,
+                          {code: ns // 100 / 10 for code, ns in timings.items()})
+
+    def stats(self):
+        """Per rule since start: evaluations, times fired and suppressed, total and mean evaluation time."""
+        with self._lock:
+            return {code: {'evaluated': evaluated, 'fired': fired, 'suppressed': suppressed,
+                           'total_ms': round(ns / 1e6, 3), 'mean_us': round(ns / evaluated / 1000, 1) if evaluated else None}
+                    for code, (evaluated, fired, suppressed, ns) in self._stats.items()}
+
+def load_rules(engine, path):
+    with open(path) as f:
+        for code, spec in json.load(f).items():
+            engine.register(code, spec)
+
+rule_engine = RuleEngine()
+if os.environ.get('SIGNALSAR_RULES'):
+    load_rules(rule_engine, os.environ['SIGNALSAR_RULES'])
+TYPOLOGIES = rule_engine.typologies
+
+def _rule_counter(name, help, field, scale=1):
+    collector(name, help, 'counter', ('rule',))(
+        lambda: {(code,): round(stats[field] * scale, 6) for code, stats in rule_engine.stats().items()})
+
+_rule_counter('signalsar_rule_evaluations_total', 'Rule evaluations in this process', 'evaluated')
+_rule_counter('signalsar_rule_fired_total', 'Evaluations in which the rule fired', 'fired')
+_rule_counter('signalsar_rule_suppressed_total', 'Times the rule was skipped because a fired rule suppresses it', 'suppressed')
+_rule_counter('signalsar_rule_seconds_total', 'Time spent evaluating the rule', 'total_ms', 0.001)
+
+def score_columns(customer_id, cols, now=None):
+    return rule_engine.evaluate(cols, now)[:4]
+
+def score_transactions(customer_id, txn_history, now=None, features=None):
+    """Full RuleResult, including per-rule evaluation times in microseconds. `features` are the
+    customer's stored aggregates (features.load_features), read instead of scanning the history."""
+    return rule_engine.evaluate(TxnColumns.from_history(txn_history), now, features)
+
+def calculate_risk_score(customer_id, txn_history):
+    return score_transactions(customer_id, txn_history)[:4]
@@ -0,0 +1,21 @@
+// Change feed for the SignalSAR pages
+
+const FEED_POLL_MS = 15000;   // app.FEED_RETRY_AFTER
+let feed = null;
+
+// Open the change feed with `params`, replacing the page's previous feed. `handlers` maps event
+// names to functions of the parsed event data; `reload` re-reads the page state on `reset`.
+function watchChanges(params, handlers, reload) {
+    if (feed) feed.close();
+    const source = feed = new EventSource(`${window.location.origin}/api/changes?${new URLSearchParams(params)}`);
+    for (const [name, handle] of Object.entries(handlers)) {
+        source.addEventListener(name, event => handle(JSON.parse(event.data)));
+    }
+    source.addEventListener('reset', () => reload());
+    // A server at its stream limit answers 503 and the browser gives up on the feed:
+    // re-read the page state on an interval instead, retrying the feed each time
+    source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED && source === feed) setTimeout(() => reload(), FEED_POLL_MS);
+    };
+    return source;
+}
@@ -0,0 +1,77 @@
+"""SAR submission: governance gate, payload and checksum.
+
+The gate reads the flags each case view maintains (typology confirmed, evidence linked,
+evidence non-empty, disposition count), so checking a case is one indexed read with no
+reason_evidence or feedback queries. The checksum is still the sha256 of
+json.dumps(payload, sort_keys=True), but that text is never built: its pieces are hashed
+in order, and for blob-backed cases the large pieces are the sorted blob texts as stored
+(blobs.canonical_enriched), so nothing is parsed. The stored payload references the
+case's blobs and is spliced around the same small head.
+
+app.py writes submissions (one or many) in a single unit of work.
+"""
+
+import hashlib
+import json
+import uuid
+from blobs import canonical_enriched, submission_enriched
+from case_views import case_view_version
+from scoring import TYPOLOGIES
+
+SUBMIT_BATCH_MAX = 500
+
+CASE_QUERY = '''SELECT c.id, c.alert_id, c.typology, c.sar_draft, c.compliance_score, c.enriched_ref, c.enriched_data,
+                       c.risk_analysis, v.typology_confirmed, v.evidence_linked, v.evidence_valid, v.disposition_count
+                FROM cases c JOIN case_views v ON v.case_id = c.id WHERE c.id IN (SELECT value FROM json_each(?))'''
+
+def load_cases(conn, case_ids):
+    """{case id: row with the gate flags} for the cases that exist, building missing views."""
+    rows = {row['id']: row for row in conn.execute(CASE_QUERY, (json.dumps(case_ids),))}
+    missing = [case_id for case_id in case_ids if case_id not in rows and case_view_version(conn, case_id)]
+    if missing:
+        rows.update({row['id']: row for row in conn.execute(CASE_QUERY, (json.dumps(missing),))})
+    return rows
+
+def gate_error(case):
+    """The first governance gate the case fails, or None."""
+    if not case['typology_confirmed']:
+        return 'Typology must be confirmed before submission'
+    if not case['evidence_linked']:
+        return 'At least one explainability reason with evidence must be attached'
+    if not case['evidence_valid']:
+        return 'At least one reason must have non-empty evidence_ids'
+    if not case['disposition_count']:
+        return 'Analyst disposition must be recorded before submission'
+    typology = case['typology']
+    if typology not in case['sar_draft'] and TYPOLOGIES.get(typology, '') not in case['sar_draft']:
+        return f'SAR narrative must include typology code ({typology}) or description'
+    return None
+
+def _split(payload, sort_keys=False):
+    """JSON text of `payload` before and after its enriched_data value."""
+    head, _, tail = json.dumps(dict(payload, enriched_data=None), sort_keys=sort_keys).partition('"enriched_data": null')
+    return head + '"enriched_data": ', tail
+
+def prepare_submission(conn, case, analyst):
+    """Submission id, checksum and stored payload text for a case that passed the gate."""
+    submission_id = f'SAR-{uuid.uuid4().hex[:8].upper()}'
+    payload = {
+        'submission_id': submission_id,
+        'case_id': case['id'],
+        'typology': case['typology'],
+        'sar_narrative': case['sar_draft'],
+        'enriched_data': None,
+        'compliance_score': case['compliance_score'],
+        'analyst': analyst
+    }
+    head, tail = _split(payload, sort_keys=True)
+    digest = hashlib.sha256(head.encode())
+    for piece in canonical_enriched(conn, case):
+        digest.update(piece.encode())
+    digest.update(tail.encode())
+
+    # The checksum covers the full payload; the stored copy references the case's blobs (blobs.expand_enriched restores it)
+    head, tail = _split(payload)
+    enriched = case['enriched_data'] if case['enriched_ref'] is None else json.dumps(submission_enriched(case))
+    return {'case_id': case['id'], 'alert_id': case['alert_id'], 'submission_id': submission_id,
+            'checksum': digest.hexdigest(), 'sar_payload': head + enriched + tail}
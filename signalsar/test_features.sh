@@ -13,8 +13,8 @@ echo "   ✓ Loaded $ALERT_COUNT alerts"
 echo ""
 
 echo "2️⃣ Testing Investigation Flow..."
-INVESTIGATE=$(curl -s -X POST "$API_BASE/alerts/2/investigate")
-CASE_ID=$(echo $INVESTIGATE | python3 -c "import sys, json; print(json.load(sys.stdin)['case_id'])")
+INVESTIGATE=$(curl -s -X POST "$API_BASE/alerts/2/investigate?wait=30")
+CASE_ID=$(echo $INVESTIGATE | python3 -c "import sys, json; print(json.load(sys.stdin)['result']['case_id'])")
 echo "   ✓ Created case #$CASE_ID for NEW TYPOLOGY alert"
 echo ""
 
@@ -1,9 +1,19 @@
 #!/usr/bin/env python3
 """Test script to verify regulator-hardening fixes"""
 
+import hashlib
+import os
+import shutil
 import sqlite3
 import json
+import tempfile
+from datetime import datetime, timezone
+from db import DB_PATH, get_db
+from init_db import init_db
+import app as signalsar
 from app import TYPOLOGIES, calculate_risk_score, get_mock_txn_history
+from blobs import expand_enriched
+from submissions import load_cases, prepare_submission
 
 print("=" * 60)
 print("REGULATOR-HARDENING PATCH VERIFICATION")
@@ -34,7 +44,7 @@ else:
 
 # Test 3: Database foreign keys
 print("\n3. Testing database foreign keys...")
-conn = sqlite3.connect('signalsar.db')
+conn = sqlite3.connect(DB_PATH)
 c = conn.cursor()
 c.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='cases'")
 cases_schema = c.fetchone()[0]
@@ -86,6 +96,38 @@ else:
 
 conn.close()
 
+# Test 7: Offset-aware timestamps
+print("\n7. Testing offset-aware timestamps...")
+from scoring import _parse_timestamps
+offset = _parse_timestamps(['2026-10-10T10:00:00Z', '2026-10-10T12:00:00+02:00'])
+naive = _parse_timestamps([datetime(2026, 10, 10, 10, tzinfo=timezone.utc).astimezone().replace(tzinfo=None).isoformat()])
+if offset[0] == offset[1] == naive[0]:
+    print("   ✓ PASS: Offsets normalize to the same naive local time")
+else:
+    print(f"   ✗ FAIL: Timestamps differ: {offset.tolist()} vs {naive.tolist()}")
+
+# Test 8: Submission checksum round trip
+print("\n8. Testing submission checksum round trip...")
+# The checksum is hashed from pieces; it must equal the hash of the stored payload, expanded
+workdir = tempfile.mkdtemp()
+signalsar.app.config['DATABASE'] = os.path.join(workdir, 'signalsar.db')
+init_db(signalsar.app.config['DATABASE'])
+with signalsar.app.app_context():
+    db = get_db()
+    drafted = signalsar.investigate_batch(limit=1, parallel=False)
+    case_id = drafted['results'][0]['case_id']
+    submission = prepare_submission(db, load_cases(db, [case_id])[case_id], 'analyst@signalsar.com')
+    signalsar.commit_unit(lambda conn, uow: signalsar.record_submissions(conn, uow, [submission], 'analyst@signalsar.com'))
+    stored = db.execute('SELECT sar_payload, checksum FROM submissions WHERE submission_id = ?', (submission['submission_id'],)).fetchone()
+    payload = json.loads(stored[0])
+    payload['enriched_data'] = expand_enriched(db, payload['enriched_data'])
+    expected = hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+shutil.rmtree(workdir)
+if stored[1] == expected:
+    print("   ✓ PASS: Checksum matches sha256(json.dumps(payload, sort_keys=True))")
+else:
+    print(f"   ✗ FAIL: Checksum {stored[1]} != {expected}")
+
 print("\n" + "=" * 60)
 print("VERIFICATION COMPLETE")
 print("=" * 60)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Verify every route query uses an index on a large seeded database.
+
+Seeds a throwaway database (SIGNALSAR_PLAN_ROWS rows per large table, default 1M),
+drives each API route through the Flask test client while tracing the SQL it runs,
+then checks EXPLAIN QUERY PLAN for every traced statement: no full table scans and
+no temp B-tree sorts.
+"""
+
+import os
+import sys
+import random
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+
+ROWS = int(os.environ.get('SIGNALSAR_PLAN_ROWS', 1_000_000))
+
+def seed(path, rows):
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    now = datetime.now()
+    alert_types = ['Rapid Movement', 'Structuring', 'Network Link', 'Velocity Spike', 'Unusual Pattern', 'NEW TYPOLOGY']
+    statuses = ['open', 'investigating', 'intervened', 'closed']
+    ts = lambda i: (now - timedelta(seconds=i)).isoformat()
+    small = max(rows // 10, 1)
+
+    c.executemany('INSERT INTO alerts (customer_id, alert_type, risk_score, status, created_at, assigned_to) VALUES (?, ?, ?, ?, ?, ?)',
+                  ((f'CUST-{i % 50000}', alert_types[i % 6], random.randint(1, 100), statuses[i % 4], ts(i), None) for i in range(rows)))
+    c.executemany('INSERT INTO cases (alert_id, enriched_data, risk_analysis, sar_draft, compliance_score, status, typology, typology_confirmed, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                  ((i % rows + 1, '{}', '{}', '', 100, 'draft', 'UNKNOWN_PATTERN', 0, ts(i), ts(i)) for i in range(small)))
+    c.executemany('INSERT INTO audit_log (case_id, analyst, action, details, before_value, after_value, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                  ((i % small + 1, 'seed@signalsar.com', 'case_created', '{}', None, None, ts(i)) for i in range(rows)))
+    c.executemany('INSERT INTO reason_evidence (case_id, reason_code, metric, evidence_ids, created_at) VALUES (?, ?, ?, ?, ?)',
+                  ((i % small + 1, 'UNKNOWN_PATTERN', 'seed', '["TXN-1"]', ts(i)) for i in range(small)))
+    c.executemany('INSERT INTO interventions (case_id, alert_id, action, reason, rationale, analyst, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                  ((i % small + 1, i % rows + 1, 'hold_withdrawal', 'seed', 'seed', 'seed@signalsar.com', ts(i)) for i in range(small)))
+    c.executemany('INSERT INTO analyst_feedback (case_id, alert_id, analyst, label, rationale, rationale_detail, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                  ((i % small + 1, i % rows + 1, 'seed@signalsar.com', random.choice(['true_positive', 'false_positive']), 'seed', '', ts(i)) for i in range(small)))
+    conn.commit()
+    c.execute('ANALYZE')
+    conn.close()
+
+def plan_problems(conn, sql):
+    problems = []
+    for row in conn.execute('EXPLAIN QUERY PLAN ' + sql):
+        detail = row[3]
+        # sqlite_sequence holds one row per AUTOINCREMENT table and cannot be indexed
+        if detail.startswith('SCAN') and 'USING' not in detail and 'VIRTUAL TABLE' not in detail and 'CONSTANT ROW' not in detail \
+                and detail != 'SCAN sqlite_sequence':
+            problems.append(detail)
+        if 'USE TEMP B-TREE' in detail:
+            problems.append(detail)
+    return problems
+
+def main():
+    db_path = os.path.join(tempfile.mkdtemp(), 'signalsar.db')
+    os.environ['SIGNALSAR_DB'] = db_path
+    import db
+    from init_db import init_db
+
+    print("=" * 60)
+    print(f"QUERY PLAN VERIFICATION ({ROWS:,} rows)")
+    print("=" * 60)
+
+    init_db(db_path)
+    print("\nSeeding database...")
+    seed(db_path, ROWS)
+
+    traced = []
+    # Pooled request connections and the job workers' own connections both come from here
+    _open_connection = db.open_connection
+    def _traced_connection(path):
+        conn = _open_connection(path)
+        conn.set_trace_callback(traced.append)
+        return conn
+    db.open_connection = _traced_connection
+
+    from app import app
+    from pagination import encode_cursor
+    client = app.test_client()
+
+    print("\nDriving routes...")
+    alert_id = client.post('/api/alerts', json={'customer_id': 'CUST-4455', 'alert_type': 'NEW TYPOLOGY', 'risk_score': 89}).get_json()['id']
+    job = client.post(f'/api/alerts/{alert_id}/investigate?wait=30').get_json()
+    case_id = job['result']['case_id']
+    requests = [
+        ('GET', '/api/alerts?status=open', None),
+        ('GET', '/api/alerts?status=open&alert_type=Structuring&limit=50&cursor=' + encode_cursor(50, 1000), None),
+        ('GET', '/api/alerts?status=open&format=ndjson&limit=10&fields=id,risk_score', None),
+        ('GET', f'/api/alerts/{alert_id}/case', None),
+        ('GET', f'/api/jobs/{job["job_id"]}', None),
+        ('POST', f'/api/jobs/{job["job_id"]}/retry', {}),
+        ('GET', f'/api/cases/{case_id}', None),
+        ('GET', f'/api/cases/{case_id}/transactions?limit=20&cursor=' + encode_cursor(10), None),
+        ('GET', f'/api/cases/{case_id}/transactions?type=deposit&min_amount=100&since=2020-01-01&evidence_only=1', None),
+        ('POST', f'/api/cases/{case_id}/typology', {'typology': 'MICRO_FRAGMENTATION'}),
+        ('POST', f'/api/cases/{case_id}/intervene', {'action': 'hold_withdrawal', 'rationale': 'plan check'}),
+        ('POST', f'/api/cases/{case_id}/feedback', {'label': 'true_positive', 'rationale': 'plan check'}),
+        ('PUT', f'/api/cases/{case_id}/sar', {'sar_draft': 'MICRO_FRAGMENTATION plan check'}),
+        ('POST', f'/api/cases/{case_id}/submit', {}),
+        ('POST', '/api/cases/submit:batch', {'case_ids': [case_id, case_id + 1]}),
+        ('POST', '/api/alerts/investigate:batch', {'alert_ids': [1, 2, 3], 'parallel': False}),
+        ('GET', '/api/changes?after=0&topics=case,alert&case_id=1', None),
+        ('GET', '/api/audit', None),
+        ('GET', f'/api/audit?case_id={case_id}&limit=5', None),
+        ('GET', '/api/audit?action=case_created&since=2000-01-01&until=2100-01-01&cursor='
+                + encode_cursor(datetime.now().isoformat(), ROWS // 2), None),
+        ('GET', '/api/audit?order=asc&cursor=' + encode_cursor(datetime.now().isoformat(), ROWS // 2), None),
+        ('GET', '/api/audit/export?format=csv&analyst=seed@signalsar.com', None),
+    ]
+    for method, url, body in requests:
+        response = client.open(url, method=method, json=body)
+        print(f"   {method:4} {url} -> {response.status_code}")
+
+    statements = sorted({s.strip() for s in traced if s.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'INSERT OR'))})
+
+    print(f"\nChecking {len(statements)} distinct statements...")
+    conn = sqlite3.connect(db_path)
+    failures = 0
+    for sql in statements:
+        problems = plan_problems(conn, sql)
+        if problems:
+            failures += 1
+            print(f"   ✗ FAIL: {' '.join(sql.split())[:110]}")
+            for p in problems:
+                print(f"       {p}")
+        else:
+            print(f"   ✓ PASS: {' '.join(sql.split())[:110]}")
+    conn.close()
+
+    print("\n" + "=" * 60)
+    print("VERIFICATION COMPLETE" if not failures else f"{failures} STATEMENT(S) WITHOUT INDEX USE")
+    print("=" * 60)
+    return failures
+
+if __name__ == '__main__':
+    sys.exit(1 if main() else 0)
@@ -0,0 +1,133 @@
+"""Adaptive threshold learning from analyst feedback.
+
+Each alert type keeps a ring buffer of its last WINDOW feedback labels in
+`threshold_state`. A new feedback row appends one label and re-derives that type's
+adjustment in O(1); a background reconciler periodically rebuilds every buffer from
+`analyst_feedback`. Reads go through an in-process cache invalidated on write. Every
+move of an adjustment also records a 'threshold' change, which app.py listens for so the
+caches of other server processes drop the stale value.
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from changefeed import record_change
+
+WINDOW = 10         # labels considered per alert type
+MIN_LABELS = 3      # labels required before the threshold moves
+RECONCILE_INTERVAL = float(os.environ.get('SIGNALSAR_THRESHOLD_RECONCILE_SECONDS', 300))
+
+logger = logging.getLogger(__name__)
+
+LABEL_CODES = {'false_positive': 'F', 'true_positive': 'T'}
+
+THRESHOLD_STATE_SCHEMA = '''CREATE TABLE IF NOT EXISTS threshold_state (
+    alert_type TEXT PRIMARY KEY,
+    recent_labels TEXT NOT NULL DEFAULT '',
+    updated_at TEXT
+)'''
+
+def compute_adjustment(labels):
+    fp_count = labels.count('F')
+    tp_count = labels.count('T')
+
+    # Adjust threshold: more FPs = increase threshold (reduce alerts), more TPs = decrease threshold (catch more)
+    adjustment = 0
+    if fp_count > tp_count * 2:
+        adjustment = 5  # Increase threshold
+    elif tp_count > fp_count * 2:
+        adjustment = -5  # Decrease threshold
+    return adjustment
+
+def _store(conn, alert_type, labels):
+    now = datetime.now().isoformat()
+    conn.execute('''INSERT INTO threshold_state (alert_type, recent_labels, updated_at) VALUES (?, ?, ?)
+                    ON CONFLICT(alert_type) DO UPDATE SET recent_labels = excluded.recent_labels, updated_at = excluded.updated_at''',
+                 (alert_type, labels, now))
+    if len(labels) >= MIN_LABELS:
+        conn.execute('''INSERT INTO adaptive_thresholds (alert_type, threshold_adjustment, updated_at) VALUES (?, ?, ?)
+                        ON CONFLICT(alert_type) DO UPDATE SET threshold_adjustment = excluded.threshold_adjustment, updated_at = excluded.updated_at''',
+                     (alert_type, compute_adjustment(labels), now))
+
+def record_label(conn, alert_type, label):
+    """Fold one new feedback label into its alert type. Call inside the transaction that inserted the feedback row."""
+    row = conn.execute('SELECT recent_labels FROM threshold_state WHERE alert_type = ?', (alert_type,)).fetchone()
+    previous = row[0] if row else ''
+    labels = (previous + LABEL_CODES.get(label, 'O'))[-WINDOW:]
+    _store(conn, alert_type, labels)
+    adjustment = compute_adjustment(labels) if len(labels) >= MIN_LABELS else None
+    if adjustment is not None and (len(previous) < MIN_LABELS or adjustment != compute_adjustment(previous)):
+        record_change(conn, 'threshold', {'alert_type': alert_type, 'adjustment': adjustment})
+
+def reconcile(conn):
+    """Rebuild every ring buffer from analyst_feedback (full recompute)."""
+    previous = dict(conn.execute('SELECT alert_type, threshold_adjustment FROM adaptive_thresholds').fetchall())
+    alert_types = [row[0] for row in conn.execute('SELECT DISTINCT alert_type FROM alerts')]
+    for alert_type in alert_types:
+        # CROSS JOIN pins the newest-first feedback scan as the outer loop so LIMIT stops early instead of sorting
+        feedback = conn.execute('''
+            SELECT af.label
+            FROM analyst_feedback af
+            CROSS JOIN alerts a ON af.alert_id = a.id
+            WHERE a.alert_type = ?
+            ORDER BY af.created_at DESC
+            LIMIT ?
+        ''', (alert_type, WINDOW)).fetchall()
+        if feedback:
+            labels = ''.join(LABEL_CODES.get(f[0], 'O') for f in reversed(feedback))
+            _store(conn, alert_type, labels)
+            if len(labels) >= MIN_LABELS and compute_adjustment(labels) != previous.get(alert_type):
+                record_change(conn, 'threshold', {'alert_type': alert_type, 'adjustment': compute_adjustment(labels)})
+    conn.commit()
+    threshold_cache.invalidate()
+
+class ThresholdCache:
+    def __init__(self):
+        self._values = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, conn, alert_type):
+        value = self._values.get(alert_type)
+        if value is None:
+            generation = self._generation
+            row = conn.execute('SELECT threshold_adjustment FROM adaptive_thresholds WHERE alert_type = ?', (alert_type,)).fetchone()
+            value = row[0] if row else 0
+            with self._lock:
+                # Skip the fill if a write invalidated while we were reading
+                if generation == self._generation:
+                    self._values[alert_type] = value
+        return value
+
+    def invalidate(self, alert_type=None):
+        with self._lock:
+            self._generation += 1
+            if alert_type is None:
+                self._values.clear()
+            else:
+                self._values.pop(alert_type, None)
+
+threshold_cache = ThresholdCache()
+
+_reconciler = None
+
+def start_reconciler(connection_factory, interval=RECONCILE_INTERVAL):
+    """Run reconcile() every `interval` seconds on a daemon thread. `connection_factory()` yields a connection."""
+    global _reconciler
+    if interval <= 0 or (_reconciler is not None and _reconciler.is_alive()):
+        return _reconciler
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                with connection_factory() as conn:
+                    reconcile(conn)
+            except Exception:
+                logger.exception('Threshold reconcile failed')
+
+    _reconciler = threading.Thread(target=run, name='threshold-reconciler', daemon=True)
+    _reconciler.start()
+    return _reconciler
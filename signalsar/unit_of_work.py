@@ -0,0 +1,176 @@
+"""Atomic write path for case mutations.
+
+A route stages its domain writes and audit entries on a UnitOfWork and they commit in
+one transaction, so a case change and its audit row can never diverge. The unit takes
+the write lock up front (BEGIN IMMEDIATE) and allocates audit ids under it: a staged
+audit row is complete before it is inserted (the case view embeds it), and all of a
+unit's audit rows go out in a single executemany at commit, together with their change
+feed entries.
+
+With SIGNALSAR_GROUP_COMMIT=1, units passed to GroupCommitter.run() are executed by one
+committer thread that packs every unit arriving within a short window into a single
+transaction (one SAVEPOINT per unit, so a failing unit only rolls back itself) and
+flushes all their audit rows together.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from datetime import datetime
+from changefeed import INSERT_CHANGE
+
+GROUP_COMMIT = os.environ.get('SIGNALSAR_GROUP_COMMIT', '0') == '1'
+GROUP_COMMIT_WINDOW = float(os.environ.get('SIGNALSAR_GROUP_COMMIT_WINDOW_MS', 2)) / 1000
+GROUP_COMMIT_MAX = int(os.environ.get('SIGNALSAR_GROUP_COMMIT_MAX', 64))
+GROUP_COMMIT_TIMEOUT = 30
+
+INSERT_AUDIT = '''INSERT INTO audit_log (id, case_id, analyst, action, details, before_value, after_value, timestamp)
+                  VALUES (?, ?, ?, ?, ?, ?, ?, ?)'''
+
+def _next_audit_id(conn):
+    # AUTOINCREMENT never reuses ids, so start past both the sequence and the current max
+    seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'audit_log'").fetchone()
+    top = conn.execute('SELECT MAX(id) FROM audit_log').fetchone()[0]
+    return max(seq[0] if seq else 0, top or 0) + 1
+
+class UnitOfWork:
+    def __init__(self, conn):
+        self.conn = conn
+        self._audits = []
+        self._next_id = None
+
+    def begin(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+
+    def audit(self, case_id, analyst, action, details, before_value=None, after_value=None, timestamp=None):
+        """Stage an audit row; returns it as stored, id included."""
+        if self._next_id is None:
+            self._next_id = _next_audit_id(self.conn)
+        row = {'id': self._next_id, 'case_id': case_id, 'analyst': analyst, 'action': action, 'details': json.dumps(details),
+               'before_value': before_value, 'after_value': after_value, 'timestamp': timestamp or datetime.now().isoformat()}
+        self._next_id += 1
+        self._audits.append(row)
+        return row
+
+    def mark(self):
+        return len(self._audits), self._next_id
+
+    def reset(self, mark):
+        """Drop audit rows staged after `mark` (their ids are handed out again)."""
+        del self._audits[mark[0]:]
+        self._next_id = mark[1]
+
+    def flush(self):
+        if self._audits:
+            self.conn.executemany(INSERT_AUDIT, [tuple(row.values()) for row in self._audits])
+            self.conn.executemany(INSERT_CHANGE, [('audit', None, row['case_id'], json.dumps(row), row['timestamp']) for row in self._audits])
+            self._audits = []
+
+    def commit(self):
+        self.flush()
+        self.conn.commit()
+
+    def rollback(self):
+        self._audits = []
+        self._next_id = None
+        self.conn.rollback()
+
+    def __enter__(self):
+        self.begin()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+class GroupCommitter:
+    """Runs `work(conn, uow)` callables from many threads, committing them in groups."""
+
+    def __init__(self, connect, window=GROUP_COMMIT_WINDOW, max_units=GROUP_COMMIT_MAX):
+        # The committer keeps its own connection: borrowing from the request pool could
+        # deadlock with the very requests waiting on it
+        self.connect = connect
+        self.window = window
+        self.max_units = max_units
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def run(self, work, timeout=GROUP_COMMIT_TIMEOUT):
+        """Block until the group containing `work` commits; return its result or raise its error."""
+        future = Future()
+        self._ensure_started()
+        self._queue.put((work, future))
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            # A unit still queued is dropped; one already in a group commits with it, so wait for that
+            if future.cancel():
+                raise
+            return future.result()
+
+    @property
+    def pending(self):
+        """Units queued for the next group."""
+        return self._queue.qsize()
+
+    def _ensure_started(self):
+        # Started on first use so forked workers each get their own thread
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._loop, name='group-commit', daemon=True)
+                    self._thread.start()
+
+    def _loop(self):
+        conn = self.connect()
+        while True:
+            group = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(group) < self.max_units:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    group.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._commit(conn, group)
+
+    def _commit(self, conn, group):
+        group = [(work, future) for work, future in group if future.set_running_or_notify_cancel()]
+        if not group:
+            return
+        outcomes = []
+        uow = UnitOfWork(conn)
+        try:
+            uow.begin()
+            for work, future in group:
+                mark = uow.mark()
+                conn.execute('SAVEPOINT unit')
+                try:
+                    outcomes.append((future, work(conn, uow), None))
+                    conn.execute('RELEASE unit')
+                except Exception as e:
+                    conn.execute('ROLLBACK TO unit')
+                    conn.execute('RELEASE unit')
+                    uow.reset(mark)
+                    outcomes.append((future, None, e))
+            uow.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                uow.rollback()
+            for _, future in group:
+                future.set_exception(e)
+            return
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""Standalone investigation workers sharing the web server's job queue.
+
+    python worker.py --processes 4 --threads 4
+
+Run the web server with SIGNALSAR_JOB_WORKERS=0 to leave all jobs to these workers, or
+alongside its own pool to add capacity. Each process claims jobs independently.
+"""
+
+import argparse
+import multiprocessing
+import os
+import time
+
+def run(threads):
+    from app import app, job_pool
+    job_pool.threads = threads
+    job_pool.start()
+    print(f'Worker {os.getpid()}: {threads} threads on {app.config["DATABASE"]}')
+    while job_pool.running:
+        time.sleep(1)
+
+def main():
+    parser = argparse.ArgumentParser(description='Run SignalSAR investigation job workers')
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('SIGNALSAR_JOB_WORKERS', 4)) or 4)
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        run(args.threads)
+        return
+    processes = [multiprocessing.Process(target=run, args=(args.threads,)) for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,13 @@
+"""WSGI entry point for production serving.
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+The gunicorn config initializes the database once in the master before any worker is
+forked. Each worker imports this module after the fork and starts its own background
+threads: the change feed tailer (which keeps its threshold cache in step with the other
+workers), the threshold reconciler and, unless SIGNALSAR_JOB_WORKERS=0, job workers.
+"""
+
+from app import app as application, start_background
+
+start_background()